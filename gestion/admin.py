@@ -1,11 +1,16 @@
 # CODE v2.0 pour gestion/admin.py
 
 from django.contrib import admin
-from .models import Ville, Station, Velo, Location, Utilisateur, TicketSupport
+from .models import Ville, Station, Velo, Location, Utilisateur, TicketSupport, DisponibiliteStation, \
+    EtatSimulation, FluxHoraireStation, TrajetJournalier
 
 admin.site.register(Ville)
 admin.site.register(Station)
 admin.site.register(Velo)
 admin.site.register(Location)
 admin.site.register(Utilisateur)
-admin.site.register(TicketSupport)
\ No newline at end of file
+admin.site.register(TicketSupport)
+admin.site.register(DisponibiliteStation)
+admin.site.register(EtatSimulation)
+admin.site.register(FluxHoraireStation)
+admin.site.register(TrajetJournalier)
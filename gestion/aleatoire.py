@@ -0,0 +1,78 @@
+# CODE pour gestion/aleatoire.py
+#
+# Générateurs aléatoires des commandes de simulation. Chaque commande reçoit une graine (--seed,
+# tirée au hasard et affichée si absente) ; chaque tirage passe par un générateur dérivé de cette
+# graine, d'un numéro de flux (quelle partie de la simulation) et de clés (vélo, bloc...) par
+# numpy.random.SeedSequence. Les générateurs sont indépendants les uns des autres : l'ordre dans
+# lequel les vélos sont simulés, ou leur répartition entre workers, ne change aucun tirage, et
+# deux exécutions avec la même graine et la même fin de période (--fin) produisent exactement les
+# mêmes données.
+#
+# La météo simulée (gestion/weather_service.py) ne dépend que de la ville et du jour : elle est
+# reproductible sans graine.
+
+import argparse
+from datetime import datetime
+
+import numpy as np
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+# Un flux par usage, pour qu'un même vélo ne réutilise pas les mêmes tirages d'une commande à l'autre.
+# Les numéros sont figés : les changer changerait les résultats de toutes les graines.
+FLUX_HISTORIQUE = 1
+FLUX_TELEMETRIE = 2
+FLUX_UTILISATEURS = 3
+FLUX_FLOTTE = 4
+
+
+def nouvelle_graine():
+    """Graine tirée au hasard quand l'utilisateur n'en fournit pas ; affichée pour pouvoir rejouer le run."""
+    return np.random.SeedSequence().entropy
+
+
+def _graine_valide(valeur):
+    # SeedSequence refuse les entiers négatifs : l'erreur est signalée avant tout travail.
+    try:
+        seed = int(valeur)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"entier attendu, pas {valeur!r}")
+    if seed < 0:
+        raise argparse.ArgumentTypeError(f"entier positif ou nul attendu, pas {seed}")
+    return seed
+
+
+def ajouter_option_graine(parser):
+    parser.add_argument('--seed', type=_graine_valide, default=None,
+                        help="Graine de la simulation : même graine, mêmes données, quel que soit le nombre de workers.")
+
+
+def graine(options):
+    if options.get('seed') is None:
+        return nouvelle_graine()
+    # Option passée directement à call_command(seed=...) : elle n'est pas passée par l'analyseur.
+    try:
+        return _graine_valide(options['seed'])
+    except argparse.ArgumentTypeError as erreur:
+        raise CommandError(f"--seed invalide : {erreur}.")
+
+
+def ajouter_option_fin(parser):
+    parser.add_argument('--fin', metavar='AAAA-MM-JJ[THH:MM]',
+                        help="Fin de la période simulée (défaut : maintenant) ; à fixer avec --seed pour rejouer un run.")
+
+
+def fin_periode(options, defaut=None):
+    """--fin, sinon defaut (fin du scénario), sinon maintenant."""
+    if not options.get('fin'):
+        return defaut or timezone.now()
+    try:
+        fin = datetime.fromisoformat(options['fin'])
+    except ValueError:
+        raise CommandError(f"--fin invalide : {options['fin']}.")
+    return timezone.make_aware(fin) if timezone.is_naive(fin) else fin
+
+
+def generateur(seed, flux, *cles):
+    """Générateur du flux pour les clés données (par exemple l'id d'un vélo)."""
+    return np.random.default_rng(np.random.SeedSequence([seed, flux, *cles]))
@@ -0,0 +1,135 @@
+# CODE pour gestion/analytique.py
+#
+# Agrégats de l'historique des locations pour les tableaux de bord : FluxHoraireStation (départs,
+# arrivées et durée cumulée des trajets par station et par heure) et TrajetJournalier (matrice
+# origine-destination par jour). Les agrégats sont calculés par la base, avec values().annotate()
+# et TruncHour / TruncDate : aucune location n'est chargée en Python.
+#
+# rafraichir(debut, fin) recalcule les jours entiers couverts par la période, par lots de jours,
+# chacun dans sa propre transaction : les lignes des jours du lot sont effacées puis recalculées,
+# une relance donne donc les mêmes lignes. Un départ compte dans l'heure et le jour de date_debut,
+# une arrivée dans l'heure de date_fin. Les arrivées d'une période ne sont cherchées que parmi les
+# locations parties au plus DUREE_MAX_LOCATION avant : sur la table partitionnée, seules les
+# partitions de ces mois-là sont lues.
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import FluxHoraireStation, Location, TrajetJournalier
+from .versions import incrementer_apres_commit
+
+JOURS_PAR_LOT = 7
+DUREE_MAX_LOCATION = timedelta(days=1)  # les scénarios ne peuvent pas dépasser cette durée (gestion/scenario.py)
+
+DUREE = ExpressionWrapper(F('date_fin') - F('date_debut'), output_field=DurationField())
+
+
+def debut_du_jour(date):
+    """Minuit (fuseau courant) du jour de date."""
+    return timezone.make_aware(datetime.combine(timezone.localtime(date).date(), time.min))
+
+
+def _flux(debut, fin):
+    flux = defaultdict(lambda: [0, 0, timedelta()])
+    locations = Location.objects.order_by()
+    departs = locations.filter(date_debut__gte=debut, date_debut__lt=fin) \
+        .annotate(heure=TruncHour('date_debut')).values('station_depart_id', 'heure') \
+        .annotate(nombre=Count('id'), duree=Sum(DUREE))
+    for ligne in departs:
+        compteurs = flux[ligne['station_depart_id'], ligne['heure']]
+        compteurs[0], compteurs[2] = ligne['nombre'], ligne['duree']
+    # Bornes sur date_debut (clé de partitionnement) : date_debut <= date_fin <= date_debut + DUREE_MAX_LOCATION.
+    arrivees = locations.filter(date_fin__gte=debut, date_fin__lt=fin,
+                                date_debut__gte=debut - DUREE_MAX_LOCATION, date_debut__lt=fin) \
+        .annotate(heure=TruncHour('date_fin')).values('station_arrivee_id', 'heure') \
+        .annotate(nombre=Count('id'))
+    for ligne in arrivees:
+        flux[ligne['station_arrivee_id'], ligne['heure']][1] = ligne['nombre']
+    return [FluxHoraireStation(station_id=station_id, heure=heure, departs=departs, arrivees=arrivees, duree_totale=duree)
+            for (station_id, heure), (departs, arrivees, duree) in flux.items()]
+
+
+def _trajets(debut, fin):
+    trajets = Location.objects.order_by().filter(date_debut__gte=debut, date_debut__lt=fin) \
+        .annotate(jour=TruncDate('date_debut')).values('jour', 'station_depart_id', 'station_arrivee_id') \
+        .annotate(nombre=Count('id'), duree=Sum(DUREE))
+    return [TrajetJournalier(jour=ligne['jour'], station_depart_id=ligne['station_depart_id'],
+                             station_arrivee_id=ligne['station_arrivee_id'], nombre=ligne['nombre'],
+                             duree_totale=ligne['duree'])
+            for ligne in trajets]
+
+
+def periode_a_rafraichir():
+    """
+    Période par défaut d'un rafraîchissement : du jour précédant le dernier jour agrégé (une location
+    n'est enregistrée qu'à son arrivée et peut compléter la veille) jusqu'à la dernière arrivée,
+    ou tout l'historique si rien n'est agrégé. None s'il n'y a aucune location.
+    """
+    bornes = Location.objects.aggregate(premier=Min('date_debut'), dernier=Max('date_fin'))
+    if bornes['premier'] is None:
+        return None
+    derniere_heure = FluxHoraireStation.objects.aggregate(heure=Max('heure'))['heure']
+    debut = bornes['premier'] if derniere_heure is None else debut_du_jour(derniere_heure) - timedelta(days=1)
+    return debut, bornes['dernier']
+
+
+def rafraichir(debut, fin, jours_par_lot=JOURS_PAR_LOT):
+    """
+    Recalcule les agrégats des jours entiers de debut à fin (inclus), lot par lot. Générateur :
+    renvoie (début du lot, fin du lot, lignes FluxHoraireStation, lignes TrajetJournalier).
+    """
+    lot_debut, fin = debut_du_jour(debut), debut_du_jour(fin) + timedelta(days=1)
+    while lot_debut < fin:
+        lot_fin = min(lot_debut + timedelta(days=jours_par_lot), fin)
+        with transaction.atomic():
+            FluxHoraireStation.objects.filter(heure__gte=lot_debut, heure__lt=lot_fin).delete()
+            TrajetJournalier.objects.filter(
+                jour__gte=timezone.localdate(lot_debut), jour__lt=timezone.localdate(lot_fin)).delete()
+            flux = FluxHoraireStation.objects.bulk_create(_flux(lot_debut, lot_fin), batch_size=5000)
+            trajets = TrajetJournalier.objects.bulk_create(_trajets(lot_debut, lot_fin), batch_size=5000)
+            incrementer_apres_commit('analytique')
+        yield lot_debut, lot_fin, len(flux), len(trajets)
+        lot_debut = lot_fin
+
+
+def _avec_duree_moyenne(lignes, nombre):
+    for ligne in lignes:
+        duree = ligne.pop('duree_totale')
+        ligne['duree_moyenne_s'] = round(duree.total_seconds() / ligne[nombre], 1) if ligne[nombre] else None
+        yield ligne
+
+
+def flux_horaires(debut=None, fin=None, stations=None):
+    """Départs, arrivées et durée moyenne des trajets partis, par station et par heure."""
+    queryset = FluxHoraireStation.objects.order_by('heure', 'station_id') \
+        .values('station_id', 'heure', 'departs', 'arrivees', 'duree_totale')
+    if debut is not None:
+        queryset = queryset.filter(heure__gte=debut)
+    if fin is not None:
+        queryset = queryset.filter(heure__lt=fin)
+    if stations:
+        queryset = queryset.filter(station_id__in=stations)
+    return _avec_duree_moyenne(queryset.iterator(chunk_size=5000), 'departs')
+
+
+def matrice_od(debut=None, fin=None, ville=None):
+    """
+    Matrice origine-destination sur la période (jours de départ de debut à fin, exclu) : nombre de
+    trajets et durée moyenne par couple de stations, sommés sur les lignes journalières.
+    """
+    queryset = TrajetJournalier.objects.all()
+    if debut is not None:
+        queryset = queryset.filter(jour__gte=debut)
+    if fin is not None:
+        queryset = queryset.filter(jour__lt=fin)
+    if ville is not None:
+        queryset = queryset.filter(station_depart__ville_id=ville)
+    queryset = queryset.values('station_depart_id', 'station_arrivee_id') \
+        .annotate(nombre=Sum('nombre'), duree_totale=Sum('duree_totale')) \
+        .order_by('station_depart_id', 'station_arrivee_id')
+    return _avec_duree_moyenne(queryset.iterator(chunk_size=5000), 'nombre')
@@ -0,0 +1,282 @@
+# CODE pour gestion/api.py
+#
+# API JSON en lecture seule, montée sous velos/api/. Les données sont lues avec values() (des
+# dictionnaires, sans instancier de modèles) et les listes sont envoyées en flux
+# (StreamingHttpResponse) au fil de la lecture. Chaque réponse porte un ETag construit à partir
+# des compteurs de version des tables lues (gestion/versions.py) : un client qui renvoie cet ETag
+# dans If-None-Match reçoit un 304 sans qu'aucune ligne ne soit lue.
+
+import csv
+import hashlib
+import json
+from functools import wraps
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_GET
+
+from .analytique import flux_horaires as requete_flux, matrice_od as requete_od
+from .export import ENTETE, lignes_csv, tickets as requete_tickets
+from .flotte import scores_risque
+from .models import Location, Station, TicketSupport, Velo
+from .spatial import stations_proches as requete_stations_proches, velos_dans_rayon as requete_velos_dans_rayon
+from .versions import version
+
+LIGNES_PAR_MORCEAU = 1000
+
+CHAMPS_VELO = ('id', 'statut', 'batterie', 'sante_batterie', 'cycles_charge', 'station_actuelle_id', 'station_origine_id')
+CHAMPS_STATION = ('id', 'nom', 'ville_id', 'ville__nom', 'latitude', 'longitude')
+CHAMPS_LOCATION = ('id', 'velo_id', 'utilisateur_id', 'station_depart_id', 'station_arrivee_id', 'date_debut', 'date_fin')
+
+
+class ParametreInvalide(ValueError):
+    pass
+
+
+def _etag(*tables, date=None):
+    """
+    ETag d'une réponse : versions des tables lues et empreinte de l'URL (les filtres changent la réponse).
+    date nomme le paramètre de la date de référence (maintenant par défaut) d'une réponse qui change
+    avec le temps sans écriture : son jour entre aussi dans l'ETag.
+    """
+    def etag(request, *args, **kwargs):
+        versions = '-'.join(str(version(table)) for table in tables)
+        if date is not None:
+            versions += f"-{timezone.localdate(_date(request, date) or timezone.now()):%Y%m%d}"
+        url = hashlib.md5(request.get_full_path().encode()).hexdigest()[:12]
+        return f"{versions}-{url}"
+    return etag
+
+
+def _entier(request, nom):
+    valeur = request.GET.get(nom)
+    if valeur is None:
+        return None
+    try:
+        return int(valeur)
+    except ValueError:
+        raise ParametreInvalide(f"'{nom}' doit être un entier.")
+
+
+def _reel(request, nom, obligatoire=False):
+    valeur = request.GET.get(nom)
+    if valeur is None:
+        if obligatoire:
+            raise ParametreInvalide(f"'{nom}' est obligatoire.")
+        return None
+    try:
+        return float(valeur)
+    except ValueError:
+        raise ParametreInvalide(f"'{nom}' doit être un nombre.")
+
+
+def _position(request):
+    lat, lon = _reel(request, 'lat', obligatoire=True), _reel(request, 'lon', obligatoire=True)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ParametreInvalide("'lat' / 'lon' hors limites.")
+    return lat, lon
+
+
+def _date(request, nom):
+    valeur = request.GET.get(nom)
+    if valeur is None:
+        return None
+    date = parse_datetime(valeur)
+    if date is None:
+        raise ParametreInvalide(f"'{nom}' doit être une date ISO 8601.")
+    return timezone.make_aware(date) if timezone.is_naive(date) else date
+
+
+def _flux_json(lignes):
+    """Sérialise un itérable de dictionnaires en tableau JSON, par morceaux de LIGNES_PAR_MORCEAU lignes."""
+    iterateur = iter(lignes)
+    separateur = '['
+    while morceau := list(islice(iterateur, LIGNES_PAR_MORCEAU)):
+        yield separateur + ','.join(json.dumps(ligne, cls=DjangoJSONEncoder) for ligne in morceau)
+        separateur = ','
+    yield ']' if separateur == ',' else '[]'
+
+
+def _reponse_flux(queryset):
+    return StreamingHttpResponse(_flux_json(queryset.iterator(chunk_size=LIGNES_PAR_MORCEAU)),
+                                 content_type='application/json')
+
+
+class _Tampon:
+    """Pseudo-fichier pour csv.writer : writerow() renvoie directement la ligne formatée."""
+
+    def write(self, texte):
+        return texte
+
+
+def _flux_csv(lignes):
+    writer = csv.writer(_Tampon())
+    yield writer.writerow(ENTETE)
+    iterateur = iter(lignes)
+    while morceau := list(islice(iterateur, LIGNES_PAR_MORCEAU)):
+        yield ''.join(writer.writerow(ligne) for ligne in morceau)
+
+
+def _api(*tables, date=None):
+    """Décorateur commun : GET uniquement, ETag / If-None-Match (voir _etag), paramètres invalides en 400."""
+    def decorateur(vue):
+        conditionnelle = condition(etag_func=_etag(*tables, date=date))(vue)
+
+        # Les erreurs sont interceptées hors de condition() : une réponse 400 ne porte pas d'ETag.
+        @wraps(vue)
+        def enveloppe(request, *args, **kwargs):
+            try:
+                return conditionnelle(request, *args, **kwargs)
+            except ParametreInvalide as erreur:
+                return JsonResponse({'erreur': str(erreur)}, status=400)
+        return require_GET(enveloppe)
+    return decorateur
+
+
+@_api('velo')
+def velos(request):
+    """Vélos, filtrables par ?statut=DISPO|LOC|MAINT et ?station=<id de la station actuelle>."""
+    queryset = Velo.objects.order_by('id').values(*CHAMPS_VELO)
+    if statut := request.GET.get('statut'):
+        queryset = queryset.filter(statut=statut)
+    if (station := _entier(request, 'station')) is not None:
+        queryset = queryset.filter(station_actuelle_id=station)
+    return _reponse_flux(queryset)
+
+
+@_api('velo')
+def velo(request, pk):
+    ligne = Velo.objects.filter(pk=pk).values(*CHAMPS_VELO).first()
+    if ligne is None:
+        return JsonResponse({'erreur': "Vélo introuvable."}, status=404)
+    return JsonResponse(ligne)
+
+
+@_api('station')
+def stations(request):
+    """Stations, filtrables par ?ville=<id>."""
+    queryset = Station.objects.order_by('id').values(*CHAMPS_STATION)
+    if (ville := _entier(request, 'ville')) is not None:
+        queryset = queryset.filter(ville_id=ville)
+    return _reponse_flux(queryset)
+
+
+def _compteur(statut=None):
+    filtre = Q(disponibilites__statut=statut) if statut else None
+    return Coalesce(Sum('disponibilites__nombre', filter=filtre), 0)
+
+
+@_api('station', 'velo')
+def disponibilite(request):
+    """
+    Nombre de vélos par station et par statut, lu dans DisponibiliteStation (au plus une ligne
+    par station et par statut) plutôt que compté dans la table des vélos.
+    """
+    queryset = Station.objects.order_by('id').values('id', 'nom').annotate(
+        disponibles=_compteur(Velo.StatutVelo.DISPONIBLE),
+        en_maintenance=_compteur(Velo.StatutVelo.MAINTENANCE),
+        total=_compteur(),
+    )
+    if (ville := _entier(request, 'ville')) is not None:
+        queryset = queryset.filter(ville_id=ville)
+    return _reponse_flux(queryset)
+
+
+@_api('station', 'velo')
+def stations_proches(request):
+    """
+    Les ?k= (1 par défaut, 100 au plus) stations les plus proches de ?lat= / ?lon=, avec leur distance
+    en mètres ; ?disponibles=1 ne garde que les stations qui ont un vélo disponible.
+    """
+    lat, lon = _position(request)
+    if (k := _entier(request, 'k')) is None:
+        k = 1
+    if not 1 <= k <= 100:
+        raise ParametreInvalide("'k' doit être entre 1 et 100.")
+    proches = requete_stations_proches(lat, lon, k, disponibles=request.GET.get('disponibles') == '1')
+    return JsonResponse([{'id': station_id, 'distance_m': round(distance, 1)} for station_id, distance in proches],
+                        safe=False)
+
+
+@_api('station', 'velo')
+def velos_dans_rayon(request):
+    """Vélos disponibles à moins de ?rayon= mètres (500 par défaut, 5000 au plus) de ?lat= / ?lon=."""
+    lat, lon = _position(request)
+    if (rayon := _reel(request, 'rayon')) is None:
+        rayon = 500.0
+    if not 0 < rayon <= 5000:
+        raise ParametreInvalide("'rayon' doit être entre 0 et 5000 mètres.")
+    return JsonResponse(requete_velos_dans_rayon(lat, lon, rayon), safe=False)
+
+
+@_api('location')
+def locations(request):
+    """
+    Locations, filtrables par ?velo=, ?station= (départ ou arrivée) et ?debut= / ?fin= sur date_debut :
+    sur PostgreSQL, ce filtre ne lit que les partitions mensuelles concernées.
+    """
+    queryset = Location.objects.order_by('date_debut', 'id').values(*CHAMPS_LOCATION)
+    if (velo_id := _entier(request, 'velo')) is not None:
+        queryset = queryset.filter(velo_id=velo_id)
+    if (station := _entier(request, 'station')) is not None:
+        queryset = queryset.filter(Q(station_depart_id=station) | Q(station_arrivee_id=station))
+    if (debut := _date(request, 'debut')) is not None:
+        queryset = queryset.filter(date_debut__gte=debut)
+    if (fin := _date(request, 'fin')) is not None:
+        queryset = queryset.filter(date_debut__lt=fin)
+    return _reponse_flux(queryset)
+
+
+@_api('ticket')
+def tickets(request):
+    """
+    Tickets de support en CSV (même format que support_tickets.csv), filtrables par ?type= (répétable),
+    ?debut= / ?fin= sur date_creation et ?apres= (id) pour reprendre un téléchargement interrompu.
+    """
+    types = request.GET.getlist('type')
+    if set(types) - set(TicketSupport.TypeProbleme.values):
+        raise ParametreInvalide(f"'type' doit être parmi {', '.join(TicketSupport.TypeProbleme.values)}.")
+    queryset = requete_tickets(_entier(request, 'apres') or 0, _date(request, 'debut'), _date(request, 'fin'), types)
+    return StreamingHttpResponse(_flux_csv(lignes_csv(queryset, LIGNES_PAR_MORCEAU)), content_type='text/csv')
+
+
+@_api('analytique')
+def flux_horaires(request):
+    """
+    Départs, arrivées et durée moyenne des trajets par station et par heure, lus dans les agrégats
+    (voir gestion/analytique.py) ; filtrables par ?station= (répétable) et ?debut= / ?fin=.
+    """
+    try:
+        stations = [int(station) for station in request.GET.getlist('station')]
+    except ValueError:
+        raise ParametreInvalide("'station' doit être un entier.")
+    lignes = requete_flux(_date(request, 'debut'), _date(request, 'fin'), stations)
+    return StreamingHttpResponse(_flux_json(lignes), content_type='application/json')
+
+
+@_api('analytique')
+def matrice_od(request):
+    """Matrice origine-destination sommée sur ?debut= / ?fin= (jours de départ), filtrable par ?ville=."""
+    debut, fin = _date(request, 'debut'), _date(request, 'fin')
+    lignes = requete_od(debut and timezone.localdate(debut), fin and timezone.localdate(fin), _entier(request, 'ville'))
+    return StreamingHttpResponse(_flux_json(lignes), content_type='application/json')
+
+
+@_api('velo', 'ticket', 'location', date='date')
+def risques_maintenance(request):
+    """
+    Vélos classés par risque de maintenance (voir gestion/flotte.py), du plus élevé au plus faible :
+    les ?limite= premiers (50 par défaut, 0 : tous), à la ?date= donnée (maintenant par défaut).
+    """
+    limite = _entier(request, 'limite')
+    limite = 50 if limite is None else limite
+    if limite < 0:
+        raise ParametreInvalide("'limite' doit être positif.")
+    risques = scores_risque(_date(request, 'date'))
+    return StreamingHttpResponse(_flux_json(risque._asdict() for risque in risques[:limite or None]),
+                                 content_type='application/json')
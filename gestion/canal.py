@@ -0,0 +1,73 @@
+# CODE pour gestion/canal.py
+#
+# Canal de diffusion entre processus, par LISTEN/NOTIFY de PostgreSQL. Les vélos modifiés hors du
+# processus ASGI (generate_history --temps-reel, admin servi en WSGI, autre worker ASGI) publient
+# leurs événements par NOTIFY ; le Diffuseur de chaque processus ASGI écoute le canal tant qu'il a
+# des abonnés (voir gestion/diffusion.py). NOTIFY suit la transaction : une notification envoyée
+# dans une transaction n'est livrée qu'au commit, et jamais si elle est annulée.
+#
+# Hors PostgreSQL (ou avec DIFFUSION['CANAL'] à False), pas de canal : chaque processus ne diffuse
+# que ses propres événements.
+
+import json
+import select
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+NOM = 'velocite_diffusion'
+TAILLE_MAX = 7900  # octets par notification (PostgreSQL refuse une charge de 8000 octets ou plus)
+DELAI_ECOUTE = 1.0  # secondes entre deux vérifications de la demande d'arrêt
+
+
+def disponible(alias=DEFAULT_DB_ALIAS):
+    return getattr(settings, 'DIFFUSION', {}).get('CANAL', True) and connections[alias].vendor == 'postgresql'
+
+
+def paquets(evenements):
+    """Découpe les événements en listes JSON de moins de TAILLE_MAX octets chacune."""
+    paquet, taille = [], 2
+    for evenement in evenements:
+        texte = json.dumps(evenement, cls=DjangoJSONEncoder, separators=(',', ':'))
+        longueur = len(texte.encode()) + 1
+        if paquet and taille + longueur > TAILLE_MAX:
+            yield f"[{','.join(paquet)}]"
+            paquet, taille = [], 2
+        paquet.append(texte)
+        taille += longueur
+    if paquet:
+        yield f"[{','.join(paquet)}]"
+
+
+def envoyer(evenements, alias=DEFAULT_DB_ALIAS):
+    """Publie des événements sur le canal : livrés au commit de la transaction en cours, s'il y en a une."""
+    with connections[alias].cursor() as cursor:
+        for charge in paquets(evenements):
+            cursor.execute("SELECT pg_notify(%s, %s)", [NOM, charge])
+
+
+def ecouter(rappel, arret, alias=DEFAULT_DB_ALIAS, delai=DELAI_ECOUTE):
+    """
+    Boucle bloquante, à lancer dans un thread : appelle rappel(evenements) pour chaque notification
+    reçue, jusqu'à arret.set() (un threading.Event). Si la connexion est perdue, elle est rouverte
+    après delai secondes ; les notifications envoyées entre-temps sont perdues.
+    """
+    while not arret.is_set():
+        # Connexion dédiée, hors de celles de Django (propres à chaque thread) : elle reste en attente.
+        base = connections.create_connection(alias)
+        try:
+            with base.wrap_database_errors:
+                base.ensure_connection()
+                brute = base.connection
+                with brute.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOM}")
+                while not arret.is_set():
+                    if select.select([brute], [], [], delai)[0]:
+                        brute.poll()
+                        while brute.notifies:
+                            rappel(json.loads(brute.notifies.pop(0).payload))
+        except OperationalError:
+            arret.wait(delai)
+        finally:
+            base.close()
@@ -0,0 +1,203 @@
+# CODE pour gestion/diffusion.py
+#
+# Diffusion en temps réel de l'état des vélos (position, batterie, statut) vers les clients
+# connectés en Server-Sent Events (voir gestion/flux.py). Un seul Diffuseur par processus ASGI :
+# les sources (rejeu de la télémétrie, signaux des vélos, simulation) publient des événements,
+# chaque événement est mis au format SSE une seule fois, quel que soit le nombre d'abonnés, et
+# chaque abonné ne garde que le dernier état de chaque vélo en attente d'envoi. Un client lent
+# reçoit donc un état plus récent au lieu d'accumuler du retard, et la mémoire d'un abonné est
+# bornée par la taille de la flotte.
+#
+# Les événements des autres processus (generate_history --temps-reel, vélos modifiés par l'admin ou
+# l'API) arrivent par le canal PostgreSQL LISTEN/NOTIFY de gestion/canal.py : chaque processus ASGI
+# l'écoute comme une source de plus, et diffuser() y publie. Sans canal, la diffusion reste propre
+# au processus.
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import canal
+from .models import Velo
+from .telemetry import STATUTS, lire_jour, lister_jours
+
+TOUTES = None  # clé des abonnés sans filtre de ville
+
+
+def _message_sse(evenement):
+    return f"event: {evenement['type']}\ndata: {json.dumps(evenement, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Abonnement:
+    """File d'un client : le dernier message en attente par vélo, et un signal de réveil."""
+
+    def __init__(self, villes):
+        self.villes = frozenset(villes) if villes else TOUTES
+        self.en_attente = {}
+        self.pret = asyncio.Event()
+
+    def _recevoir(self, messages):
+        # Fusion : pour un vélo et un type d'événement, l'état le plus récent remplace l'ancien.
+        self.en_attente.update(messages)
+        self.pret.set()
+
+    async def attendre(self, delai):
+        """Renvoie les messages SSE en attente, ou une liste vide si rien n'arrive pendant delai secondes."""
+        # Minuteur plutôt que asyncio.wait_for : pas de tâche créée à chaque attente, et une annulation
+        # (client déconnecté) n'est jamais perdue quand un message arrive au même moment.
+        if not self.en_attente:
+            minuteur = asyncio.get_running_loop().call_later(delai, self.pret.set)
+            try:
+                await self.pret.wait()
+            finally:
+                minuteur.cancel()
+        self.pret.clear()
+        messages, self.en_attente = list(self.en_attente.values()), {}
+        return messages
+
+
+class Diffuseur:
+    def __init__(self):
+        self.abonnes = defaultdict(set)  # ville (ou TOUTES) -> abonnements
+        self.boucle = None
+        self.sources = []  # tâches asyncio qui alimentent le diffuseur
+        self.arret = None  # threading.Event qui arrête l'écoute du canal
+
+    def abonner(self, villes=None):
+        self.boucle = asyncio.get_running_loop()
+        self._demarrer_sources()
+        abonnement = Abonnement(villes)
+        for ville in abonnement.villes or [TOUTES]:
+            self.abonnes[ville].add(abonnement)
+        return abonnement
+
+    def desabonner(self, abonnement):
+        for ville in abonnement.villes or [TOUTES]:
+            self.abonnes[ville].discard(abonnement)
+            if not self.abonnes[ville]:
+                del self.abonnes[ville]
+        # Dernier client parti : les sources s'arrêtent, le prochain abonné les relancera.
+        if not self.abonnes:
+            self._arreter_sources()
+
+    @property
+    def actif(self):
+        """Vrai tant qu'un client est abonné dans ce processus : sinon publier() est inutile."""
+        return bool(self.abonnes)
+
+    def publier(self, evenements):
+        """
+        Publie une liste d'événements (dictionnaires avec au moins 'type', 'velo_id' et 'ville').
+        Peut être appelé depuis n'importe quel thread : la distribution se fait dans la boucle ASGI.
+        """
+        if self.boucle is None or not evenements:
+            return
+        try:
+            dans_la_boucle = asyncio.get_running_loop() is self.boucle
+        except RuntimeError:
+            dans_la_boucle = False
+        if dans_la_boucle:
+            self._distribuer(evenements)
+        elif not self.boucle.is_closed():
+            self.boucle.call_soon_threadsafe(self._distribuer, evenements)
+
+    def _distribuer(self, evenements):
+        # Un seul réveil par abonné et par lot, quel que soit le nombre d'événements.
+        tous, par_ville = {}, defaultdict(dict)
+        for evenement in evenements:
+            cle = (evenement['type'], evenement['velo_id'])
+            tous[cle] = par_ville[evenement.get('ville')][cle] = _message_sse(evenement)
+        for abonnement in self.abonnes.get(TOUTES, ()):
+            abonnement._recevoir(tous)
+        for ville, lot in par_ville.items():
+            for abonnement in self.abonnes.get(ville, ()):
+                abonnement._recevoir(lot)
+
+    def _demarrer_sources(self):
+        if self.sources:
+            return
+        config = getattr(settings, 'DIFFUSION', {})
+        if config.get('REJEU_TELEMETRIE', True):
+            dossier = config.get('DOSSIER_TELEMETRIE', os.path.join(settings.BASE_DIR, 'output_data_v3'))
+            self.sources.append(asyncio.ensure_future(
+                rejouer_telemetrie(self, dossier, config.get('ACCELERATION', 60.0))))
+        if canal.disponible():
+            # L'écoute bloque sur la connexion : elle tourne dans un thread, publier() la ramène dans la boucle.
+            self.arret = threading.Event()
+            self.sources.append(asyncio.ensure_future(asyncio.to_thread(canal.ecouter, self.publier, self.arret)))
+
+    def _arreter_sources(self):
+        for source in self.sources:
+            source.cancel()
+        self.sources = []
+        if self.arret is not None:
+            # Annuler la tâche n'interrompt pas le thread d'écoute : il s'arrête au plus tard après
+            # canal.DELAI_ECOUTE.
+            self.arret.set()
+            self.arret = None
+
+
+def diffuser(evenements):
+    """
+    Publie des événements depuis du code synchrone : sur le canal, pour les abonnés de tous les
+    processus ASGI, ou sans canal aux seuls abonnés de ce processus.
+    """
+    if not evenements:
+        return
+    if canal.disponible():
+        canal.envoyer(evenements)
+    else:
+        diffuseur.publier(evenements)
+
+
+def _villes_des_velos():
+    return dict(Velo.objects.values_list('id', 'station_origine__ville__nom'))
+
+
+async def rejouer_telemetrie(diffuseur, output_dir, acceleration):
+    """
+    Source de démonstration : rejoue en boucle le dernier jour de télémétrie écrit par generate_files,
+    acceleration fois plus vite que le temps réel, un lot d'événements par pas de temps. La tâche
+    est lancée au premier abonné et annulée quand le dernier se désabonne.
+    """
+    jours = await asyncio.to_thread(lister_jours, output_dir)
+    if not jours:
+        return
+    colonnes = await asyncio.to_thread(lire_jour, output_dir, jours[-1])
+    villes = await sync_to_async(_villes_des_velos)()
+    ordre = np.argsort(colonnes['timestamp'], kind='stable')
+    timestamps = colonnes['timestamp'][ordre]
+    if not len(timestamps):
+        return
+    # Un lot par timestamp distinct : bornes [debuts[k], debuts[k + 1]) dans l'ordre chronologique.
+    debuts = np.flatnonzero(np.r_[True, timestamps[1:] != timestamps[:-1]])
+    fins = np.r_[debuts[1:], len(timestamps)]
+    velo_ids = colonnes['velo_id'][ordre].tolist()
+    statuts = colonnes['statut'][ordre].tolist()
+    batteries = colonnes['batterie'][ordre].tolist()
+    lats, lons = colonnes['latitude'][ordre].tolist(), colonnes['longitude'][ordre].tolist()
+
+    while True:
+        depart, premier = time.monotonic(), int(timestamps[0])
+        for debut, fin in zip(debuts.tolist(), fins.tolist()):
+            t = int(timestamps[debut])
+            attente = depart + (t - premier) / acceleration - time.monotonic()
+            # Toujours rendre la main, même en retard : les abonnés doivent pouvoir être servis.
+            await asyncio.sleep(max(attente, 0))
+            diffuseur.publier([
+                {'type': 'position', 'velo_id': velo_ids[i], 'ville': villes.get(velo_ids[i]), 'timestamp': t,
+                 'statut': STATUTS[statuts[i]], 'batterie': round(batteries[i], 2),
+                 'latitude': lats[i], 'longitude': lons[i]}
+                for i in range(debut, fin)
+            ])
+
+
+diffuseur = Diffuseur()
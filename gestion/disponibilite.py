@@ -0,0 +1,51 @@
+# CODE pour gestion/disponibilite.py
+#
+# Maintenance de DisponibiliteStation. Chaque changement de station ou de statut d'un vélo
+# déplace une unité d'un compteur (station, statut) à un autre (voir gestion/signals.py).
+# Les écritures en masse (COPY, bulk_update, TRUNCATE) ne passent pas par les signaux :
+# les commandes concernées appellent reconstruire() à la fin. Un compteur décalé par une telle
+# écriture ne descend jamais sous zéro ; reconstruire() le recale.
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import DisponibiliteStation, Velo
+
+
+def ajuster(station_id, statut, delta):
+    """Ajoute delta au compteur (station, statut), borné à zéro, en créant la ligne si besoin."""
+    if station_id is None:
+        return
+    compteurs = DisponibiliteStation.objects.filter(station_id=station_id, statut=statut)
+    if compteurs.update(nombre=Greatest(F('nombre') + delta, 0)) or delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            DisponibiliteStation.objects.create(station_id=station_id, statut=statut, nombre=delta)
+    except IntegrityError:
+        # Ligne créée entre-temps par une autre transaction.
+        compteurs.update(nombre=F('nombre') + delta)
+
+
+def deplacer(ancien, nouveau):
+    """Passe un vélo de l'état ancien à l'état nouveau, chacun étant (station_id, statut) ou None."""
+    if ancien == nouveau:
+        return
+    if ancien is not None:
+        ajuster(*ancien, -1)
+    if nouveau is not None:
+        ajuster(*nouveau, 1)
+
+
+@transaction.atomic
+def reconstruire():
+    """Recalcule toute la table à partir des vélos, en une agrégation. Renvoie le nombre de lignes."""
+    DisponibiliteStation.objects.all().delete()
+    comptes = Velo.objects.filter(station_actuelle__isnull=False).order_by() \
+        .values('station_actuelle_id', 'statut').annotate(nombre=Count('id'))
+    lignes = DisponibiliteStation.objects.bulk_create([
+        DisponibiliteStation(station_id=c['station_actuelle_id'], statut=c['statut'], nombre=c['nombre'])
+        for c in comptes
+    ], batch_size=5000)
+    return len(lignes)
@@ -0,0 +1,94 @@
+# CODE pour gestion/export.py
+#
+# Export CSV des tickets de support, en flux : les tickets sont lus par lots avec values_list()
+# (nom d'utilisateur compris, par jointure) et un itérateur côté serveur, sans instancier de modèles
+# ni faire de requête par ticket. Le temps et la mémoire restent proportionnels à un lot, quel que
+# soit le nombre de tickets.
+#
+# L'export vers un fichier est reprenable : chaque lot est écrit d'un bloc (en gzip, un membre gzip
+# par lot, les membres concaténés formant un fichier gzip valide) puis le fichier .reprise voisin
+# enregistre le dernier id exporté et la taille du fichier à cet instant. Une reprise tronque le
+# fichier à cette taille (un lot interrompu est réécrit en entier) et repart de l'id suivant.
+
+import csv
+import gzip
+import io
+import json
+import os
+from itertools import islice
+
+from .models import TicketSupport
+
+TAILLE_LOT = 5000
+
+ENTETE = ['id', 'velo_id', 'utilisateur', 'type_probleme', 'description', 'date_creation']
+CHAMPS = ('id', 'velo_id', 'utilisateur__username', 'type_probleme', 'description', 'date_creation')
+LIBELLES = dict(TicketSupport.TypeProbleme.choices)
+
+
+def tickets(apres_id=0, debut=None, fin=None, types=None):
+    """Tickets d'id > apres_id, par id croissant, filtrés sur date_creation [debut, fin) et type_probleme."""
+    queryset = TicketSupport.objects.filter(id__gt=apres_id).order_by('id').values_list(*CHAMPS)
+    if debut is not None:
+        queryset = queryset.filter(date_creation__gte=debut)
+    if fin is not None:
+        queryset = queryset.filter(date_creation__lt=fin)
+    if types:
+        queryset = queryset.filter(type_probleme__in=types)
+    return queryset
+
+
+def lignes_csv(queryset, taille_lot=TAILLE_LOT):
+    """Lignes CSV (listes) des tickets, dans le format historique de support_tickets.csv."""
+    for id_, velo_id, username, type_probleme, description, date_creation in queryset.iterator(chunk_size=taille_lot):
+        yield [id_, velo_id, username or '', LIBELLES.get(type_probleme, type_probleme), description,
+               date_creation.isoformat()]
+
+
+def _encoder(lignes, compresser):
+    tampon = io.StringIO()
+    csv.writer(tampon).writerows(lignes)
+    donnees = tampon.getvalue().encode('utf-8')
+    return gzip.compress(donnees) if compresser else donnees
+
+
+def _enregistrer(fichier_reprise, dernier_id, sortie, filtres):
+    sortie.flush()
+    temporaire = fichier_reprise + '.tmp'
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump({'dernier_id': dernier_id, 'octets': sortie.tell(), 'filtres': filtres}, f)
+    os.replace(temporaire, fichier_reprise)
+
+
+def exporter_tickets(chemin, compresser=False, reprendre=False, apres_id=0, debut=None, fin=None, types=None,
+                     taille_lot=TAILLE_LOT):
+    """
+    Écrit les tickets dans chemin, lot par lot ; génère le nombre cumulé de tickets exportés après
+    chaque lot. Avec reprendre, repart du point enregistré dans chemin + '.reprise' s'il existe.
+    """
+    fichier_reprise = chemin + '.reprise'
+    filtres = {'debut': debut.isoformat() if debut else None, 'fin': fin.isoformat() if fin else None,
+               'types': sorted(types) if types else None, 'gzip': compresser}
+    octets = None
+    if reprendre and os.path.exists(fichier_reprise) and os.path.exists(chemin):
+        with open(fichier_reprise, encoding='utf-8') as f:
+            etat = json.load(f)
+        if etat['filtres'] != filtres:
+            raise ValueError(f"{chemin} a été exporté avec d'autres filtres : {etat['filtres']}.")
+        apres_id, octets = etat['dernier_id'], etat['octets']
+
+    exportes = 0
+    with open(chemin, 'r+b' if octets is not None else 'wb') as sortie:
+        if octets is None:
+            sortie.write(_encoder([ENTETE], compresser))
+            _enregistrer(fichier_reprise, apres_id, sortie, filtres)
+        else:
+            sortie.truncate(octets)
+            sortie.seek(octets)
+        lignes = lignes_csv(tickets(apres_id, debut, fin, types), taille_lot)
+        while lot := list(islice(lignes, taille_lot)):
+            sortie.write(_encoder(lot, compresser))
+            exportes += len(lot)
+            # Le point de reprise n'est enregistré qu'une fois le lot entièrement écrit.
+            _enregistrer(fichier_reprise, lot[-1][0], sortie, filtres)
+            yield exportes
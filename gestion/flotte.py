@@ -0,0 +1,134 @@
+# CODE pour gestion/flotte.py
+#
+# Santé de la flotte : usure des batteries et score de risque de maintenance.
+#
+# Batterie. generate_files simule le niveau de charge de chaque vélo le long de ses locations (voir
+# gestion/simulation.py). À la fin du run, usure() résume la télémétrie de chaque vélo (décharge
+# cumulée, recharges d'une batterie tombée sous le seuil de batterie faible) et vieillir() en déduit
+# Velo.cycles_charge et Velo.sante_batterie, écrits en une fois avec Velo.batterie. La santé est la
+# capacité restante en % de la capacité nominale : elle baisse à chaque cycle complet équivalent
+# (100 % de décharge cumulée) et un peu plus à chaque décharge profonde. Une batterie usée se vide
+# plus vite : la décharge d'un trajet est divisée par capacite(sante). La santé reste fixe pendant
+# un run ; un run --incremental part des valeurs écrites par le précédent, une génération complète
+# repart d'une flotte neuve.
+#
+# Risque. scores_risque() classe toute la flotte en une passe : trois requêtes agrégées par la base
+# (vélos, tickets par vélo et par type, heures de location récentes par vélo), puis une matrice
+# NumPy vélos x FACTEURS pondérée par POIDS. Le score (de 0 à 100) vaut 100 * (1 - exp(-somme
+# pondérée)) ; le motif est le facteur qui y contribue le plus.
+
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .analytique import DUREE
+from .models import Location, TicketSupport, Velo
+from .trajectory import SEUIL_BATTERIE_FAIBLE
+
+PERTE_PAR_CYCLE = 0.02  # points de santé perdus par cycle complet équivalent (80 % après 1000 cycles)
+PERTE_PAR_DECHARGE_PROFONDE = 0.05  # par recharge d'une batterie tombée sous SEUIL_BATTERIE_FAIBLE
+SANTE_MINIMALE = 50.0
+
+FENETRE_JOURS = 30  # période des tickets récents et de l'usage récent
+POIDS_ANCIENS = 0.25  # poids d'un ticket plus ancien que la fenêtre
+CYCLES_REFERENCE = 1000.0
+HEURES_REFERENCE = 60.0  # heures de location sur la fenêtre correspondant à un usage intensif
+
+# Facteurs de risque et leur poids : santé et cycles de la batterie, batterie actuellement faible,
+# tickets (pondérés par ancienneté) par type de problème, usage récent.
+FACTEURS = ('sante', 'cycles', 'batterie_faible', 'freinage', 'tickets_batterie', 'autres_tickets', 'usage')
+POIDS = np.array([3.0, 1.0, 0.5, 1.0, 0.1, 0.3, 0.5])
+FACTEUR_PAR_TYPE = {
+    TicketSupport.TypeProbleme.FREINAGE: FACTEURS.index('freinage'),
+    TicketSupport.TypeProbleme.BATTERIE_FAIBLE: FACTEURS.index('tickets_batterie'),
+    TicketSupport.TypeProbleme.STATIONNEMENT: FACTEURS.index('autres_tickets'),
+    TicketSupport.TypeProbleme.AUTRE: FACTEURS.index('autres_tickets'),
+}
+
+Risque = namedtuple('Risque', 'velo_id score motif statut batterie sante_batterie cycles_charge')
+
+
+def capacite(sante):
+    """Fraction de la capacité nominale encore disponible (1.0 pour une batterie neuve)."""
+    return max(sante, SANTE_MINIMALE) / 100.0
+
+
+def usure(batteries, niveau_initial=100.0):
+    """(décharge cumulée en %, nombre de décharges profondes) d'une série de niveaux de batterie."""
+    niveaux = np.concatenate(([niveau_initial], np.asarray(batteries, dtype=float)))
+    variations = np.diff(niveaux)
+    profondes = (variations > 0) & (niveaux[:-1] < SEUIL_BATTERIE_FAIBLE)
+    return float(-variations[variations < 0].sum()), int(profondes.sum())
+
+
+def vieillir(cycles, sante, decharge, profondes):
+    """(cycles, santé) d'une batterie après une décharge cumulée de decharge % et profondes décharges profondes."""
+    nouveaux_cycles = decharge / 100.0
+    perte = PERTE_PAR_CYCLE * nouveaux_cycles + PERTE_PAR_DECHARGE_PROFONDE * profondes
+    return cycles + nouveaux_cycles, max(sante - perte, SANTE_MINIMALE)
+
+
+def _positions(ids, velo_ids):
+    """Positions des velo_ids dans ids (trié) et masque de ceux qui y figurent."""
+    velo_ids = np.fromiter(velo_ids, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(ids, velo_ids), len(ids) - 1)
+    connus = ids[positions] == velo_ids
+    return positions[connus], connus
+
+
+def facteurs_risque(date=None, fenetre_jours=FENETRE_JOURS, inclure_maintenance=False):
+    """
+    (vélos, facteurs) : vélos est la liste des (id, statut, batterie, sante_batterie, cycles_charge)
+    par id croissant, facteurs la matrice (vélos x FACTEURS) lue à la date donnée (maintenant par défaut).
+    Les vélos déjà en maintenance sont exclus, sauf avec inclure_maintenance.
+    """
+    date = date or timezone.now()
+    debut = date - timedelta(days=fenetre_jours)
+    velos = Velo.objects.order_by('id')
+    if not inclure_maintenance:
+        velos = velos.exclude(statut=Velo.StatutVelo.MAINTENANCE)
+    velos = list(velos.values_list('id', 'statut', 'batterie', 'sante_batterie', 'cycles_charge'))
+    facteurs = np.zeros((len(velos), len(FACTEURS)))
+    if not velos:
+        return velos, facteurs
+    ids = np.array([velo[0] for velo in velos], dtype=np.int64)
+    batteries = np.array([velo[2] for velo in velos], dtype=float)
+    santes = np.array([velo[3] for velo in velos], dtype=float)
+    facteurs[:, FACTEURS.index('sante')] = (100.0 - santes) / (100.0 - SANTE_MINIMALE)
+    facteurs[:, FACTEURS.index('cycles')] = np.array([velo[4] for velo in velos], dtype=float) / CYCLES_REFERENCE
+    facteurs[:, FACTEURS.index('batterie_faible')] = batteries < SEUIL_BATTERIE_FAIBLE
+
+    tickets = list(TicketSupport.objects.filter(velo__isnull=False, date_creation__lt=date)
+                   .order_by().values('velo_id', 'type_probleme')
+                   .annotate(total=Count('id'), recents=Count('id', filter=Q(date_creation__gte=debut)))
+                   .values_list('velo_id', 'type_probleme', 'total', 'recents'))
+    if tickets:
+        positions, connus = _positions(ids, (ticket[0] for ticket in tickets))
+        colonnes = np.array([FACTEUR_PAR_TYPE[ticket[1]] for ticket in tickets])
+        totaux = np.array([ticket[2] for ticket in tickets], dtype=float)
+        recents = np.array([ticket[3] for ticket in tickets], dtype=float)
+        np.add.at(facteurs, (positions, colonnes[connus]), (recents + POIDS_ANCIENS * (totaux - recents))[connus])
+
+    usage = list(Location.objects.filter(date_debut__gte=debut, date_debut__lt=date)
+                 .order_by().values('velo_id').annotate(duree=Sum(DUREE)).values_list('velo_id', 'duree'))
+    if usage:
+        positions, connus = _positions(ids, (velo_id for velo_id, _ in usage))
+        heures = np.array([duree.total_seconds() / 3600 for _, duree in usage])
+        facteurs[positions, FACTEURS.index('usage')] = heures[connus] / HEURES_REFERENCE
+    return velos, facteurs
+
+
+def scores_risque(date=None, fenetre_jours=FENETRE_JOURS, inclure_maintenance=False):
+    """Toute la flotte classée du risque le plus élevé au plus faible : liste de Risque."""
+    velos, facteurs = facteurs_risque(date, fenetre_jours, inclure_maintenance)
+    contributions = facteurs * POIDS
+    scores = 100.0 * (1.0 - np.exp(-contributions.sum(axis=1)))
+    motifs = contributions.argmax(axis=1)
+    # Tri stable par score décroissant : à score égal, l'ordre des ids.
+    ordre = np.argsort(-scores, kind='stable')
+    return [Risque(velos[i][0], round(float(scores[i]), 2), FACTEURS[motifs[i]] if scores[i] > 0 else None,
+                   *velos[i][1:])
+            for i in ordre.tolist()]
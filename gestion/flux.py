@@ -0,0 +1,35 @@
+# CODE pour gestion/flux.py
+#
+# Flux temps réel de la flotte en Server-Sent Events, servi par une vue asynchrone : sous ASGI
+# (velocite_plus/asgi.py), un client connecté ne mobilise pas de thread, seulement une coroutine
+# en attente sur son abonnement au diffuseur.
+
+from django.http import StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .diffusion import diffuseur
+
+DELAI_PING = 15  # secondes sans événement avant un commentaire de maintien de la connexion
+
+
+async def _evenements_sse(villes):
+    abonnement = diffuseur.abonner(villes)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            messages = await abonnement.attendre(DELAI_PING)
+            # Tous les messages en attente partent en un seul envoi.
+            yield ''.join(messages) if messages else ": ping\n\n"
+    finally:
+        # Client déconnecté : Django annule le générateur, l'abonnement est retiré.
+        diffuseur.desabonner(abonnement)
+
+
+@require_GET
+async def flux_velos(request):
+    """Positions, batteries et statuts des vélos en continu ; ?ville=Lyon (répétable) filtre par ville."""
+    reponse = StreamingHttpResponse(_evenements_sse(request.GET.getlist('ville')),
+                                    content_type='text/event-stream')
+    reponse['Cache-Control'] = 'no-cache'
+    reponse['X-Accel-Buffering'] = 'no'  # pas de mise en tampon par un proxy nginx
+    return reponse
@@ -0,0 +1,234 @@
+# CODE pour gestion/itineraires.py
+#
+# Itinéraires routiers entre stations, pour que la télémétrie suive les rues au lieu d'aller en ligne
+# droite d'une station à l'autre. Deux étapes :
+#
+#   - calculer_itineraires (commande) lit le réseau routier d'une ville dans un extrait OSM local
+#     (.osm, .osm.gz ou .osm.bz2), calcule les plus courts chemins entre ses stations (un Dijkstra par
+#     station de départ sert toutes les arrivées) et les enregistre dans le fichier des itinéraires ;
+#   - generate_files --itineraires charge ce fichier une fois par processus : la position d'un vélo
+#     à un instant du trajet est une recherche dichotomique dans les distances cumulées du tracé.
+#     Aucun calcul d'itinéraire n'a lieu pendant la génération ; un couple de stations absent du
+#     fichier garde la ligne droite.
+#
+# Le fichier (settings.SIMULATION['ITINERAIRES'], NumPy .npz non compressé) contient tous les tracés
+# bout à bout : paires (station_depart, station_arrivee), debuts (indice du premier point de chaque
+# tracé), lats / lons des points et cumul (distance en mètres depuis le départ du tracé).
+
+import bz2
+import gzip
+import heapq
+import os
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+from .spatial import IndexStations, RAYON_TERRE_KM
+
+# Voies OSM (highway=...) praticables à vélo.
+VOIES_CYCLABLES = {
+    'primary', 'primary_link', 'secondary', 'secondary_link', 'tertiary', 'tertiary_link', 'unclassified',
+    'residential', 'living_street', 'service', 'cycleway', 'path', 'track', 'pedestrian', 'road',
+}
+MARGE_DEGRES = 0.02  # réseau lu autour des stations de la ville (environ 2 km)
+
+
+def chemin_par_defaut():
+    return getattr(settings, 'SIMULATION', {}).get('ITINERAIRES') or os.path.join(settings.BASE_DIR, 'itineraires.npz')
+
+
+def _distances_m(lat1, lon1, lat2, lon2):
+    """Distances haversine en mètres, point à point."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _longueurs_m(lats, lons):
+    """Longueurs des segments successifs d'une polyligne."""
+    return _distances_m(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+class Itineraires:
+    """Tracés entre paires de stations, mis bout à bout (voir l'en-tête du module)."""
+
+    def __init__(self, paires, debuts, lats, lons, cumul):
+        self.paires = np.asarray(paires, dtype=np.int64).reshape(-1, 2)
+        self.debuts = np.asarray(debuts, dtype=np.int64)
+        self.lats, self.lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        self.cumul = np.asarray(cumul, dtype=float)
+        self._index = {(int(d), int(a)): i for i, (d, a) in enumerate(self.paires)}
+        # Distances cumulées rendues croissantes sur tout le fichier (chaque tracé est décalé de la
+        # longueur des précédents, plus 1 m) : un seul searchsorted sert tous les tracés à la fois.
+        self.longueurs = self.cumul[self.debuts[1:] - 1] if len(self.paires) else np.empty(0)
+        self._decalages = np.concatenate(([0.0], np.cumsum(self.longueurs + 1.0)))[:-1]
+        self._cles = self.cumul + np.repeat(self._decalages, np.diff(self.debuts))
+
+    def __len__(self):
+        return len(self.paires)
+
+    @classmethod
+    def vide(cls):
+        return cls(np.empty((0, 2)), [0], [], [], [])
+
+    @classmethod
+    def charger(cls, chemin):
+        with np.load(chemin) as donnees:
+            return cls(donnees['paires'], donnees['debuts'], donnees['lats'], donnees['lons'], donnees['cumul'])
+
+    def enregistrer(self, chemin):
+        temporaire = f"{chemin}.tmp.npz"
+        np.savez(temporaire, paires=self.paires, debuts=self.debuts, lats=self.lats, lons=self.lons, cumul=self.cumul)
+        os.replace(temporaire, chemin)
+
+    def trace(self, station_depart, station_arrivee):
+        i = self._index[(station_depart, station_arrivee)]
+        d, f = self.debuts[i], self.debuts[i + 1]
+        return self.lats[d:f], self.lons[d:f], self.cumul[d:f]
+
+    def completer(self, traces):
+        """Nouvel ensemble : ces tracés ({(depart, arrivee): (lats, lons)}) remplacent ou s'ajoutent aux actuels."""
+        anciens = {paire: self.trace(*paire)[:2] for paire in self._index if paire not in traces}
+        tous = {**anciens, **traces}
+        paires = sorted(tous)
+        lats = [np.asarray(tous[paire][0], dtype=float) for paire in paires]
+        lons = [np.asarray(tous[paire][1], dtype=float) for paire in paires]
+        cumul = [np.concatenate(([0.0], np.cumsum(_longueurs_m(la, lo)))) for la, lo in zip(lats, lons)]
+        debuts = np.concatenate(([0], np.cumsum([len(la) for la in lats])))
+        vide = np.empty(0)
+        return Itineraires(np.array(paires, dtype=np.int64).reshape(-1, 2), debuts,
+                           np.concatenate(lats) if lats else vide, np.concatenate(lons) if lons else vide,
+                           np.concatenate(cumul) if cumul else vide)
+
+    def indices(self, paires):
+        """Indice du tracé de chaque (station_depart, station_arrivee), -1 s'il n'est pas connu."""
+        return np.array([self._index.get(paire, -1) for paire in paires], dtype=np.int64)
+
+    def positions(self, traces, ratios):
+        """Positions (lats, lons) à la fraction ratios (entre 0 et 1) de la longueur des tracés d'indices traces."""
+        cibles = self._decalages[traces] + np.clip(ratios, 0.0, 1.0) * self.longueurs[traces]
+        fin = np.searchsorted(self._cles, cibles, side='right')
+        fin = np.clip(fin, self.debuts[traces] + 1, self.debuts[traces + 1] - 1)
+        debut = fin - 1
+        segment = self._cles[fin] - self._cles[debut]
+        t = np.divide(cibles - self._cles[debut], segment, out=np.zeros_like(cibles), where=segment > 0)
+        return (self.lats[debut] + (self.lats[fin] - self.lats[debut]) * t,
+                self.lons[debut] + (self.lons[fin] - self.lons[debut]) * t)
+
+
+@lru_cache
+def itineraires_du_fichier(chemin):
+    """Itinéraires lus une seule fois par processus (workers de generate_files compris)."""
+    return Itineraires.charger(chemin)
+
+
+def _ouvrir(chemin):
+    if chemin.endswith('.pbf'):
+        raise ValueError(f"{chemin} : format PBF non lu, convertir l'extrait en XML (osmium cat -o extrait.osm).")
+    if chemin.endswith('.gz'):
+        return gzip.open(chemin, 'rb')
+    if chemin.endswith('.bz2'):
+        return bz2.open(chemin, 'rb')
+    return open(chemin, 'rb')
+
+
+class Reseau:
+    """Graphe routier (CSR NumPy) : noeuds (lat, lon), arcs pondérés par leur longueur en mètres."""
+
+    def __init__(self, lats, lons, origines, destinations):
+        self.lats, self.lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        origines, destinations = np.asarray(origines, dtype=np.int64), np.asarray(destinations, dtype=np.int64)
+        ordre = np.argsort(origines, kind='stable')
+        origines, destinations = origines[ordre], destinations[ordre]
+        poids = _distances_m(self.lats[origines], self.lons[origines], self.lats[destinations], self.lons[destinations])
+        self.debuts = np.searchsorted(origines, np.arange(len(self.lats) + 1)).tolist()
+        self.voisins, self.poids = destinations.tolist(), poids.tolist()
+
+    @classmethod
+    def depuis_osm(cls, chemin, lat_min, lat_max, lon_min, lon_max):
+        """Réseau cyclable de l'extrait OSM, limité au rectangle donné."""
+        noeuds, arcs = {}, []
+        with _ouvrir(chemin) as fichier:
+            for _, element in ET.iterparse(fichier, events=('end',)):
+                if element.tag == 'node':
+                    lat, lon = float(element.get('lat')), float(element.get('lon'))
+                    if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max:
+                        noeuds[int(element.get('id'))] = (lat, lon)
+                elif element.tag == 'way':
+                    tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                    if tags.get('highway') in VOIES_CYCLABLES:
+                        refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+                        sens = tags.get('oneway') if tags.get('oneway:bicycle') != 'no' else None
+                        for a, b in zip(refs, refs[1:]):
+                            if a in noeuds and b in noeuds:
+                                if sens != '-1':
+                                    arcs.append((a, b))
+                                if sens not in ('yes', 'true', '1', '-1'):
+                                    arcs.append((b, a))
+                if element.tag in ('node', 'way', 'relation'):
+                    element.clear()
+        utilises = sorted({noeud for arc in arcs for noeud in arc})
+        numeros = {noeud: i for i, noeud in enumerate(utilises)}
+        return cls([noeuds[n][0] for n in utilises], [noeuds[n][1] for n in utilises],
+                   [numeros[a] for a, _ in arcs], [numeros[b] for _, b in arcs])
+
+    def __len__(self):
+        return len(self.lats)
+
+    def plus_proches(self, lats, lons):
+        """Noeud du réseau le plus proche de chaque point."""
+        index = IndexStations(np.arange(len(self.lats)), self.lats, self.lons)
+        return [index.proches(lat, lon, 1)[0][0] for lat, lon in zip(lats, lons)]
+
+    def chemins(self, source, cibles):
+        """Dijkstra depuis source, arrêté quand toutes les cibles sont atteintes : {cible: [noeuds]}."""
+        distances, precedents = {source: 0.0}, {source: None}
+        restantes, tas, fixes = set(cibles), [(0.0, source)], set()
+        debuts, voisins, poids = self.debuts, self.voisins, self.poids
+        while tas and restantes:
+            distance, noeud = heapq.heappop(tas)
+            if noeud in fixes:
+                continue
+            fixes.add(noeud)
+            restantes.discard(noeud)
+            for k in range(debuts[noeud], debuts[noeud + 1]):
+                voisin, nouvelle = voisins[k], distance + poids[k]
+                if nouvelle < distances.get(voisin, float('inf')):
+                    distances[voisin], precedents[voisin] = nouvelle, noeud
+                    heapq.heappush(tas, (nouvelle, voisin))
+        resultat = {}
+        for cible in set(cibles) - restantes:
+            chemin, noeud = [], cible
+            while noeud is not None:
+                chemin.append(noeud)
+                noeud = precedents[noeud]
+            resultat[cible] = chemin[::-1]
+        return resultat
+
+
+def calculer_traces(reseau, stations, paires):
+    """
+    Tracés des paires (station_depart, station_arrivee) ; stations : {id: (lat, lon)}. Chaque tracé
+    part de la station, suit le réseau entre les noeuds les plus proches et finit à la station
+    d'arrivée. Renvoie ({paire: (lats, lons)}, paires sans chemin).
+    """
+    ids = sorted({station for paire in paires for station in paire})
+    noeuds = dict(zip(ids, reseau.plus_proches([stations[s][0] for s in ids], [stations[s][1] for s in ids])))
+    par_depart = {}
+    for depart, arrivee in paires:
+        par_depart.setdefault(depart, []).append(arrivee)
+
+    traces, sans_chemin = {}, []
+    for depart, arrivees in par_depart.items():
+        chemins = reseau.chemins(noeuds[depart], [noeuds[a] for a in arrivees])
+        for arrivee in arrivees:
+            chemin = chemins.get(noeuds[arrivee])
+            if chemin is None:
+                sans_chemin.append((depart, arrivee))
+                continue
+            traces[(depart, arrivee)] = (
+                np.concatenate(([stations[depart][0]], reseau.lats[chemin], [stations[arrivee][0]])),
+                np.concatenate(([stations[depart][1]], reseau.lons[chemin], [stations[arrivee][1]])))
+    return traces, sans_chemin
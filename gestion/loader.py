@@ -0,0 +1,96 @@
+# CODE pour gestion/loader.py
+#
+# Chargement en masse des tables de simulation. Sur PostgreSQL les lignes sont sérialisées dans un
+# tampon mémoire au format texte de COPY puis envoyées avec COPY ... FROM STDIN (copy_expert de
+# psycopg2), sans construire d'instances de modèles. Sur les autres bases (SQLite en développement),
+# on se rabat sur bulk_create par lots.
+
+import io
+from datetime import date, datetime
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+TAILLE_LOT = 50000
+
+_ECHAPPEMENTS = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _valeur_copy(valeur):
+    if valeur is None:
+        return '\\N'
+    if valeur is True:
+        return 't'
+    if valeur is False:
+        return 'f'
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    if isinstance(valeur, str):
+        return valeur.translate(_ECHAPPEMENTS)
+    return str(valeur)
+
+
+def _champs_implicites(modele, champs):
+    """
+    Champs non fournis par l'appelant mais obligatoires pour COPY, qui n'applique pas les valeurs
+    par défaut de Django : valeurs par défaut et dates auto_now / auto_now_add (comme bulk_create).
+    """
+    fournis = {modele._meta.get_field(nom).attname for nom in champs}
+    implicites = []
+    for field in modele._meta.concrete_fields:
+        if field.attname in fournis or field.primary_key:
+            continue
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            implicites.append((field, timezone.now() if field.get_internal_type() == 'DateTimeField'
+                               else timezone.localdate()))
+        elif field.has_default():
+            implicites.append((field, field.get_default()))
+    return implicites
+
+
+def _lots(lignes, taille_lot):
+    iterateur = iter(lignes)
+    while lot := list(islice(iterateur, taille_lot)):
+        yield lot
+
+
+def _copy_disponible(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    connection.ensure_connection()
+    return hasattr(connection.connection.cursor(), 'copy_expert')
+
+
+def charger(modele, champs, lignes, taille_lot=TAILLE_LOT, using=DEFAULT_DB_ALIAS):
+    """
+    Insère des lignes dans la table de modele et renvoie le nombre de lignes chargées.
+    champs nomme les colonnes fournies (ex. ('velo', 'date_debut')), chaque ligne est un tuple de
+    valeurs brutes dans cet ordre (ids pour les clés étrangères). lignes peut être un générateur :
+    il est consommé par lots de taille_lot, la mémoire reste bornée.
+    """
+    connection = connections[using]
+    implicites = _champs_implicites(modele, champs)
+    total = 0
+
+    if not _copy_disponible(connection):
+        attnames = [modele._meta.get_field(nom).attname for nom in champs]
+        for lot in _lots(lignes, taille_lot):
+            modele.objects.using(using).bulk_create(
+                [modele(**dict(zip(attnames, ligne))) for ligne in lot], batch_size=taille_lot)
+            total += len(lot)
+        return total
+
+    colonnes = [modele._meta.get_field(nom).column for nom in champs] + [field.column for field, _ in implicites]
+    suffixe = ''.join('\t' + _valeur_copy(valeur) for _, valeur in implicites) + '\n'
+    qn = connection.ops.quote_name
+    sql = f"COPY {qn(modele._meta.db_table)} ({', '.join(qn(c) for c in colonnes)}) FROM STDIN"
+
+    with connection.cursor() as cursor:
+        for lot in _lots(lignes, taille_lot):
+            tampon = io.StringIO()
+            tampon.writelines('\t'.join(map(_valeur_copy, ligne)) + suffixe for ligne in lot)
+            tampon.seek(0)
+            cursor.copy_expert(sql, tampon)
+            total += len(lot)
+    return total
@@ -0,0 +1,113 @@
+# gestion/management/commands/benchmark_requetes.py
+
+import statistics
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from gestion.loader import charger
+from gestion.models import Velo, Station, Location, Utilisateur
+from gestion.partitions import creer_partitions
+
+# Index ajoutés par la migration 0005 : --comparer les supprime le temps d'une transaction annulée.
+INDEX_0005 = ['location_velo_debut_idx', 'location_depart_debut_idx', 'location_arrivee_fin_idx', 'velo_dispo_idx']
+
+
+class Command(BaseCommand):
+    help = "Mesure les plans et les latences des requêtes de location et de télémétrie (avant / après index)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=20)
+        parser.add_argument('--locations', type=int, default=0,
+                            help="Complète la table avec des locations synthétiques jusqu'à ce nombre de lignes.")
+        parser.add_argument('--comparer', action='store_true',
+                            help="PostgreSQL : mesure aussi sans les index, dans une transaction annulée.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _requetes(self, rng):
+        """Requêtes représentatives, paramétrées par un vélo et une station tirés au hasard."""
+        velo_ids = list(Velo.objects.values_list('id', flat=True)[:10000])
+        station_ids = list(Station.objects.values_list('id', flat=True))
+        if not velo_ids or not station_ids:
+            return {}
+        velo_id = int(rng.choice(velo_ids))
+        station_id = int(rng.choice(station_ids))
+        fin = timezone.now()
+        debut = fin - timedelta(days=7)
+        return {
+            "locations d'un vélo (velo, date_debut)": Location.objects.filter(velo_id=velo_id).order_by('date_debut'),
+            "vélos disponibles, 1re page": Velo.objects.filter(statut='DISPO').order_by('id')[:50],
+            "départs d'une station sur 7 jours": Location.objects.filter(
+                station_depart_id=station_id, date_debut__range=(debut, fin)),
+            "arrivées d'une station sur 7 jours": Location.objects.filter(
+                station_arrivee_id=station_id, date_fin__range=(debut, fin)),
+        }
+
+    def _mesurer(self, requetes, repetitions, titre):
+        self.stdout.write(self.style.SUCCESS(f"=== {titre} ==="))
+        analyze = connection.vendor == 'postgresql'
+        for nom, queryset in requetes.items():
+            durees = []
+            for _ in range(repetitions):
+                t0 = time.perf_counter()
+                list(queryset.all())
+                durees.append((time.perf_counter() - t0) * 1000)
+            p95 = sorted(durees)[max(0, int(len(durees) * 0.95) - 1)]
+            self.stdout.write(f"--- {nom} : médiane {statistics.median(durees):.2f} ms, p95 {p95:.2f} ms")
+            self.stdout.write(queryset.explain(analyze=True) if analyze else queryset.explain())
+
+    def _completer_locations(self, cible, rng):
+        manquantes = cible - Location.objects.count()
+        velo_ids = np.array(Velo.objects.values_list('id', flat=True))
+        station_ids = np.array(Station.objects.values_list('id', flat=True))
+        utilisateur_ids = np.array(Utilisateur.objects.values_list('id', flat=True))
+        if manquantes <= 0 or not (len(velo_ids) and len(station_ids) and len(utilisateur_ids)):
+            return
+        self.stdout.write(f"Chargement de {manquantes} locations synthétiques...")
+        origine = timezone.now() - timedelta(days=365)
+        creer_partitions(origine, timezone.now())
+
+        def lignes():
+            for debut_lot in range(0, manquantes, 100000):
+                n = min(100000, manquantes - debut_lot)
+                secondes = rng.integers(0, 365 * 86400, n)
+                durees = rng.integers(10, 121, n)
+                for v, u, sd, sa, s, d in zip(rng.choice(velo_ids, n), rng.choice(utilisateur_ids, n),
+                                              rng.choice(station_ids, n), rng.choice(station_ids, n),
+                                              secondes.tolist(), durees.tolist()):
+                    date_debut = origine + timedelta(seconds=s)
+                    yield int(v), int(u), int(sd), int(sa), date_debut, date_debut + timedelta(minutes=d)
+
+        charger(Location, ('velo', 'utilisateur', 'station_depart', 'station_arrivee', 'date_debut', 'date_fin'),
+                lignes())
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE gestion_location, gestion_velo;")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        if options['locations']:
+            self._completer_locations(options['locations'], rng)
+
+        requetes = self._requetes(rng)
+        if not requetes:
+            self.stdout.write(self.style.ERROR("Aucun vélo ou aucune station : lancez 'generate_history'."))
+            return
+        self.stdout.write(f"{Location.objects.count()} locations, {Velo.objects.count()} vélos.")
+        self._mesurer(requetes, options['repetitions'], "Avec les index")
+
+        if options['comparer']:
+            if connection.vendor != 'postgresql':
+                self.stdout.write(self.style.WARNING("--comparer nécessite PostgreSQL (DDL transactionnel)."))
+                return
+            # DROP INDEX est transactionnel sur PostgreSQL : la transaction est annulée à la fin.
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in INDEX_0005:
+                        cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(index)};")
+                self._mesurer(requetes, options['repetitions'], "Sans les index")
+                transaction.set_rollback(True)
@@ -0,0 +1,75 @@
+# gestion/management/commands/calculer_itineraires.py
+
+import os
+import time
+from itertools import permutations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.itineraires import MARGE_DEGRES, Itineraires, Reseau, calculer_traces, chemin_par_defaut
+from gestion.models import Location, Station, Ville
+
+
+class Command(BaseCommand):
+    help = ("Calcule les itinéraires routiers entre les stations de chaque ville à partir d'un extrait OSM "
+            "local, pour generate_files --itineraires.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--osm', required=True, metavar='FICHIER',
+                            help="Extrait OpenStreetMap XML (.osm, .osm.gz ou .osm.bz2) couvrant les villes.")
+        parser.add_argument('--ville', action='append', dest='villes', metavar='NOM',
+                            help="Ville à traiter (répétable ; défaut : toutes).")
+        parser.add_argument('--sortie', default=chemin_par_defaut(), metavar='FICHIER',
+                            help="Fichier des itinéraires, complété s'il existe (défaut : SIMULATION['ITINERAIRES']).")
+        parser.add_argument('--paires-utilisees', action='store_true',
+                            help="Seulement les couples de stations déjà empruntés par une location "
+                                 "(défaut : tous les couples de stations de la ville).")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['osm']):
+            raise CommandError(f"Extrait OSM introuvable : {options['osm']}.")
+        villes = Ville.objects.order_by('nom')
+        if options['villes']:
+            villes = villes.filter(nom__in=options['villes'])
+            inconnues = set(options['villes']) - set(villes.values_list('nom', flat=True))
+            if inconnues:
+                raise CommandError(f"Ville(s) inconnue(s) : {', '.join(sorted(inconnues))}.")
+
+        sortie = options['sortie']
+        itineraires = Itineraires.charger(sortie) if os.path.exists(sortie) else Itineraires.vide()
+        for ville in villes:
+            stations = {station_id: (lat, lon) for station_id, lat, lon in
+                        Station.objects.filter(ville=ville).order_by('id').values_list('id', 'latitude', 'longitude')}
+            if len(stations) < 2:
+                continue
+            if options['paires_utilisees']:
+                paires = sorted(set(Location.objects.filter(station_depart__ville=ville)
+                                    .exclude(station_arrivee=None)
+                                    .values_list('station_depart_id', 'station_arrivee_id')))
+                paires = [(d, a) for d, a in paires if d != a and a in stations]
+            else:
+                paires = list(permutations(stations, 2))
+            if not paires:
+                continue
+
+            depart = time.perf_counter()
+            lats, lons = [lat for lat, _ in stations.values()], [lon for _, lon in stations.values()]
+            try:
+                reseau = Reseau.depuis_osm(options['osm'], min(lats) - MARGE_DEGRES, max(lats) + MARGE_DEGRES,
+                                           min(lons) - MARGE_DEGRES, max(lons) + MARGE_DEGRES)
+            except (ValueError, OSError) as erreur:
+                raise CommandError(str(erreur))
+            if not len(reseau):
+                self.stdout.write(self.style.WARNING(f"{ville.nom} : aucune voie cyclable dans l'extrait, ignorée."))
+                continue
+            traces, sans_chemin = calculer_traces(reseau, stations, paires)
+            itineraires = itineraires.completer(traces)
+            self.stdout.write(self.style.SUCCESS(
+                f"{ville.nom} : {len(traces)} itinéraires sur {len(reseau)} noeuds "
+                f"({time.perf_counter() - depart:.1f} s)."))
+            if sans_chemin:
+                self.stdout.write(self.style.WARNING(
+                    f"  {len(sans_chemin)} couple(s) sans chemin dans le réseau : ligne droite conservée."))
+
+        itineraires.enregistrer(sortie)
+        self.stdout.write(self.style.SUCCESS(f"{len(itineraires)} itinéraires enregistrés dans {sortie}."))
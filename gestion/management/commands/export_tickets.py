@@ -0,0 +1,50 @@
+# gestion/management/commands/export_tickets.py
+
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion.export import TAILLE_LOT, exporter_tickets
+from gestion.models import TicketSupport
+
+
+def _date(valeur):
+    try:
+        return timezone.make_aware(datetime.strptime(valeur, '%Y-%m-%d'))
+    except ValueError:
+        raise CommandError(f"Date invalide : {valeur} (format attendu AAAA-MM-JJ).")
+
+
+class Command(BaseCommand):
+    help = "Exporte les tickets de support en CSV (éventuellement gzip), en flux et avec reprise possible."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sortie', help="Fichier de sortie (défaut : output_data_v3/support_tickets.csv[.gz]).")
+        parser.add_argument('--gzip', action='store_true', help="Compresse la sortie en gzip.")
+        parser.add_argument('--depuis', metavar='AAAA-MM-JJ', help="Tickets créés à partir de ce jour.")
+        parser.add_argument('--jusqua', metavar='AAAA-MM-JJ', help="Tickets créés avant ce jour (exclu).")
+        parser.add_argument('--type', action='append', dest='types', choices=TicketSupport.TypeProbleme.values,
+                            help="Type de problème à exporter (répétable).")
+        parser.add_argument('--apres-id', type=int, default=0, help="N'exporte que les tickets d'id supérieur.")
+        parser.add_argument('--reprendre', action='store_true',
+                            help="Reprend un export interrompu (ou complète un export précédent) au dernier lot écrit.")
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT, help="Tickets lus et écrits par lot.")
+
+    def handle(self, *args, **options):
+        chemin = options['sortie'] or os.path.join(
+            settings.BASE_DIR, 'output_data_v3', 'support_tickets.csv' + ('.gz' if options['gzip'] else ''))
+        debut = _date(options['depuis']) if options['depuis'] else None
+        fin = _date(options['jusqua']) if options['jusqua'] else None
+        os.makedirs(os.path.dirname(os.path.abspath(chemin)), exist_ok=True)
+
+        exportes = 0
+        try:
+            for exportes in exporter_tickets(chemin, options['gzip'], options['reprendre'], options['apres_id'],
+                                             debut, fin, options['types'], options['taille_lot']):
+                self.stdout.write(f"{exportes} tickets exportés...")
+        except ValueError as erreur:
+            raise CommandError(str(erreur))
+        self.stdout.write(self.style.SUCCESS(f"{exportes} tickets exportés dans {chemin}."))
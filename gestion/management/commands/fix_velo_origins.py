@@ -1,30 +1,32 @@
 # gestion/management/commands/fix_velo_origins.py
-from django.core.management.base import BaseCommand
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
 from gestion.models import Velo, Station
+from gestion.reparation import CommandeReparation
+from gestion.versions import incrementer_apres_commit
 
 
-class Command(BaseCommand):
+class Command(CommandeReparation):
     help = "Corrige la station d'origine pour les vélos qui n'en ont pas."
 
-    def handle(self, *args, **options):
+    def preparer(self, options):
         # On prend la première station comme station par défaut si tout le reste échoue
-        default_station = Station.objects.first()
-        if not default_station:
+        self.default_station = Station.objects.order_by('pk').first()
+        if not self.default_station:
             self.stdout.write(self.style.ERROR("Aucune station n'existe, impossible de corriger."))
-            return
+            return False
+        return True
 
+    def a_corriger(self):
         # On cherche tous les vélos dont la station_origine est encore vide (NULL)
-        velos_a_corriger = Velo.objects.filter(station_origine__isnull=True)
-
-        self.stdout.write(f"Trouvé {velos_a_corriger.count()} vélos à corriger...")
+        return Velo.objects.filter(station_origine__isnull=True)
 
-        for velo in velos_a_corriger:
-            # On assigne la station actuelle comme station d'origine
-            # C'est la meilleure estimation qu'on puisse faire
-            if velo.station_actuelle:
-                velo.station_origine = velo.station_actuelle
-            else:
-                velo.station_origine = default_station
-            velo.save()
+    def corriger(self, lot):
+        # Un seul UPDATE par lot : la station actuelle est la meilleure estimation qu'on puisse faire,
+        # la station par défaut sert pour les vélos qui n'en ont pas.
+        return lot.update(station_origine=Coalesce(F('station_actuelle'), Value(self.default_station.pk)))
 
-        self.stdout.write(self.style.SUCCESS("Correction terminée !"))
\ No newline at end of file
+    def terminer(self, corrigees):
+        # update() ne passe pas par les signaux : la liste des vélos affiche la station d'origine.
+        incrementer_apres_commit('velo')
@@ -1,121 +1,325 @@
 # CODE FINAL v3.1 (période réduite) pour gestion/management/commands/generate_files_v3.py
 
 import os
-import json
-import random
-from datetime import datetime, timedelta
+import shutil
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
 
-from django.core.management.base import BaseCommand
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection
+from django.db.models import Min
 from django.utils import timezone
-from gestion.models import Velo, TicketSupport
+from gestion.export import exporter_tickets
+from gestion.flotte import capacite, usure, vieillir
+from gestion.itineraires import chemin_par_defaut, itineraires_du_fichier
+from gestion.loader import charger
+from gestion.models import EtatSimulation, Velo, Location, TicketSupport
+from gestion.aleatoire import FLUX_TELEMETRIE, ajouter_option_fin, ajouter_option_graine, fin_periode, generateur, graine
+from gestion.parallel import decouper_en_shards, executer_shards
+from gestion.scenario import ajouter_option_scenario, scenario_des_options
+from gestion.simulation import CycleBatterie, Simulation
+from gestion.telemetry import FORMATS, fusionner_partitions, get_writer, lire_jour, lister_jours
+from gestion.trajectory import Trajet, simuler_velo, simuler_velo_scalaire
+from gestion.versions import incrementer_apres_commit
+
+# 'evenements' : noyau à événements discrets (gestion/simulation.py), les autres moteurs simulent vélo par vélo.
+MOTEURS = ('evenements', 'vectoriel', 'scalaire')
+MOTEURS_PAR_VELO = {'vectoriel': simuler_velo, 'scalaire': simuler_velo_scalaire}
+VELOS_PAR_LOT = 500
+COLONNES_POINT = ('timestamp', 'statut', 'batterie', 'latitude', 'longitude')
+
+
+def _charger_trajets(velo, depuis=None):
+    """
+    (locations, trajets, position initiale) d'un vélo, ou None s'il n'a aucune station de référence.
+    Avec depuis (mode incrémental), seules les locations qui finissent après cette date sont lues.
+    """
+    # Une seule requête par vélo, coordonnées des stations comprises.
+    locations = Location.objects.filter(velo=velo)
+    if depuis is not None:
+        locations = locations.filter(date_fin__gt=depuis)
+    locations = list(locations.order_by('date_debut').values_list(
+        'date_debut', 'date_fin', 'station_depart__latitude', 'station_depart__longitude',
+        'station_arrivee__latitude', 'station_arrivee__longitude', 'utilisateur_id',
+        'station_depart_id', 'station_arrivee_id'))
+    trajets = [Trajet(*loc[:6], *loc[7:9]) for loc in locations]
+
+    current_station = velo.station_origine or velo.station_actuelle
+    if trajets:
+        return locations, trajets, (trajets[0].lat_depart, trajets[0].lon_depart)
+    if current_station:
+        return locations, trajets, (current_station.latitude, current_station.longitude)
+    return None
+
+
+def _points_anterieurs(dossier_reprise, velo_min, velo_max):
+    """
+    Mode incrémental : points déjà écrits pour les vélos velo_min..velo_max dans les partitions mises
+    de côté avant le run, par vélo. Ceux qui précèdent le point de reprise du vélo sont réécrits avant
+    les nouveaux, les partitions d'un jour étant réécrites en entier.
+    """
+    anciens = defaultdict(list)
+    for jour in lister_jours(dossier_reprise):
+        colonnes = lire_jour(dossier_reprise, jour, velo_min, velo_max)
+        velo_ids = colonnes['velo_id']
+        for velo_id, i0, i1 in zip(*_bornes_par_velo(velo_ids)):
+            anciens[velo_id].append(tuple(colonnes[nom][i0:i1] for nom in COLONNES_POINT))
+    return anciens
+
+
+def _bornes_par_velo(velo_ids):
+    # Les points d'une partition sont triés par vélo : une tranche [debut, fin) par vélo.
+    debuts = np.flatnonzero(np.r_[True, velo_ids[1:] != velo_ids[:-1]]) if len(velo_ids) else np.empty(0, int)
+    fins = np.r_[debuts[1:], len(velo_ids)]
+    return velo_ids[debuts].tolist(), debuts.tolist(), fins.tolist()
+
+
+def _generer_velos(shard, contexte, progression=None):
+    """
+    Simule et écrit la télémétrie d'une tranche contiguë de vélos (exécuté dans un worker si --workers > 1).
+    Renvoie (tickets, vélos ignorés, points d'arrêt), les tickets sous forme de tuples
+    (velo_id, utilisateur_id, date de l'arrivée qui l'a émis, batterie), les points d'arrêt de
+    (velo_id, timestamp, batterie, lat, lon, cycles_charge, sante_batterie).
+    Les vélos sont simulés par lots : une simulation à événements par lot (et par date de reprise en
+    mode incrémental), puis la télémétrie de chaque vélo est dérivée et écrite, dans l'ordre des vélos.
+    """
+    velo_ids, output_dir = shard
+    writer = get_writer(contexte['format'], output_dir)
+    moteur, fin, pas = contexte['moteur'], contexte['fin'], contexte['pas']
+    etats = contexte['etats']  # {velo_id: (telemetrie_jusqua, batterie, lat, lon)} en mode incrémental
+    itineraires = itineraires_du_fichier(contexte['itineraires']) if contexte['itineraires'] else None
+    tickets, ignores, arrets = [], [], []
+
+    velos = list(Velo.objects.filter(id__gte=velo_ids[0], id__lte=velo_ids[-1])
+                 .select_related('station_origine', 'station_actuelle').order_by('id'))
+    for debut_lot in range(0, len(velos), VELOS_PAR_LOT):
+        lot = velos[debut_lot:debut_lot + VELOS_PAR_LOT]
+        anciens = _points_anterieurs(contexte['reprise'], lot[0].id, lot[-1].id) if contexte['reprise'] else {}
+        groupes = defaultdict(list)
+        for i, velo in enumerate(lot, start=debut_lot):
+            etat = etats.get(velo.id)
+            groupes[etat[0] + pas if etat else contexte['debut']].append((i, velo, etat))
+
+        a_ecrire = []
+        for debut, membres in groupes.items():
+            simulation = Simulation(debut, fin + pas)
+            cycle = CycleBatterie(simulation, contexte['seed'], fin, pas, itineraires)
+            for i, velo, etat in membres:
+                if progression:
+                    progression(i, velo)
+                charge = _charger_trajets(velo, etat[0] if etat else contexte['depuis'])
+                if charge is None:
+                    ignores.append(velo.id)
+                    continue
+                locations, trajets, position_initiale = charge
+                if etat:
+                    position_initiale = etat[2:]
+                # Usure de départ : celle du run précédent en mode incrémental, une flotte neuve sinon.
+                etat_batterie = (velo.cycles_charge, velo.sante_batterie, etat[1]) if etat else \
+                    (velo.cycles_charge, velo.sante_batterie, 100.0) if etats else (0.0, 100.0, 100.0)
+                if moteur == 'evenements':
+                    cycle.ajouter_velo(velo.id, trajets, position_initiale,
+                                       *((etat[1], etat[0]) if etat else ()), capacite=capacite(etat_batterie[1]))
+                a_ecrire.append((i, velo.id, locations, trajets, position_initiale, debut, cycle, etat_batterie))
+            simulation.executer()
+
+        for _, velo_id, locations, trajets, position_initiale, debut, cycle, etat_batterie in \
+                sorted(a_ecrire, key=lambda v: v[0]):
+            if moteur == 'evenements':
+                chronologie = cycle.chronologie(velo_id)
+            else:
+                rng = generateur(contexte['seed'], FLUX_TELEMETRIE, velo_id)
+                parametres = {'itineraires': itineraires} if itineraires else {}
+                chronologie = MOTEURS_PAR_VELO[moteur](trajets, position_initiale, debut, fin, rng, pas=pas, **parametres)
+            tickets.extend((velo_id, locations[loc_idx][6], trajets[loc_idx].date_fin, batterie)
+                           for loc_idx, batterie in chronologie.tickets)
+            colonnes = (chronologie.timestamps, chronologie.statuts, chronologie.batteries,
+                        chronologie.lats, chronologie.lons)
+            if len(colonnes[0]):
+                cycles, sante = vieillir(*etat_batterie[:2], *usure(colonnes[2], etat_batterie[2]))
+                arrets.append((velo_id, int(colonnes[0][-1]), float(colonnes[2][-1]),
+                               float(colonnes[3][-1]), float(colonnes[4][-1]), cycles, sante))
+            if velo_id in anciens:
+                # Points antérieurs à la reprise du vélo seulement (une partition plus récente peut rester
+                # d'un run complet arrêté plus loin).
+                limite = int(debut.timestamp())
+                parties = [tuple(c[ancien[0] < limite] for c in ancien) for ancien in anciens[velo_id]]
+                colonnes = tuple(np.concatenate([partie[k] for partie in parties] + [colonnes[k]])
+                                 for k in range(len(colonnes)))
+            writer.write(velo_id, *colonnes)
+
+    writer.close()
+    return tickets, ignores, arrets
 
 
 class Command(BaseCommand):
-    help = "Génère les données IoT avec un fichier JSON par point de données, pour une période réduite."
+    help = "Génère les données IoT pour une période réduite (un fichier JSON par point, ou une partition par jour)."
 
-    def _interpolate_coords(self, start, end, ratio):
-        lat = start['lat'] + (end['lat'] - start['lat']) * ratio
-        lon = start['lon'] + (end['lon'] - start['lon']) * ratio
-        return lat, lon
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS,
+                            help="legacy : un fichier JSON par point ; ndjson / columnar : un fichier par jour "
+                                 "(défaut : celui du scénario, legacy sinon).")
+        parser.add_argument('--moteur', choices=MOTEURS, default='evenements',
+                            help="evenements : simulation à événements discrets, télémétrie dérivée ensuite ; "
+                                 "vectoriel : chronologie calculée vélo par vélo en NumPy ; scalaire : boucle de référence.")
+        ajouter_option_scenario(parser)
+        ajouter_option_graine(parser)
+        ajouter_option_fin(parser)
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Nombre de processus ; le résultat ne dépend pas de ce nombre.")
+        parser.add_argument('--incremental', action='store_true',
+                            help="Prolonge la télémétrie de chaque vélo depuis son dernier point (run précédent) "
+                                 "au lieu de tout régénérer ; moteur 'evenements' uniquement.")
+        parser.add_argument('--itineraires', nargs='?', const=chemin_par_defaut(), metavar='FICHIER',
+                            help="Fait suivre les rues aux trajets (fichier de calculer_itineraires, défaut : "
+                                 "SIMULATION['ITINERAIRES']) ; sans itinéraire connu, ligne droite.")
 
     def handle(self, *args, **options):
         self.stdout.write(
             self.style.SUCCESS("Début de la génération des fichiers (v3.1 - hiérarchique, période réduite)..."))
+        incremental = options['incremental']
+        if incremental and options['moteur'] != 'evenements':
+            raise CommandError("--incremental n'est disponible qu'avec le moteur 'evenements'.")
+        if options['itineraires'] and options['moteur'] == 'scalaire':
+            raise CommandError("--itineraires n'est pas disponible avec le moteur 'scalaire' (boucle de référence).")
+        if options['itineraires'] and not os.path.exists(options['itineraires']):
+            raise CommandError(f"Fichier d'itinéraires introuvable : {options['itineraires']} (lancez 'calculer_itineraires').")
+        scenario = scenario_des_options(options)
+        options['format'] = options['format'] or scenario.format
+
+        seed = graine(options)  # vérifiée avant d'effacer les tickets
 
         # --- Préparation ---
         output_dir = os.path.join(settings.BASE_DIR, 'output_data_v3')
         os.makedirs(output_dir, exist_ok=True)
-        TicketSupport.objects.all().delete()
+        if not incremental:
+            # Suppression en SQL : avec le signal post_delete des tickets, delete() chargerait chaque ticket.
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {TicketSupport._meta.db_table};")
 
-        # MODIFICATION : Date de début changée au 1er août 2025
-        start_sim = timezone.make_aware(datetime(2025, 8, 1))
-        end_sim = timezone.now()
-        time_step = timedelta(seconds=30)
+        self.stdout.write(f"Graine utilisée : {seed}")
 
-        all_velos = Velo.objects.all().prefetch_related('locations')
-        total_velos = all_velos.count()
+        # Période et pas du scénario (1er août 2025, 30 s par défaut).
+        contexte = {
+            'format': options['format'], 'moteur': options['moteur'], 'seed': seed,
+            'debut': scenario.debut_telemetrie, 'fin': fin_periode(options, scenario.fin),
+            'pas': scenario.pas, 'etats': {}, 'depuis': None, 'reprise': None,
+            'itineraires': options['itineraires'],
+        }
+        if incremental:
+            self._preparer_reprise(contexte, output_dir)
+
+        velo_ids = list(Velo.objects.order_by('id').values_list('id', flat=True))
+        total_velos = len(velo_ids)
 
         if total_velos == 0:
             self.stdout.write(self.style.ERROR("Aucun vélo trouvé. Lancez 'generate_history'."))
             return
 
-        all_tickets = []
-
-        # --- Boucle par vélo ---
-        for i, velo in enumerate(all_velos):
-            self.stdout.write(f"--- Traitement vélo {velo.id} ({i + 1}/{total_velos}) ---")
-
-            locations = list(velo.locations.order_by('date_debut'))
-
-            current_station = velo.station_origine
-            if not current_station: current_station = velo.station_actuelle
-            if locations: current_station = locations[0].station_depart
-            if not current_station:
-                self.stdout.write(self.style.WARNING(f"Vélo {velo.id} ignoré car sans station de référence."))
-                continue
-
-            current_time, batterie, loc_idx = start_sim, 100.0, 0
-
-            # --- Boucle temporelle ---
-            while current_time <= end_sim:
-                day_str = current_time.strftime('%Y-%m-%d')
-                day_folder = os.path.join(output_dir, day_str)
-                velo_folder = os.path.join(day_folder, f"velo_{velo.id}")
-                os.makedirs(velo_folder, exist_ok=True)
-
-                status, lat, lon = "disponible", current_station.latitude, current_station.longitude
+        try:
+            resultats = self._generer(velo_ids, output_dir, contexte, options)
+        except BaseException:
+            if contexte['reprise']:
+                # Les partitions mises de côté reprennent leur place : le run précédent reste intact.
+                for jour in lister_jours(contexte['reprise']):
+                    shutil.rmtree(os.path.join(output_dir, jour), ignore_errors=True)
+                    os.replace(os.path.join(contexte['reprise'], jour), os.path.join(output_dir, jour))
+                shutil.rmtree(contexte['reprise'])
+            raise
+        if contexte['reprise']:
+            shutil.rmtree(contexte['reprise'])
 
-                if loc_idx < len(locations):
-                    loc = locations[loc_idx]
-                    if loc.date_debut <= current_time < loc.date_fin:
-                        status = "en_location"
-                        trip_duration = (loc.date_fin - loc.date_debut).total_seconds()
-                        time_into_trip = (current_time - loc.date_debut).total_seconds()
-                        ratio = time_into_trip / trip_duration if trip_duration > 0 else 0
+        all_tickets, arrets = [], []
+        for tickets, ignores, arrets_shard in resultats:
+            for velo_id in ignores:
+                self.stdout.write(self.style.WARNING(f"Vélo {velo_id} ignoré car sans station de référence."))
+            all_tickets.extend(
+                (velo_id, utilisateur_id, TicketSupport.TypeProbleme.BATTERIE_FAIBLE, f"Batterie à {batterie:.1f}%",
+                 date)
+                for velo_id, utilisateur_id, date, batterie in tickets)
+            arrets.extend(arrets_shard)
+        EtatSimulation.objects.bulk_create(
+            [EtatSimulation(velo_id=velo_id, telemetrie_jusqua=datetime.fromtimestamp(ts, tz=dt_timezone.utc),
+                            batterie=batterie, latitude=lat, longitude=lon)
+             for velo_id, ts, batterie, lat, lon, _, _ in arrets],
+            batch_size=5000, update_conflicts=True, unique_fields=['velo'],
+            update_fields=['telemetrie_jusqua', 'batterie', 'latitude', 'longitude'])
+        # Batterie et usure au dernier pas, reportées sur les vélos (voir gestion/flotte.py).
+        Velo.objects.bulk_update(
+            [Velo(id=velo_id, batterie=batterie, cycles_charge=cycles, sante_batterie=sante)
+             for velo_id, _, batterie, _, _, cycles, sante in arrets],
+            ['batterie', 'cycles_charge', 'sante_batterie'], batch_size=5000)
 
-                        start_coords = {'lat': loc.station_depart.latitude, 'lon': loc.station_depart.longitude}
-                        end_coords = {'lat': loc.station_arrivee.latitude, 'lon': loc.station_arrivee.longitude}
-                        lat, lon = self._interpolate_coords(start_coords, end_coords, ratio)
+        # --- Création et Exportation des tickets de support ---
+        self.stdout.write("Création & Exportation des tickets de support...")
+        # Tickets datés de l'arrivée simulée, pas de l'heure du run : ils se classent avec l'historique.
+        charger(TicketSupport, ('velo', 'utilisateur', 'type_probleme', 'description', 'date_creation'), all_tickets)
+        incrementer_apres_commit('ticket')  # suppression, COPY et bulk_update ne passent pas par les signaux
+        incrementer_apres_commit('velo')
+        csv_path = os.path.join(output_dir, "support_tickets.csv")
+        # En mode incrémental, seuls les nouveaux tickets sont ajoutés à l'export existant.
+        try:
+            for _ in exporter_tickets(csv_path, reprendre=incremental):
+                pass
+        except ValueError as erreur:
+            # Export précédent fait par export_tickets avec d'autres filtres : on ne le complète pas.
+            raise CommandError(f"{erreur} Supprimez {csv_path}.reprise pour le réécrire en entier.")
 
-                        drain_per_step = (random.uniform(10, 25) / (trip_duration / 30)) if trip_duration > 0 else 0
-                        batterie = max(0, batterie - drain_per_step)
-                    elif current_time >= loc.date_fin:
-                        if batterie < 10.0 and random.random() < 0.8:
-                            all_tickets.append(TicketSupport(velo=velo, utilisateur=loc.utilisateur,
-                                                             type_probleme=TicketSupport.TypeProbleme.BATTERIE_FAIBLE,
-                                                             description=f"Batterie à {batterie:.1f}%"));
-                            batterie = 100.0
+        self.stdout.write(self.style.SUCCESS("Génération des fichiers (v3.1) terminée !"))
 
-                        current_station = loc.station_arrivee;
-                        loc_idx += 1
-                        lat, lon = current_station.latitude, current_station.longitude
+    def _preparer_reprise(self, contexte, output_dir):
+        """
+        Mode incrémental : chaque vélo reprend au pas qui suit son dernier point (EtatSimulation), sans
+        dépasser la fin de l'historique des locations. Les vélos sans point d'arrêt commencent au plus
+        récent des points d'arrêt. Les partitions à réécrire sont mises de côté dans contexte['reprise'].
+        """
+        etats = {velo_id: (jusqua, batterie, lat, lon) for velo_id, jusqua, batterie, lat, lon in
+                 EtatSimulation.objects.exclude(telemetrie_jusqua=None).values_list(
+                     'velo_id', 'telemetrie_jusqua', 'batterie', 'latitude', 'longitude')}
+        fin_historique = EtatSimulation.objects.aggregate(fin=Min('historique_jusqua'))['fin']
+        if fin_historique is not None and fin_historique < contexte['fin']:
+            contexte['fin'] = fin_historique
+        if not etats:
+            self.stdout.write(self.style.WARNING("Aucun point d'arrêt enregistré : génération complète."))
+            return
 
-                data_point = {
-                    'timestamp': current_time.isoformat(), 'velo_id': velo.id,
-                    'statut': status, 'batterie': round(batterie, 2),
-                    'position': {'latitude': lat, 'longitude': lon}
-                }
+        pas = contexte['pas']
+        contexte['etats'] = etats
+        contexte['depuis'] = max(etat[0] for etat in etats.values())
+        contexte['debut'] = contexte['depuis'] + pas
+        reprise = min(etat[0] for etat in etats.values()) + pas
+        self.stdout.write(f"Reprise de la télémétrie à partir du {timezone.localtime(reprise):%d/%m/%Y %H:%M:%S}, "
+                          f"jusqu'au {timezone.localtime(contexte['fin']):%d/%m/%Y %H:%M:%S}.")
+        if contexte['format'] == 'legacy':
+            return  # un fichier par point : les anciens fichiers restent en place
+        premier_jour = timezone.localtime(reprise).strftime('%Y-%m-%d')
+        contexte['reprise'] = tempfile.mkdtemp(prefix='reprise-', dir=output_dir)
+        for jour in lister_jours(output_dir):
+            if jour >= premier_jour:
+                os.replace(os.path.join(output_dir, jour), os.path.join(contexte['reprise'], jour))
 
-                filename = f"{current_time.strftime('%H-%M-%S')}.json"
-                file_path = os.path.join(velo_folder, filename)
+    def _generer(self, velo_ids, output_dir, contexte, options):
+        total_velos = len(velo_ids)
 
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data_point, f, indent=2)
+        # --- Boucle par vélo (ou par shard de vélos) ---
+        workers = options['workers']
+        if workers <= 1:
+            def progression(i, velo):
+                self.stdout.write(f"--- Traitement vélo {velo.id} ({i + 1}/{total_velos}) ---")
 
-                current_time += time_step
+            return [_generer_velos((velo_ids, output_dir), contexte, progression)]
 
-        # --- Création et Exportation des tickets de support ---
-        self.stdout.write("Création & Exportation des tickets de support...")
-        TicketSupport.objects.bulk_create(all_tickets)
-        csv_path = os.path.join(output_dir, "support_tickets.csv")
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['id', 'velo_id', 'utilisateur', 'type_probleme', 'description', 'date_creation'])
-            for ticket in TicketSupport.objects.all():
-                writer.writerow([
-                    ticket.id, ticket.velo_id, ticket.utilisateur.username if ticket.utilisateur else '',
-                    ticket.get_type_probleme_display(), ticket.description, ticket.date_creation.isoformat()
-                ])
-
-        self.stdout.write(self.style.SUCCESS("Génération des fichiers (v3.1) terminée !"))
\ No newline at end of file
+        # Chaque shard écrit ses propres partitions, réunies ensuite dans l'ordre des vélos.
+        dossier_shards = tempfile.mkdtemp(prefix='shards-', dir=output_dir)
+        shards = [(ids, output_dir if options['format'] == 'legacy' else os.path.join(dossier_shards, str(k)))
+                  for k, ids in enumerate(decouper_en_shards(velo_ids, workers))]
+        resultats = []
+        for k, resultat in enumerate(executer_shards(_generer_velos, shards, workers, contexte)):
+            resultats.append(resultat)
+            self.stdout.write(f"--- Shard {k + 1}/{len(shards)} terminé ({len(shards[k][0])} vélos) ---")
+        fusionner_partitions(options['format'], [dossier for _, dossier in shards], output_dir)
+        shutil.rmtree(dossier_shards)
+        return resultats
@@ -1,107 +1,290 @@
 # CODE FINAL v2.5 (Période 28/08 + Reset IDs) pour gestion/management/commands/generate_history.py
 
-import random
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 
 from django.core.management.base import BaseCommand
 from django.db import transaction, connection
+from django.db.models import Max
 from django.utils import timezone
-from django.contrib.auth.hashers import make_password
-from faker import Faker
 
-from gestion.models import Velo, Station, Location, Utilisateur, Ville, TicketSupport
-from gestion.weather_service import MockWeatherService
+from gestion.diffusion import diffuser
+from gestion.disponibilite import reconstruire
+from gestion.loader import TAILLE_LOT, charger
+from gestion.models import EtatSimulation, Velo, Station, Location, Utilisateur, Ville
+from gestion.analytique import rafraichir
+from gestion.aleatoire import ajouter_option_fin, ajouter_option_graine, fin_periode, graine
+from gestion.parallel import decouper_en_shards, executer_shards
+from gestion.partitions import creer_partitions
+from gestion.scenario import ajouter_option_scenario, scenario_des_options
+from gestion.simulation import DEBUT_LOCATION, CycleLocations, Simulation
+from gestion.utilisateurs import CHAMPS as CHAMPS_UTILISATEUR, generer_utilisateurs
+from gestion.versions import incrementer_apres_commit
+from gestion.weather_service import get_weather_service
+
+VELOS_PAR_SHARD = 100
+CHAMPS_LOCATION = ('velo', 'utilisateur', 'station_depart', 'station_arrivee', 'date_debut', 'date_fin')
+
+
+def _simuler_velos(shard, contexte):
+    """
+    Simule l'historique d'une tranche de vélos (exécuté dans un worker si --workers > 1).
+    shard est une liste de (velo_id, station_actuelle_id, ville_id, reprise, prochain_depart), les deux
+    derniers à None hors mode incrémental ; le calcul ne touche pas à la base.
+    Renvoie une liste de (velo_id, locations, station finale, prochain départ), une location étant
+    (utilisateur_id, station_depart_id, station_arrivee_id, date_debut, date_fin).
+    """
+    simulation = Simulation(contexte['start_date'], contexte['end_date'])
+    cycle = CycleLocations(simulation, contexte['villes'], contexte['utilisateurs'], get_weather_service(),
+                           contexte['seed'], **contexte['locations'])
+    for velo_id, current_station, ville_id, reprise, prochain_depart in shard:
+        cycle.ajouter_velo(velo_id, current_station, ville_id, reprise, prochain_depart)
+    simulation.executer()
+    return [(velo_id, cycle.locations[velo_id], cycle.stations[velo_id], cycle.prochains_departs[velo_id])
+            for velo_id, *_ in shard]
+
+
+class TamponLocations:
+    """
+    Accumule les locations, les vélos à mettre à jour et leur point d'arrêt (EtatSimulation, à la date
+    fin), et les enregistre par lots en mesurant le débit.
+    """
+
+    def __init__(self, taille_lot, stdout, fin):
+        self.taille_lot = taille_lot
+        self.stdout = stdout
+        self.fin = fin
+        self.locations, self.velos, self.etats = [], [], []
+        self.total = 0
+        self.debut = time.perf_counter()
+
+    def ajouter(self, velo_id, locations, station_finale, prochain_depart):
+        self.locations.extend((velo_id,) + location for location in locations)
+        self.velos.append(Velo(id=velo_id, station_actuelle_id=station_finale))
+        self.etats.append(EtatSimulation(velo_id=velo_id, historique_jusqua=self.fin, prochain_depart=prochain_depart))
+        if len(self.locations) >= self.taille_lot:
+            self.vider()
+
+    def vider(self):
+        if self.locations:
+            self.total += charger(Location, CHAMPS_LOCATION, self.locations, taille_lot=self.taille_lot)
+            debit = self.total / max(time.perf_counter() - self.debut, 1e-9)
+            self.stdout.write(f"  {self.total} locations enregistrées ({debit:.0f} lignes/s)...")
+        if self.velos:
+            Velo.objects.bulk_update(self.velos, ['station_actuelle'], batch_size=self.taille_lot)
+        if self.etats:
+            # Les champs de la télémétrie, tenus par generate_files, ne sont pas touchés.
+            EtatSimulation.objects.bulk_create(
+                self.etats, batch_size=self.taille_lot, update_conflicts=True, unique_fields=['velo'],
+                update_fields=['historique_jusqua', 'prochain_depart'])
+        self.locations, self.velos, self.etats = [], [], []
 
 
 class Command(BaseCommand):
-    help = "Génère 500 utilisateurs et un historique de locations (période très courte) avec des IDs réinitialisés."
+    help = ("Génère les utilisateurs et les vélos du scénario (500 utilisateurs et 20 vélos par station par "
+            "défaut) et un historique de locations avec des IDs réinitialisés.")
+
+    def add_arguments(self, parser):
+        ajouter_option_scenario(parser)
+        ajouter_option_graine(parser)
+        ajouter_option_fin(parser)
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Nombre de processus simulant les vélos en parallèle.")
+        parser.add_argument('--batch-size', type=int, default=TAILLE_LOT,
+                            help="Nombre de locations envoyées par COPY (ou bulk_create hors PostgreSQL).")
+        parser.add_argument('--incremental', action='store_true',
+                            help="Au lieu de tout régénérer, prolonge l'historique de chaque vélo depuis la fin "
+                                 "du run précédent jusqu'à --fin.")
+        parser.add_argument('--temps-reel', action='store_true',
+                            help="Au lieu de régénérer l'historique, fait vivre la flotte existante à partir de "
+                                 "maintenant : chaque location est enregistrée en base à son heure.")
+        parser.add_argument('--duree', type=float, default=24.0,
+                            help="Avec --temps-reel : durée simulée, en heures.")
+        parser.add_argument('--acceleration', type=float, default=60.0,
+                            help="Avec --temps-reel : nombre de secondes simulées par seconde réelle.")
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        self.scenario = scenario_des_options(options)
+        if options['temps_reel']:
+            return self._temps_reel(options)
+        if options['incremental']:
+            return self._prolonger(options)
+        return self._generer(options)
+
+    def _villes(self):
+        # La liste des stations de chaque ville est construite une seule fois.
+        villes = {ville.id: (ville.nom, []) for ville in Ville.objects.all()}
+        for station_id, ville_id in Station.objects.values_list('id', 'ville_id'):
+            villes[ville_id][1].append(station_id)
+        return villes
+
+    def _temps_reel(self, options):
+        """
+        Simulation en temps réel (accéléré) sur les vélos existants. Chaque événement est écrit en base
+        à son heure, hors transaction globale, via save() : les signaux tiennent à jour les disponibilités
+        et les caches. L'état du vélo et sa position (la station de départ ou d'arrivée) sont publiés sur
+        le canal PostgreSQL écouté par les processus ASGI du flux temps réel (gestion/canal.py ; sans
+        PostgreSQL, le flux ne reçoit rien de cette commande).
+        """
+        seed = graine(options)
+        utilisateurs = list(Utilisateur.objects.filter(is_superuser=False).values_list('id', flat=True))
+        velos = list(Velo.objects.exclude(station_actuelle=None).exclude(station_origine=None).order_by('id')
+                     .values_list('id', 'station_actuelle_id', 'station_origine__ville_id'))
+        if not utilisateurs or not velos:
+            self.stdout.write(self.style.ERROR("Aucun vélo ou aucun utilisateur : lancez d'abord 'generate_history'."))
+            return
+
+        debut = timezone.now()
+        simulation = Simulation(debut, debut + timedelta(hours=options['duree']))
+        creer_partitions(simulation.debut, simulation.fin)
+        stations = {station_id: (lat, lon, ville) for station_id, lat, lon, ville in
+                    Station.objects.values_list('id', 'latitude', 'longitude', 'ville__nom')}
+
+        def publier_position(velo, date):
+            # Même format que le rejeu de la télémétrie (gestion/diffusion.py).
+            lat, lon, ville = stations[velo.station_actuelle_id]
+            diffuser([{'type': 'position', 'velo_id': velo.pk, 'ville': ville, 'timestamp': int(date.timestamp()),
+                       'statut': 'en_location' if velo.statut == Velo.StatutVelo.EN_LOCATION else 'disponible',
+                       'batterie': round(velo.batterie, 2), 'latitude': lat, 'longitude': lon}])
+
+        def enregistrer(type_evenement, velo_id, location):
+            utilisateur_id, station_depart, station_arrivee, date_debut, date_fin = location
+            velo = Velo.objects.get(pk=velo_id)
+            if type_evenement == DEBUT_LOCATION:
+                velo.statut = Velo.StatutVelo.EN_LOCATION
+                velo.save(update_fields=['statut'])
+                publier_position(velo, date_debut)
+                return
+            Location.objects.create(velo=velo, utilisateur_id=utilisateur_id, station_depart_id=station_depart,
+                                    station_arrivee_id=station_arrivee, date_debut=date_debut, date_fin=date_fin)
+            velo.statut, velo.station_actuelle_id = Velo.StatutVelo.DISPONIBLE, station_arrivee
+            velo.save(update_fields=['statut', 'station_actuelle'])
+            publier_position(velo, date_fin)
+            # Point d'arrêt pour --incremental : l'historique de ce vélo est complet jusqu'à cette arrivée.
+            EtatSimulation.objects.update_or_create(
+                velo_id=velo_id, defaults={'historique_jusqua': date_fin, 'prochain_depart': None})
+            self.stdout.write(f"  {date_fin:%d/%m %H:%M} vélo {velo_id} : station {station_depart} -> {station_arrivee}")
+
+        cycle = CycleLocations(simulation, self._villes(), utilisateurs, get_weather_service(), seed,
+                               observateur=enregistrer, **self.scenario.parametres_locations())
+        for velo_id, station_id, ville_id in velos:
+            cycle.ajouter_velo(velo_id, station_id, ville_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Simulation temps réel de {len(velos)} vélos sur {options['duree']} h (x{options['acceleration']:g}), "
+            f"graine {seed}..."))
+        nb_evenements = simulation.executer(temps_reel=True, acceleration=options['acceleration'])
+        self.stdout.write(self.style.SUCCESS(f"Simulation terminée : {nb_evenements} événements."))
+
+    @transaction.atomic
+    def _generer(self, options):
+        seed = graine(options)  # vérifiée avant de vider les tables
         self.stdout.write(self.style.SUCCESS("Début de la simulation (v2.5 - période 28/08 + reset IDs)..."))
 
         # --- ÉTAPE 1 : Nettoyage Propre de la Base de Données ---
         self.stdout.write("Nettoyage et réinitialisation des tables de simulation...")
         with connection.cursor() as cursor:
+            # Sur la table partitionnée, TRUNCATE vide aussi toutes ses partitions (un seul verrou, pris
+            # de toute façon par le CASCADE depuis gestion_velo).
             cursor.execute(
-                "TRUNCATE TABLE gestion_location, gestion_velo, gestion_ticketsupport, gestion_utilisateur RESTART IDENTITY CASCADE;")
-
-        # --- ÉTAPE 2 : Création des 500 utilisateurs ---
-        self.stdout.write("Création de 500 utilisateurs de test...")
-        faker = Faker('fr_FR');
-        utilisateurs_a_creer = [];
-        noms_utilisateurs_existants = set(Utilisateur.objects.values_list('username', flat=True))
-        while len(utilisateurs_a_creer) < 500:
-            profil = faker.simple_profile();
-            username = profil['username']
-            if username not in noms_utilisateurs_existants:
-                noms_utilisateurs_existants.add(username)
-                utilisateurs_a_creer.append(
-                    Utilisateur(username=username, email=profil['mail'], first_name=faker.first_name(),
-                                last_name=faker.last_name(), password=make_password('password123')))
-        Utilisateur.objects.bulk_create(utilisateurs_a_creer)
-        self.stdout.write(self.style.SUCCESS("500 utilisateurs de test créés."))
+                "TRUNCATE TABLE gestion_location, gestion_velo, gestion_ticketsupport, gestion_utilisateur, "
+                "gestion_fluxhorairestation, gestion_trajetjournalier RESTART IDENTITY CASCADE;")
+
+        self.stdout.write(f"Graine utilisée : {seed}")
+
+        # --- ÉTAPE 2 : Création des utilisateurs ---
+        nb_utilisateurs = self.scenario.utilisateurs_historique
+        self.stdout.write(f"Création de {nb_utilisateurs} utilisateurs de test...")
+        charger(Utilisateur, CHAMPS_UTILISATEUR, generer_utilisateurs(nb_utilisateurs, seed, options['workers']))
+        self.stdout.write(self.style.SUCCESS(f"{nb_utilisateurs} utilisateurs de test créés."))
 
         # --- ÉTAPE 3 : Création des vélos ---
         stations = list(Station.objects.all())
         if not stations: self.stdout.write(
             self.style.ERROR("Aucune station trouvée. Lancez 'populate_base_data'.")); return
-        self.stdout.write("Création de 20 vélos par station...")
-        for station in stations:
-            for _ in range(20): Velo.objects.create(station_origine=station, station_actuelle=station)
+        velos_par_station = self.scenario.velos_par_station
+        self.stdout.write(f"Création de {velos_par_station} vélos par station...")
+        charger(Velo, ('station_origine', 'station_actuelle'),
+                ((station.id, station.id) for station in stations for _ in range(velos_par_station)))
 
         # --- ÉTAPE 4 : Génération de l'historique ---
-        utilisateurs = list(Utilisateur.objects.filter(is_superuser=False));
-        weather_service = MockWeatherService()
+        # Période de simulation : début du scénario (28 août 2025 par défaut) jusqu'à --fin.
+        start_date = self.scenario.debut_historique
+        end_date = fin_periode(options, self.scenario.fin)
 
-        # --- MODIFICATION PRINCIPALE : Période de simulation ---
-        # La date de début est maintenant le 28 août 2025
-        start_date = timezone.make_aware(datetime(2025, 8, 28))
-        end_date = timezone.now()
-        # --- FIN DE LA MODIFICATION ---
+        velos = [(velo_id, station_id, ville_id, None, None) for velo_id, station_id, ville_id in
+                 Velo.objects.order_by('id').values_list('id', 'station_actuelle_id', 'station_origine__ville_id')]
+        self.stdout.write(
+            f"Génération de l'historique pour {len(velos)} vélos du {start_date.date()} à aujourd'hui...")
+        self._simuler(velos, seed, start_date, end_date, options)
+        self.stdout.write(self.style.SUCCESS("Historique complet (v2.5) généré avec succès !"))
 
-        all_velos = Velo.objects.all().select_related('station_origine__ville');
-        total_velos = all_velos.count()
+    @transaction.atomic
+    def _prolonger(self, options):
+        """
+        Mode --incremental : sans rien effacer, prolonge l'historique de chaque vélo depuis son point
+        d'arrêt (EtatSimulation) jusqu'à --fin. Relancé chaque jour, un run ne simule qu'une journée.
+        """
+        seed = graine(options)
+        self.stdout.write(f"Graine utilisée : {seed}")
+        end_date = fin_periode(options, self.scenario.fin)
+        velos = list(Velo.objects.exclude(station_actuelle=None).exclude(station_origine=None).order_by('id')
+                     .values_list('id', 'station_actuelle_id', 'station_origine__ville_id',
+                                  'etat_simulation__historique_jusqua', 'etat_simulation__prochain_depart'))
+        if not velos or not Utilisateur.objects.filter(is_superuser=False).exists():
+            self.stdout.write(self.style.ERROR("Aucun vélo ou aucun utilisateur : lancez d'abord 'generate_history'."))
+            return
+
+        # Vélos sans point d'arrêt (historique antérieur à EtatSimulation) : fin de leur dernière location.
+        sans_etat = [velo[0] for velo in velos if velo[3] is None]
+        dernieres = {}
+        if sans_etat:
+            locations = Location.objects.order_by()
+            if len(sans_etat) < len(velos):
+                locations = locations.filter(velo_id__in=sans_etat)
+            dernieres = dict(locations.values('velo_id').annotate(fin=Max('date_fin')).values_list('velo_id', 'fin'))
+        debut_defaut = self.scenario.debut_historique
+        velos = [(velo_id, station_id, ville_id, reprise or dernieres.get(velo_id, debut_defaut), prochain_depart)
+                 for velo_id, station_id, ville_id, reprise, prochain_depart in velos]
+        velos = [velo for velo in velos if velo[3] < end_date]
+        if not velos:
+            self.stdout.write(self.style.SUCCESS(f"Historique déjà à jour au {end_date:%d/%m/%Y %H:%M}."))
+            return
+
+        start_date = min(velo[3] for velo in velos)
         self.stdout.write(
-            f"Génération de l'historique pour {total_velos} vélos du {start_date.date()} à aujourd'hui...")
-
-        for i, velo in enumerate(all_velos):
-            if i % 50 == 0: self.stdout.write(f"  Traitement du vélo {i}/{total_velos}...")
-
-            velo_ville = velo.station_origine.ville;
-            stations_de_la_ville = list(Station.objects.filter(ville=velo_ville))
-            current_time = start_date;
-            current_station = velo.station_actuelle
-
-            while current_time < end_date:
-                temps_repos_heures = random.uniform(1, 48)
-                potential_start_time = current_time + timedelta(hours=temps_repos_heures)
-                if potential_start_time >= end_date: break
-
-                weather = weather_service.get_weather(velo_ville.nom, potential_start_time)
-                if weather['condition'] == 'pluie':
-                    current_time = potential_start_time + timedelta(hours=1);
-                    continue
-
-                heure_depart = potential_start_time;
-                station_depart = current_station
-                stations_possibles = [s for s in stations_de_la_ville if s.id != station_depart.id]
-                if not stations_possibles:
-                    current_time = heure_depart + timedelta(days=1);
-                    continue
-
-                station_arrivee = random.choice(stations_possibles)
-                duree_location_minutes = random.randint(10, 120)
-                heure_fin = heure_depart + timedelta(minutes=duree_location_minutes)
-                if heure_fin >= end_date: break
-
-                Location.objects.create(velo=velo, utilisateur=random.choice(utilisateurs),
-                                        station_depart=station_depart, station_arrivee=station_arrivee,
-                                        date_debut=heure_depart, date_fin=heure_fin)
-                current_time = heure_fin;
-                current_station = station_arrivee
-
-            velo.station_actuelle = current_station;
-            velo.save()
-
-        self.stdout.write(self.style.SUCCESS("Historique complet (v2.5) généré avec succès !"))
\ No newline at end of file
+            f"Prolongation de l'historique de {len(velos)} vélos, du {start_date:%d/%m/%Y %H:%M} "
+            f"au {end_date:%d/%m/%Y %H:%M}...")
+        self._simuler(velos, seed, start_date, end_date, options)
+        self.stdout.write(self.style.SUCCESS("Historique prolongé avec succès !"))
+
+    def _simuler(self, velos, seed, start_date, end_date, options):
+        """Simule et enregistre l'historique des vélos (voir _simuler_velos) entre start_date et end_date."""
+        for nom in creer_partitions(start_date, end_date):
+            self.stdout.write(f"Partition {nom} créée.")
+
+        utilisateurs = list(Utilisateur.objects.filter(is_superuser=False).values_list('id', flat=True))
+        contexte = {'utilisateurs': utilisateurs, 'villes': self._villes(), 'seed': seed,
+                    'start_date': start_date, 'end_date': end_date,
+                    'locations': self.scenario.parametres_locations()}
+        total_velos = len(velos)
+
+        # Les vélos sont simulés par shards (en parallèle si --workers > 1) et enregistrés au fil de l'eau,
+        # dans l'ordre des vélos : les IDs des locations ne dépendent pas du nombre de workers.
+        workers = options['workers']
+        shards = decouper_en_shards(velos, max(workers, -(-total_velos // VELOS_PAR_SHARD)))
+        tampon = TamponLocations(options['batch_size'], self.stdout, end_date)
+        velos_simules = 0
+        for k, resultats_shard in enumerate(executer_shards(_simuler_velos, shards, workers, contexte)):
+            for resultat in resultats_shard:
+                tampon.ajouter(*resultat)
+            velos_simules += len(shards[k])
+            self.stdout.write(f"  Traitement du vélo {velos_simules}/{total_velos}...")
+        tampon.vider()
+        # Agrégats des tableaux de bord (gestion/analytique.py), recalculés sur la seule période simulée.
+        for _, _, flux, trajets in rafraichir(start_date, end_date):
+            self.stdout.write(f"  Agrégats : {flux} flux horaires, {trajets} couples origine-destination.")
+        # COPY et bulk_update ne passent pas par les signaux : disponibilités et caches sont mis à jour ici.
+        reconstruire()
+        incrementer_apres_commit('velo')
+        incrementer_apres_commit('location')
+        incrementer_apres_commit('ticket')
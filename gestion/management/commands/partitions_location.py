@@ -0,0 +1,52 @@
+# gestion/management/commands/partitions_location.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from gestion.partitions import creer_partitions, detacher_partitions, est_partitionnee, lister_partitions, mois_de, \
+    mois_suivant
+
+
+class Command(BaseCommand):
+    help = "Gère les partitions mensuelles de gestion_location : création des mois à venir, détachement des anciens."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mois-a-venir', type=int, default=3,
+                            help="Crée les partitions du mois courant et des N mois suivants.")
+        parser.add_argument('--detacher-avant', metavar='AAAA-MM',
+                            help="Détache les partitions des mois antérieurs à ce mois (archives autonomes).")
+        parser.add_argument('--supprimer', action='store_true',
+                            help="Avec --detacher-avant : supprime les partitions au lieu de les garder en archive.")
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if not est_partitionnee(cursor):
+                raise CommandError("gestion_location n'est pas partitionnée (PostgreSQL et migration 0006 requis).")
+
+        maintenant = timezone.now()
+        dernier = mois_de(maintenant)
+        for _ in range(options['mois_a_venir']):
+            dernier = mois_suivant(dernier)
+        fin = datetime(dernier[0], dernier[1], 1, tzinfo=maintenant.tzinfo)
+        for nom in creer_partitions(maintenant, fin):
+            self.stdout.write(f"Partition créée : {nom}")
+
+        if options['detacher_avant']:
+            try:
+                avant = timezone.make_aware(datetime.strptime(options['detacher_avant'], '%Y-%m'))
+            except ValueError:
+                raise CommandError("--detacher-avant attend un mois au format AAAA-MM.")
+            action = "supprimée" if options['supprimer'] else "détachée"
+            for nom in detacher_partitions(avant, supprimer=options['supprimer']):
+                self.stdout.write(self.style.WARNING(f"Partition {action} : {nom}"))
+
+        with connection.cursor() as cursor:
+            partitions = lister_partitions(cursor)
+        if partitions:
+            premier, dernier = partitions[0][0], partitions[-1][0]
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(partitions)} partitions, de {premier[0]}-{premier[1]:02d} à {dernier[0]}-{dernier[1]:02d}."))
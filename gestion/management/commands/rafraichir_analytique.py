@@ -0,0 +1,46 @@
+# gestion/management/commands/rafraichir_analytique.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion.analytique import JOURS_PAR_LOT, periode_a_rafraichir, rafraichir
+
+
+def _date(valeur):
+    try:
+        return timezone.make_aware(datetime.strptime(valeur, '%Y-%m-%d'))
+    except ValueError:
+        raise CommandError(f"Date invalide : {valeur} (format attendu AAAA-MM-JJ).")
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les agrégats des locations (flux horaires par station, matrice origine-destination "
+            "par jour) ; par défaut depuis le dernier jour agrégé.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depuis', metavar='AAAA-MM-JJ', help="Premier jour à recalculer.")
+        parser.add_argument('--jusqua', metavar='AAAA-MM-JJ', help="Dernier jour à recalculer (inclus).")
+        parser.add_argument('--jours-par-lot', type=int, default=JOURS_PAR_LOT,
+                            help="Nombre de jours recalculés par transaction.")
+
+    def handle(self, *args, **options):
+        periode = periode_a_rafraichir()
+        if periode is None:
+            self.stdout.write(self.style.WARNING("Aucune location : rien à agréger."))
+            return
+        debut = _date(options['depuis']) if options['depuis'] else periode[0]
+        fin = _date(options['jusqua']) if options['jusqua'] else periode[1]
+        if fin < debut:
+            raise CommandError("--jusqua doit suivre --depuis.")
+
+        self.stdout.write(f"Agrégation des locations du {timezone.localtime(debut):%d/%m/%Y} "
+                          f"au {timezone.localtime(fin):%d/%m/%Y}...")
+        total_flux = total_trajets = 0
+        for lot_debut, lot_fin, flux, trajets in rafraichir(debut, fin, max(options['jours_par_lot'], 1)):
+            total_flux, total_trajets = total_flux + flux, total_trajets + trajets
+            self.stdout.write(f"  Du {lot_debut:%d/%m/%Y} au {lot_fin:%d/%m/%Y} exclu : {flux} flux horaires, "
+                              f"{trajets} couples origine-destination.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Agrégats à jour : {total_flux} flux horaires, {total_trajets} couples origine-destination par jour."))
@@ -0,0 +1,15 @@
+# gestion/management/commands/reconstruire_disponibilite.py
+
+from django.core.management.base import BaseCommand
+
+from gestion.disponibilite import reconstruire
+from gestion.versions import incrementer_apres_commit
+
+
+class Command(BaseCommand):
+    help = "Recalcule entièrement la table DisponibiliteStation à partir des vélos."
+
+    def handle(self, *args, **options):
+        lignes = reconstruire()
+        incrementer_apres_commit('velo')
+        self.stdout.write(self.style.SUCCESS(f"Disponibilités reconstruites : {lignes} compteurs (station, statut)."))
@@ -0,0 +1,75 @@
+# gestion/management/commands/reequilibrer.py
+
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from gestion.disponibilite import reconstruire
+from gestion.models import Velo, Ville
+from gestion.reequilibrage import CIBLES, planifier
+from gestion.versions import incrementer_apres_commit
+
+
+def _date(valeur):
+    try:
+        return timezone.make_aware(datetime.strptime(valeur, '%Y-%m-%d'))
+    except ValueError:
+        raise CommandError(f"Date invalide : {valeur} (format attendu AAAA-MM-JJ).")
+
+
+class Command(BaseCommand):
+    help = "Calcule, ville par ville, les transferts de vélos qui ramènent chaque station à son niveau cible."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ville', action='append', dest='villes', metavar='NOM',
+                            help="Ville à rééquilibrer (répétable ; défaut : toutes).")
+        parser.add_argument('--cible', choices=CIBLES, default='origine',
+                            help="origine : répartition d'origine de la flotte ; demande : part des départs "
+                                 "de chaque station (agrégats de rafraichir_analytique).")
+        parser.add_argument('--depuis', metavar='AAAA-MM-JJ', help="Avec --cible demande : début de la période.")
+        parser.add_argument('--jusqua', metavar='AAAA-MM-JJ', help="Avec --cible demande : fin de la période (exclue).")
+        parser.add_argument('--appliquer', action='store_true',
+                            help="Déplace réellement les vélos disponibles (simulation d'une tournée).")
+
+    def handle(self, *args, **options):
+        villes = Ville.objects.order_by('nom')
+        if options['villes']:
+            villes = villes.filter(nom__in=options['villes'])
+            inconnues = set(options['villes']) - set(villes.values_list('nom', flat=True))
+            if inconnues:
+                raise CommandError(f"Ville(s) inconnue(s) : {', '.join(sorted(inconnues))}.")
+        debut = _date(options['depuis']) if options['depuis'] else None
+        fin = _date(options['jusqua']) if options['jusqua'] else None
+
+        with transaction.atomic():
+            total_velos = 0
+            for ville in villes:
+                depart = time.perf_counter()
+                transferts, disponibles, ecart = planifier(ville.id, options['cible'], debut, fin)
+                duree = time.perf_counter() - depart
+                deplaces = sum(t.nombre for t in transferts)
+                velos_km = sum(t.nombre * t.distance_km for t in transferts)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{ville.nom} : {disponibles} vélos disponibles, {deplaces} à déplacer en {len(transferts)} "
+                    f"transferts ({velos_km:.1f} vélos x km, calculé en {duree * 1000:.0f} ms)."))
+                for transfert in transferts:
+                    self.stdout.write(f"  Station {transfert.station_source} -> {transfert.station_cible} : "
+                                      f"{transfert.nombre} vélo(s), {transfert.distance_km:.2f} km")
+                    if options['appliquer']:
+                        self._deplacer(transfert)
+                total_velos += deplaces
+
+            if options['appliquer'] and total_velos:
+                # update() ne passe pas par les signaux : disponibilités et caches sont mis à jour ici.
+                reconstruire()
+                incrementer_apres_commit('velo')
+                self.stdout.write(self.style.SUCCESS(f"{total_velos} vélos déplacés."))
+
+    def _deplacer(self, transfert):
+        ids = list(Velo.objects.filter(station_actuelle_id=transfert.station_source,
+                                       statut=Velo.StatutVelo.DISPONIBLE)
+                   .order_by('id').values_list('id', flat=True)[:transfert.nombre])
+        Velo.objects.filter(id__in=ids).update(station_actuelle_id=transfert.station_cible)
@@ -0,0 +1,52 @@
+# gestion/management/commands/risques_maintenance.py
+
+import csv
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion.flotte import FENETRE_JOURS, Risque, scores_risque
+
+
+def _date(valeur):
+    try:
+        return timezone.make_aware(datetime.strptime(valeur, '%Y-%m-%d'))
+    except ValueError:
+        raise CommandError(f"Date invalide : {valeur} (format attendu AAAA-MM-JJ).")
+
+
+class Command(BaseCommand):
+    help = ("Classe toute la flotte par risque de maintenance (usure de la batterie, tickets, usage récent) "
+            "et affiche les vélos à contrôler en priorité.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help="Nombre de vélos affichés (0 : tous).")
+        parser.add_argument('--date', metavar='AAAA-MM-JJ', help="Date du classement (défaut : maintenant).")
+        parser.add_argument('--fenetre', type=int, default=FENETRE_JOURS,
+                            help="Jours de tickets récents et d'usage récent pris en compte.")
+        parser.add_argument('--inclure-maintenance', action='store_true',
+                            help="Classe aussi les vélos déjà en maintenance.")
+        parser.add_argument('--csv', metavar='FICHIER', help="Écrit le classement complet dans ce fichier.")
+
+    def handle(self, *args, **options):
+        if options['fenetre'] < 1:
+            raise CommandError("--fenetre doit être d'au moins un jour.")
+        date = _date(options['date']) if options['date'] else None
+        depart = time.perf_counter()
+        risques = scores_risque(date, options['fenetre'], options['inclure_maintenance'])
+        duree = time.perf_counter() - depart
+        self.stdout.write(self.style.SUCCESS(f"{len(risques)} vélos classés en {duree * 1000:.0f} ms."))
+
+        for rang, risque in enumerate(risques[:options['top'] or None], start=1):
+            self.stdout.write(f"  {rang:>4}. Vélo {risque.velo_id} : risque {risque.score:.1f} "
+                              f"({risque.motif or '-'}), batterie {risque.batterie:.0f} %, "
+                              f"santé {risque.sante_batterie:.1f} %, {risque.cycles_charge:.1f} cycles")
+
+        if options['csv']:
+            with open(options['csv'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(Risque._fields)
+                writer.writerows(risques)
+            self.stdout.write(self.style.SUCCESS(f"Classement écrit dans {options['csv']}."))
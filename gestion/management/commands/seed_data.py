@@ -1,15 +1,22 @@
 # gestion/management/commands/seed_data.py
 
-import random
 from django.core.management.base import BaseCommand
-from django.contrib.auth.hashers import make_password
 from django.db import transaction
-from faker import Faker
-from gestion.models import Utilisateur, Velo
+from gestion.disponibilite import reconstruire
+from gestion.loader import charger
+from gestion.models import Utilisateur, Velo, Station
+from gestion.aleatoire import FLUX_FLOTTE, ajouter_option_graine, generateur, graine
+from gestion.scenario import ajouter_option_scenario, scenario_des_options
+from gestion.utilisateurs import CHAMPS as CHAMPS_UTILISATEUR, generer_utilisateurs
+from gestion.versions import incrementer_apres_commit
 
 
 class Command(BaseCommand):
-    help = 'Génère 200 vélos et 1000 utilisateurs de test dans la base de données.'
+    help = 'Génère les vélos et les utilisateurs de test du scénario (200 et 1000 par défaut) dans la base de données.'
+
+    def add_arguments(self, parser):
+        ajouter_option_scenario(parser)
+        ajouter_option_graine(parser)
 
     @transaction.atomic
     def handle(self, *args, **options):
@@ -20,53 +27,36 @@ class Command(BaseCommand):
                 self.style.WARNING("La base de données semble déjà contenir des données. Opération annulée."))
             return
 
-        faker = Faker('fr_FR')
-
-        # --- CRÉATION DES 1000 UTILISATEURS (VERSION CORRIGÉE) ---
-        self.stdout.write("Création de 1000 utilisateurs uniques...")
-
-        utilisateurs_a_creer = []
-        # On utilise un "set" pour vérifier l'unicité des noms d'utilisateurs, c'est très rapide.
-        noms_utilisateurs_uniques = set()
-
-        # On utilise une boucle "while" pour s'assurer d'avoir EXACTEMENT 1000 utilisateurs.
-        while len(utilisateurs_a_creer) < 1000:
-            profil = faker.simple_profile()
-            username = profil['username']
+        scenario = scenario_des_options(options)
+        seed = graine(options)
+        self.stdout.write(f"Graine utilisée : {seed}")
 
-            # Si le nom d'utilisateur n'a pas déjà été généré...
-            if username not in noms_utilisateurs_uniques:
-                # ... on l'ajoute au set pour les futures vérifications
-                noms_utilisateurs_uniques.add(username)
+        # --- CRÉATION DES UTILISATEURS ---
+        # Noms uniques par construction et mot de passe chiffré une seule fois (voir gestion/utilisateurs.py).
+        nb_utilisateurs = scenario.utilisateurs_seed_data
+        self.stdout.write(f"Création de {nb_utilisateurs} utilisateurs uniques...")
+        charger(Utilisateur, CHAMPS_UTILISATEUR, generer_utilisateurs(nb_utilisateurs, seed))
+        self.stdout.write(self.style.SUCCESS(f"{nb_utilisateurs} utilisateurs créés."))
 
-                password_crypte = make_password('password123')
-                user = Utilisateur(
-                    username=username,
-                    email=profil['mail'],
-                    first_name=faker.first_name(),
-                    last_name=faker.last_name(),
-                    password=password_crypte
-                )
-                utilisateurs_a_creer.append(user)
+        # --- CRÉATION DES VÉLOS ---
+        # Le modèle Velo n'a plus de marque / modèle / tarif : un vélo est rattaché à une station.
+        self.stdout.write(f"Création de {scenario.velos} vélos...")
 
-        Utilisateur.objects.bulk_create(utilisateurs_a_creer)
-        self.stdout.write(self.style.SUCCESS("1000 utilisateurs créés."))
-
-        # --- CRÉATION DES 200 VÉLOS (inchangé) ---
-        self.stdout.write("Création de 200 vélos...")
-
-        marques_de_velo = ['Peugeot', 'B\'Twin', 'Gitane', 'Lapierre', 'Cannondale', 'Trek', 'Specialized']
+        stations = list(Station.objects.order_by('id').values_list('id', flat=True))
+        statuts = Velo.StatutVelo.values
+        rng = generateur(seed, FLUX_FLOTTE)
         velos_a_creer = []
-        for _ in range(200):
-            velo = Velo(
-                marque=random.choice(marques_de_velo),
-                modele=faker.word().capitalize() + " " + str(random.randint(100, 900)),
-                statut=random.choice([s[0] for s in Velo.StatutVelo.choices]),
-                tarif_horaire=round(random.uniform(3.0, 10.0), 2)
-            )
-            velos_a_creer.append(velo)
-
-        Velo.objects.bulk_create(velos_a_creer)
-        self.stdout.write(self.style.SUCCESS("200 vélos créés."))
+        for _ in range(scenario.velos):
+            station = stations[rng.integers(len(stations))] if stations else None
+            velos_a_creer.append((
+                station, station,
+                statuts[rng.integers(len(statuts))],
+                round(rng.uniform(20.0, 100.0), 1)
+            ))
+
+        charger(Velo, ('station_origine', 'station_actuelle', 'statut', 'batterie'), velos_a_creer)
+        reconstruire()
+        incrementer_apres_commit('velo')
+        self.stdout.write(self.style.SUCCESS(f"{scenario.velos} vélos créés."))
 
         self.stdout.write(self.style.SUCCESS("Opération terminée avec succès !"))
\ No newline at end of file
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0004_alter_velo_station_origine'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['velo', 'date_debut'], name='location_velo_debut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['station_depart', 'date_debut'], name='location_depart_debut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['station_arrivee', 'date_fin'], name='location_arrivee_fin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='velo',
+            index=models.Index(condition=models.Q(('statut', 'DISPO')), fields=['id'], name='velo_dispo_idx'),
+        ),
+    ]
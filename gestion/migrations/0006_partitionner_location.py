@@ -0,0 +1,94 @@
+# Partitionnement mensuel de gestion_location (PostgreSQL uniquement).
+#
+# PostgreSQL n'autorise pas à partitionner une table existante : la table est recréée comme table
+# partitionnée par RANGE (date_debut), les lignes sont recopiées puis l'ancienne table supprimée.
+# La clé primaire d'une table partitionnée doit contenir la clé de partition : elle devient
+# (id, date_debut), id restant alimenté par une séquence (unique en pratique, Django n'y voit
+# qu'une clé primaire id). Les index du modèle sont recréés sur la table parente, avec leurs noms.
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations
+
+from gestion.partitions import DEFAUT, creer_partition, mois_de, mois_entre, mois_suivant
+
+INDEX = [
+    ('location_velo_debut_idx', 'velo_id, date_debut'),
+    ('location_depart_debut_idx', 'station_depart_id, date_debut'),
+    ('location_arrivee_fin_idx', 'station_arrivee_id, date_fin'),
+    ('gestion_location_utilisateur_id_idx', 'utilisateur_id'),
+]
+CLES_ETRANGERES = [
+    ('velo_id', 'gestion_velo'),
+    ('utilisateur_id', 'gestion_utilisateur'),
+    ('station_depart_id', 'gestion_station'),
+    ('station_arrivee_id', 'gestion_station'),
+]
+MOIS_A_L_AVANCE = 3
+
+
+def _recreer_contraintes(cursor, partitionnee):
+    cle = 'id, date_debut' if partitionnee else 'id'
+    cursor.execute(f"ALTER TABLE gestion_location ADD CONSTRAINT gestion_location_pkey PRIMARY KEY ({cle});")
+    for colonne, cible in CLES_ETRANGERES:
+        cursor.execute(f"""
+            ALTER TABLE gestion_location ADD CONSTRAINT gestion_location_{colonne}_fk
+            FOREIGN KEY ({colonne}) REFERENCES {cible} (id) DEFERRABLE INITIALLY DEFERRED;
+        """)
+    for nom, colonnes in INDEX:
+        cursor.execute(f"CREATE INDEX {nom} ON gestion_location ({colonnes});")
+
+
+def partitionner(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE gestion_location RENAME TO gestion_location_ancienne;")
+        cursor.execute("""
+            CREATE TABLE gestion_location (LIKE gestion_location_ancienne INCLUDING DEFAULTS)
+            PARTITION BY RANGE (date_debut);
+        """)
+        cursor.execute("CREATE SEQUENCE gestion_location_id_seq_part OWNED BY gestion_location.id;")
+        cursor.execute("ALTER TABLE gestion_location ALTER COLUMN id SET DEFAULT nextval('gestion_location_id_seq_part');")
+
+        # Partitions du premier mois de données jusqu'à quelques mois dans le futur.
+        cursor.execute("SELECT min(date_debut) FROM gestion_location_ancienne;")
+        maintenant = datetime.now(dt_timezone.utc)
+        premier = mois_de(cursor.fetchone()[0] or maintenant)
+        dernier = mois_de(maintenant)
+        for _ in range(MOIS_A_L_AVANCE):
+            dernier = mois_suivant(dernier)
+        for mois in mois_entre(premier, dernier):
+            creer_partition(cursor, mois)
+        cursor.execute(f"CREATE TABLE {DEFAUT} PARTITION OF gestion_location DEFAULT;")
+
+        cursor.execute("INSERT INTO gestion_location SELECT * FROM gestion_location_ancienne;")
+        cursor.execute("""
+            SELECT setval('gestion_location_id_seq_part', coalesce(max(id), 0) + 1, false) FROM gestion_location;
+        """)
+        cursor.execute("DROP TABLE gestion_location_ancienne;")
+        _recreer_contraintes(cursor, partitionnee=True)
+
+
+def departitionner(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE gestion_location_simple (LIKE gestion_location INCLUDING DEFAULTS);")
+        cursor.execute("INSERT INTO gestion_location_simple SELECT * FROM gestion_location;")
+        # La séquence doit changer de propriétaire avant la suppression de la table partitionnée.
+        cursor.execute("ALTER SEQUENCE gestion_location_id_seq_part OWNED BY gestion_location_simple.id;")
+        cursor.execute("DROP TABLE gestion_location CASCADE;")
+        cursor.execute("ALTER TABLE gestion_location_simple RENAME TO gestion_location;")
+        _recreer_contraintes(cursor, partitionnee=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0005_location_location_velo_debut_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(partitionner, departitionner),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remplir(apps, schema_editor):
+    Velo = apps.get_model('gestion', 'Velo')
+    DisponibiliteStation = apps.get_model('gestion', 'DisponibiliteStation')
+    comptes = Velo.objects.filter(station_actuelle__isnull=False).order_by() \
+        .values('station_actuelle_id', 'statut').annotate(nombre=Count('id'))
+    DisponibiliteStation.objects.bulk_create([
+        DisponibiliteStation(station_id=c['station_actuelle_id'], statut=c['statut'], nombre=c['nombre'])
+        for c in comptes
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_partitionner_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisponibiliteStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statut', models.CharField(choices=[('DISPO', 'Disponible'), ('LOC', 'En location'), ('MAINT', 'En maintenance')], max_length=5)),
+                ('nombre', models.PositiveIntegerField(default=0)),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='disponibilites', to='gestion.station')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('station', 'statut'), name='disponibilite_station_statut_uniq')],
+            },
+        ),
+        migrations.RunPython(remplir, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_disponibilitestation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EtatSimulation',
+            fields=[
+                ('velo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='etat_simulation', serialize=False, to='gestion.velo')),
+                ('historique_jusqua', models.DateTimeField(null=True)),
+                ('prochain_depart', models.DateTimeField(null=True)),
+                ('telemetrie_jusqua', models.DateTimeField(null=True)),
+                ('batterie', models.FloatField(null=True)),
+                ('latitude', models.FloatField(null=True)),
+                ('longitude', models.FloatField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:31
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_etatsimulation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FluxHoraireStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('heure', models.DateTimeField()),
+                ('departs', models.PositiveIntegerField(default=0)),
+                ('arrivees', models.PositiveIntegerField(default=0)),
+                ('duree_totale', models.DurationField(default=datetime.timedelta)),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flux_horaires', to='gestion.station')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['heure'], name='flux_horaire_heure_idx')],
+                'constraints': [models.UniqueConstraint(fields=('station', 'heure'), name='flux_horaire_station_heure_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrajetJournalier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('nombre', models.PositiveIntegerField(default=0)),
+                ('duree_totale', models.DurationField(default=datetime.timedelta)),
+                ('station_arrivee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trajets_arrivee', to='gestion.station')),
+                ('station_depart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trajets_depart', to='gestion.station')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('jour', 'station_depart', 'station_arrivee'), name='trajet_journalier_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_station_lat_lon_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='velo',
+            name='cycles_charge',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='velo',
+            name='sante_batterie',
+            field=models.FloatField(default=100.0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_velo_sante_batterie'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticketsupport',
+            name='date_creation',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_ticket_date_creation_simulee'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='station',
+            name='station_lat_lon_idx',
+        ),
+    ]
@@ -1,8 +1,11 @@
 # CODE v2.0 SPÉCIAL MIGRATION pour gestion/models.py
 
+from datetime import timedelta
+
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 class Ville(models.Model):
     nom = models.CharField(max_length=100, unique=True)
@@ -19,11 +22,20 @@ class Velo(models.Model):
     station_origine = models.ForeignKey(Station, on_delete=models.PROTECT, related_name='velos_originaires', null=True)
     station_actuelle = models.ForeignKey(Station, on_delete=models.SET_NULL, null=True, blank=True, related_name='velos_actuels')
     batterie = models.FloatField(default=100.0)
+    # Usure de la batterie, tenue par generate_files (voir gestion/flotte.py) : cycles complets
+    # équivalents et capacité restante en % de la capacité nominale.
+    cycles_charge = models.FloatField(default=0.0)
+    sante_batterie = models.FloatField(default=100.0)
     class StatutVelo(models.TextChoices):
         DISPONIBLE = 'DISPO', 'Disponible'
         EN_LOCATION = 'LOC', 'En location'
         MAINTENANCE = 'MAINT', 'En maintenance'
     statut = models.CharField(max_length=5, choices=StatutVelo.choices, default=StatutVelo.DISPONIBLE)
+    class Meta:
+        indexes = [
+            # Index partiel : seuls les vélos disponibles, dans l'ordre des ids (liste paginée des vélos).
+            models.Index(fields=['id'], name='velo_dispo_idx', condition=models.Q(statut='DISPO')),
+        ]
     def __str__(self): return f"Vélo ID_{self.id}"
 
 class Location(models.Model):
@@ -33,8 +45,68 @@ class Location(models.Model):
     station_arrivee = models.ForeignKey(Station, on_delete=models.PROTECT, related_name='arrivees_location')
     date_debut = models.DateTimeField()
     date_fin = models.DateTimeField()
+    class Meta:
+        indexes = [
+            models.Index(fields=['velo', 'date_debut'], name='location_velo_debut_idx'),
+            models.Index(fields=['station_depart', 'date_debut'], name='location_depart_debut_idx'),
+            models.Index(fields=['station_arrivee', 'date_fin'], name='location_arrivee_fin_idx'),
+        ]
     def __str__(self): return f"Vélo {self.velo.id} de {self.station_depart.nom} à {self.station_arrivee.nom}"
 
+class DisponibiliteStation(models.Model):
+    # Nombre de vélos par station et par statut, tenu à jour à chaque changement de station ou de
+    # statut d'un vélo (voir gestion/disponibilite.py) : la carte d'une ville est une seule lecture.
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='disponibilites')
+    statut = models.CharField(max_length=5, choices=Velo.StatutVelo.choices)
+    nombre = models.PositiveIntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['station', 'statut'], name='disponibilite_station_statut_uniq'),
+        ]
+    def __str__(self): return f"{self.station.nom} : {self.nombre} vélo(s) {self.get_statut_display()}"
+
+class FluxHoraireStation(models.Model):
+    # Agrégats de l'historique des locations (voir gestion/analytique.py) : départs et arrivées par
+    # station et par heure, et durée cumulée des trajets partis dans l'heure (durée moyenne =
+    # duree_totale / departs). Les tableaux de bord lisent ces lignes au lieu de parcourir Location.
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='flux_horaires')
+    heure = models.DateTimeField()
+    departs = models.PositiveIntegerField(default=0)
+    arrivees = models.PositiveIntegerField(default=0)
+    duree_totale = models.DurationField(default=timedelta)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['station', 'heure'], name='flux_horaire_station_heure_uniq'),
+        ]
+        indexes = [models.Index(fields=['heure'], name='flux_horaire_heure_idx')]
+    def __str__(self): return f"Station {self.station_id}, {self.heure:%d/%m/%Y %H:%M} : {self.departs} départ(s)"
+
+class TrajetJournalier(models.Model):
+    # Matrice origine-destination par jour (date de départ) : nombre de trajets et durée cumulée.
+    jour = models.DateField()
+    station_depart = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='trajets_depart')
+    station_arrivee = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='trajets_arrivee')
+    nombre = models.PositiveIntegerField(default=0)
+    duree_totale = models.DurationField(default=timedelta)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'station_depart', 'station_arrivee'], name='trajet_journalier_uniq'),
+        ]
+    def __str__(self): return f"{self.jour} : {self.station_depart_id} -> {self.station_arrivee_id} ({self.nombre})"
+
+class EtatSimulation(models.Model):
+    # Point d'arrêt des simulations d'un vélo, pour les modes --incremental de generate_history et
+    # generate_files : chaque run reprend là où le précédent s'est arrêté au lieu de tout recalculer.
+    # La station où se trouve le vélo est sa station_actuelle.
+    velo = models.OneToOneField(Velo, on_delete=models.CASCADE, primary_key=True, related_name='etat_simulation')
+    historique_jusqua = models.DateTimeField(null=True)  # fin de la période déjà simulée par generate_history
+    prochain_depart = models.DateTimeField(null=True)  # départ déjà tiré, tombé après historique_jusqua
+    telemetrie_jusqua = models.DateTimeField(null=True)  # dernier pas de télémétrie écrit par generate_files
+    batterie = models.FloatField(null=True)  # batterie et position à ce dernier pas
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+    def __str__(self): return f"État de simulation du vélo {self.velo_id}"
+
 class TicketSupport(models.Model):
     class TypeProbleme(models.TextChoices):
         BATTERIE_FAIBLE = 'BATTERIE', 'Batterie faible'
@@ -45,7 +117,8 @@ class TicketSupport(models.Model):
     utilisateur = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     type_probleme = models.CharField(max_length=10, choices=TypeProbleme.choices)
     description = models.TextField(blank=True)
-    date_creation = models.DateTimeField(auto_now_add=True)
+    # Pas auto_now_add : les tickets des simulations portent la date simulée (generate_files).
+    date_creation = models.DateTimeField(default=timezone.now, editable=False)
     def __str__(self): return f"Ticket {self.id} - {self.get_type_probleme_display()}"
 
 class Utilisateur(AbstractUser):
@@ -0,0 +1,50 @@
+# CODE pour gestion/parallel.py
+#
+# Exécution des commandes de simulation par tranches de vélos (shards) dans un pool de processus.
+# Chaque vélo est simulé indépendamment avec son propre générateur aléatoire (gestion/aleatoire.py) :
+# le résultat pour une graine donnée est donc le même quel que soit le nombre de workers.
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def decouper_en_shards(ids, nb_shards):
+    """Découpe des ids triés en au plus nb_shards tranches contiguës : l'ordre global est conservé."""
+    nb_shards = max(1, min(nb_shards, len(ids)))
+    taille, reste = divmod(len(ids), nb_shards)
+    shards, debut = [], 0
+    for k in range(nb_shards):
+        fin = debut + taille + (1 if k < reste else 0)
+        shards.append(list(ids[debut:fin]))
+        debut = fin
+    return shards
+
+
+def _initialiser_worker(bases):
+    # Processus lancé en 'spawn' : rien n'est hérité du parent, le worker ouvrira sa propre connexion.
+    # Les noms des bases viennent du parent, qui a pu les changer (base de test).
+    django.setup()
+    for alias, nom in bases.items():
+        connections[alias].settings_dict['NAME'] = nom
+
+
+def executer_shards(fonction, shards, workers, *args):
+    """
+    Appelle fonction(shard, *args) pour chaque shard, dans le processus courant si workers <= 1,
+    sinon dans un pool de workers. Les résultats sont renvoyés dans l'ordre des shards.
+    """
+    if workers <= 1:
+        for shard in shards:
+            yield fonction(shard, *args)
+        return
+
+    contexte = multiprocessing.get_context('spawn')
+    bases = {connection.alias: connection.settings_dict['NAME'] for connection in connections.all()}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexte, initializer=_initialiser_worker,
+                             initargs=(bases,)) as pool:
+        futures = [pool.submit(fonction, shard, *args) for shard in shards]
+        for future in futures:
+            yield future.result()
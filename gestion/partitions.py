@@ -0,0 +1,129 @@
+# CODE pour gestion/partitions.py
+#
+# Sur PostgreSQL, gestion_location est une table partitionnée par mois sur date_debut
+# (migration 0006) : une partition gestion_location_pAAAA_MM par mois, plus une partition par
+# défaut qui reçoit les lignes hors des mois créés. Une requête filtrée sur date_debut ne lit
+# que les partitions des mois concernés. Sur les autres bases, ces fonctions ne font rien.
+
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection
+
+TABLE = 'gestion_location'
+DEFAUT = 'gestion_location_defaut'
+FORMAT_PARTITION = re.compile(r'^gestion_location_p(\d{4})_(\d{2})$')
+
+
+def est_partitionnee(cursor):
+    if connection.vendor != 'postgresql':
+        return False
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass;", [TABLE])
+    return cursor.fetchone() is not None
+
+
+def mois_de(dt):
+    """(année, mois) UTC d'une date : les bornes des partitions sont des débuts de mois UTC."""
+    dt = dt.astimezone(dt_timezone.utc)
+    return dt.year, dt.month
+
+
+def mois_suivant(mois):
+    annee, m = mois
+    return (annee + 1, 1) if m == 12 else (annee, m + 1)
+
+
+def mois_entre(premier, dernier):
+    """Mois de premier à dernier inclus, sous forme de tuples (année, mois)."""
+    mois = premier
+    while mois <= dernier:
+        yield mois
+        mois = mois_suivant(mois)
+
+
+def nom_partition(mois):
+    return f"{TABLE}_p{mois[0]:04d}_{mois[1]:02d}"
+
+
+def _borne(mois):
+    return datetime(mois[0], mois[1], 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def lister_partitions(cursor):
+    """Partitions mensuelles attachées, triées par mois : liste de ((année, mois), nom)."""
+    cursor.execute("""
+        SELECT enfant.relname FROM pg_inherits
+        JOIN pg_class enfant ON enfant.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = %s::regclass;
+    """, [TABLE])
+    partitions = []
+    for (nom,) in cursor.fetchall():
+        correspondance = FORMAT_PARTITION.match(nom)
+        if correspondance:
+            partitions.append(((int(correspondance[1]), int(correspondance[2])), nom))
+    return sorted(partitions)
+
+
+def _table_existe(cursor, nom):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", [nom])
+    return cursor.fetchone()[0]
+
+
+def creer_partition(cursor, mois):
+    """
+    Crée la partition d'un mois si elle n'existe pas et renvoie True si elle a été créée.
+    Les lignes de ce mois déjà tombées dans la partition par défaut y sont déplacées : la partition
+    par défaut est détachée le temps de l'opération, sinon PostgreSQL refuse la création.
+    """
+    nom = nom_partition(mois)
+    if _table_existe(cursor, nom):
+        return False
+    debut, fin = _borne(mois), _borne(mois_suivant(mois))
+    defaut = _table_existe(cursor, DEFAUT)
+    if defaut:
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAUT};")
+    cursor.execute(f"CREATE TABLE {nom} PARTITION OF {TABLE} FOR VALUES FROM ('{debut}') TO ('{fin}');")
+    if defaut:
+        cursor.execute(f"""
+            WITH deplacees AS (
+                DELETE FROM {DEFAUT} WHERE date_debut >= '{debut}' AND date_debut < '{fin}' RETURNING *
+            )
+            INSERT INTO {TABLE} SELECT * FROM deplacees;
+        """)
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAUT} DEFAULT;")
+    return True
+
+
+def creer_partitions(debut, fin):
+    """Crée les partitions manquantes couvrant [debut, fin] et renvoie les noms créés."""
+    with connection.cursor() as cursor:
+        if not est_partitionnee(cursor):
+            return []
+        return [nom_partition(mois) for mois in mois_entre(mois_de(debut), mois_de(fin))
+                if creer_partition(cursor, mois)]
+
+
+def detacher_partitions(avant, supprimer=False):
+    """
+    Détache (ou supprime) les partitions des mois entièrement antérieurs à avant et renvoie leurs noms.
+    Une partition détachée devient une table d'archive autonome : ses clés étrangères sont retirées,
+    pour qu'un TRUNCATE ... CASCADE des vélos ne la vide pas.
+    """
+    limite = mois_de(avant)
+    detachees = []
+    with connection.cursor() as cursor:
+        if not est_partitionnee(cursor):
+            return []
+        for mois, nom in lister_partitions(cursor):
+            if mois >= limite:
+                break
+            cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {nom};")
+            if supprimer:
+                cursor.execute(f"DROP TABLE {nom};")
+            else:
+                cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f';",
+                               [nom])
+                for (contrainte,) in cursor.fetchall():
+                    cursor.execute(f'ALTER TABLE {nom} DROP CONSTRAINT "{contrainte}";')
+            detachees.append(nom)
+    return detachees
@@ -0,0 +1,117 @@
+# CODE pour gestion/reequilibrage.py
+#
+# Plan de rééquilibrage de la flotte : au fil des locations, les vélos s'accumulent dans certaines
+# stations et en désertent d'autres. Pour chaque ville, on compare le nombre de vélos disponibles
+# de chaque station (DisponibiliteStation) à un niveau cible, puis on calcule les transferts par
+# camion qui ramènent chaque station à sa cible en minimisant la distance parcourue.
+#
+# Cibles :
+#   - 'origine' : la répartition d'origine de la flotte (Velo.station_origine) ;
+#   - 'demande' : la part de chaque station dans les départs d'une période (FluxHoraireStation,
+#     voir gestion/analytique.py).
+# Dans les deux cas, les cibles sont ramenées au nombre de vélos disponibles de la ville (méthode
+# du plus fort reste) : un transfert ne crée ni ne retire de vélo.
+#
+# Solveur : glouton du plus proche voisin sur la matrice des distances (gestion/spatial.py) entre
+# stations en excédent et stations en déficit. Les couples sont triés par distance, puis chacun
+# transfère autant de vélos que possible. Seuls les couples formés avec les stations en déficit
+# les plus proches sont triés (argpartition), ce qui garde le calcul sous la seconde pour une ville
+# de quelques milliers de stations.
+
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import Count, Sum
+
+from .models import DisponibiliteStation, FluxHoraireStation, Station, Velo
+from .spatial import matrice_distances
+
+CIBLES = ('origine', 'demande')
+VOISINS = 20  # stations en déficit candidates par station en excédent, à chaque passe du solveur
+
+Transfert = namedtuple('Transfert', 'station_source station_cible nombre distance_km')
+
+
+def repartir(poids, total):
+    """Répartit l'entier total proportionnellement à poids (méthode du plus fort reste)."""
+    poids = np.asarray(poids, dtype=float)
+    if total <= 0 or poids.sum() <= 0:
+        return np.zeros(len(poids), dtype=np.int64)
+    parts = poids * (total / poids.sum())
+    entiers = np.floor(parts).astype(np.int64)
+    reste = total - int(entiers.sum())
+    if reste:
+        entiers[np.argsort(entiers - parts, kind='stable')[:reste]] += 1
+    return entiers
+
+
+def resoudre(excedents, besoins, distances, voisins=VOISINS):
+    """
+    Glouton du plus proche voisin : excedents (S) et besoins (D) en vélos, distances (S x D).
+    Renvoie la liste des (indice source, indice cible, nombre, distance).
+    Seuls les couples formés avec les `voisins` stations en déficit les plus proches de chaque source
+    sont triés ; s'il reste des vélos à placer une fois ces couples épuisés, on recommence sur les
+    stations restantes.
+    """
+    excedents, besoins = [int(e) for e in excedents], [int(b) for b in besoins]
+    transferts = []
+    while any(excedents) and any(besoins):
+        lignes = np.flatnonzero(excedents)
+        colonnes = np.flatnonzero(besoins)
+        sous_matrice = distances[np.ix_(lignes, colonnes)]
+        k = min(voisins, len(colonnes))
+        proches = np.argpartition(sous_matrice, k - 1, axis=1)[:, :k] if k < len(colonnes) \
+            else np.broadcast_to(np.arange(k), sous_matrice.shape)
+        ordre = np.argsort(np.take_along_axis(sous_matrice, proches, axis=1), axis=None, kind='stable')
+        for i, j in zip(lignes[ordre // k].tolist(), colonnes[proches.ravel()[ordre]].tolist()):
+            nombre = min(excedents[i], besoins[j])
+            if nombre:
+                excedents[i] -= nombre
+                besoins[j] -= nombre
+                transferts.append((i, j, nombre, float(distances[i, j])))
+    return transferts
+
+
+def _poids_origine(ville_id, stations):
+    origines = dict(Velo.objects.filter(station_origine__ville_id=ville_id).order_by()
+                    .values('station_origine_id').annotate(nombre=Count('id'))
+                    .values_list('station_origine_id', 'nombre'))
+    return [origines.get(station_id, 0) for station_id in stations]
+
+
+def _poids_demande(ville_id, stations, debut, fin):
+    flux = FluxHoraireStation.objects.filter(station__ville_id=ville_id)
+    if debut is not None:
+        flux = flux.filter(heure__gte=debut)
+    if fin is not None:
+        flux = flux.filter(heure__lt=fin)
+    departs = dict(flux.order_by().values('station_id').annotate(nombre=Sum('departs'))
+                   .values_list('station_id', 'nombre'))
+    return [departs.get(station_id, 0) for station_id in stations]
+
+
+def planifier(ville_id, cible='origine', debut=None, fin=None):
+    """
+    Transferts qui ramènent les stations de la ville à leur cible. debut / fin bornent la période
+    de la demande (cible 'demande'). Renvoie (transferts, vélos disponibles, écart total initial).
+    """
+    lignes = list(Station.objects.filter(ville_id=ville_id).order_by('id').values_list('id', 'latitude', 'longitude'))
+    if not lignes:
+        return [], 0, 0
+    stations = [station_id for station_id, _, _ in lignes]
+    latitudes = np.array([lat for _, lat, _ in lignes])
+    longitudes = np.array([lon for _, _, lon in lignes])
+
+    disponibles = dict(DisponibiliteStation.objects.filter(station__ville_id=ville_id, statut=Velo.StatutVelo.DISPONIBLE)
+                       .values_list('station_id', 'nombre'))
+    actuels = np.array([disponibles.get(station_id, 0) for station_id in stations], dtype=np.int64)
+    poids = _poids_origine(ville_id, stations) if cible == 'origine' else _poids_demande(ville_id, stations, debut, fin)
+    ecarts = actuels - repartir(poids, int(actuels.sum()))
+
+    sources, deficits = np.flatnonzero(ecarts > 0), np.flatnonzero(ecarts < 0)
+    if not len(sources) or not len(deficits):
+        return [], int(actuels.sum()), 0
+    distances = matrice_distances(latitudes[sources], longitudes[sources], latitudes[deficits], longitudes[deficits])
+    transferts = [Transfert(stations[sources[i]], stations[deficits[j]], nombre, distance)
+                  for i, j, nombre, distance in resoudre(ecarts[sources], -ecarts[deficits], distances)]
+    return transferts, int(actuels.sum()), int(ecarts[sources].sum())
@@ -0,0 +1,79 @@
+# CODE pour gestion/reparation.py
+#
+# Base commune des commandes de réparation de données. Une réparation décrit les lignes à corriger
+# (a_corriger) et la correction d'un lot (corriger, en général un seul UPDATE ensembliste) ; la
+# base s'occupe du reste :
+#   - --simulation : compte les lignes concernées et les lots, sans rien écrire ;
+#   - lots par plages d'id consécutives, chacun dans sa propre transaction : les verrous ne portent
+#     que sur un lot à la fois et une interruption ne perd que le lot en cours ;
+#   - --pause entre deux lots pour laisser respirer la base en production ;
+#   - relance sans risque : a_corriger ne doit renvoyer que des lignes encore fausses, une ligne
+#     corrigée n'est donc jamais retraitée.
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class CommandeReparation(BaseCommand):
+    taille_lot = 10000
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulation', action='store_true',
+                            help="Compte les lignes à corriger sans rien modifier.")
+        parser.add_argument('--taille-lot', type=int, default=self.taille_lot,
+                            help="Nombre maximal de lignes corrigées par transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Pause en secondes entre deux lots.")
+
+    def a_corriger(self):
+        """QuerySet des lignes encore à corriger."""
+        raise NotImplementedError
+
+    def corriger(self, lot):
+        """Corrige les lignes du QuerySet lot (déjà restreint à une plage d'id) ; renvoie le nombre corrigé."""
+        raise NotImplementedError
+
+    def preparer(self, options):
+        """Vérifications préalables ; renvoie False pour abandonner la réparation."""
+        return True
+
+    def terminer(self, corrigees):
+        """Appelé après le dernier lot si des lignes ont été corrigées (invalidation des caches...)."""
+
+    def _bornes(self, taille_lot):
+        # Plages [debut, fin] calculées sur les id des lignes à corriger : chaque lot en contient
+        # taille_lot (sauf le dernier), quels que soient les trous dans la numérotation.
+        ids = self.a_corriger().order_by('pk').values_list('pk', flat=True)
+        debut = ids.first()
+        while debut is not None:
+            fin = ids.filter(pk__gte=debut)[taille_lot - 1:taille_lot].first()
+            if fin is None:
+                fin = ids.order_by('-pk').first()
+            yield debut, fin
+            debut = ids.filter(pk__gt=fin).first()
+
+    def handle(self, *args, **options):
+        if not self.preparer(options):
+            return
+        total = self.a_corriger().count()
+        taille_lot = max(options['taille_lot'], 1)
+        if options['simulation']:
+            lots = -(-total // taille_lot)
+            self.stdout.write(f"Simulation : {total} lignes à corriger, en {lots} lots de {taille_lot} au plus.")
+            return
+        if not total:
+            self.stdout.write(self.style.SUCCESS("Rien à corriger."))
+            return
+
+        self.stdout.write(f"{total} lignes à corriger...")
+        corrigees = 0
+        for numero, (debut, fin) in enumerate(self._bornes(taille_lot), start=1):
+            if numero > 1 and options['pause']:
+                time.sleep(options['pause'])
+            with transaction.atomic():
+                corrigees += self.corriger(self.a_corriger().filter(pk__gte=debut, pk__lte=fin))
+            self.stdout.write(f"  Lot {numero} (id {debut} à {fin}) : {corrigees}/{total} lignes corrigées.")
+        self.terminer(corrigees)
+        self.stdout.write(self.style.SUCCESS(f"Correction terminée : {corrigees} lignes corrigées."))
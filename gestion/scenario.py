@@ -0,0 +1,171 @@
+# CODE pour gestion/scenario.py
+#
+# Scénarios des commandes de simulation : période simulée, taille de la flotte et nombre
+# d'utilisateurs, rythme des locations (repos, durées, demande par heure), pas et format de la
+# télémétrie. Le scénario par défaut est gestion/scenarios/defaut.toml ; un autre fichier (TOML,
+# JSON, ou YAML si PyYAML est installé) peut être passé avec --scenario ou désigné par
+# settings.SIMULATION['SCENARIO']. Il ne donne que les valeurs qui changent, et tout est vérifié au
+# chargement : une erreur de scénario arrête la commande avant toute écriture.
+
+import json
+import os
+import tomllib
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from .analytique import DUREE_MAX_LOCATION
+from .telemetry import FORMATS
+
+SCENARIO_DEFAUT = os.path.join(os.path.dirname(__file__), 'scenarios', 'defaut.toml')
+
+# Clés absentes du scénario par défaut mais acceptées dans un scénario.
+CLES_OPTIONNELLES = {('periode', 'fin'), ('locations', 'demande_horaire')}
+
+
+class ScenarioInvalide(ValueError):
+    pass
+
+
+def _lire(chemin):
+    extension = os.path.splitext(chemin)[1].lower()
+    try:
+        if extension == '.toml':
+            with open(chemin, 'rb') as f:
+                return tomllib.load(f)
+        if extension == '.json':
+            with open(chemin, encoding='utf-8') as f:
+                return json.load(f)
+        if extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ScenarioInvalide(f"{chemin} : PyYAML n'est pas installé, utilisez un scénario TOML ou JSON.")
+            with open(chemin, encoding='utf-8') as f:
+                try:
+                    return yaml.safe_load(f) or {}
+                except yaml.YAMLError as erreur:
+                    raise ScenarioInvalide(f"{chemin} : {erreur}")
+    except (OSError, ValueError) as erreur:
+        if isinstance(erreur, ScenarioInvalide):
+            raise
+        raise ScenarioInvalide(f"{chemin} : {erreur}")
+    raise ScenarioInvalide(f"{chemin} : format inconnu (toml, json ou yaml).")
+
+
+def _fusionner(defaut, surcharge, chemin):
+    """Valeurs du scénario par-dessus celles du scénario par défaut ; clés inconnues refusées."""
+    if not isinstance(surcharge, dict):
+        raise ScenarioInvalide(f"{chemin} : le scénario doit être une table de sections.")
+    donnees = {section: dict(valeurs) for section, valeurs in defaut.items()}
+    for section, valeurs in surcharge.items():
+        if section not in donnees:
+            raise ScenarioInvalide(f"{chemin} : section inconnue [{section}].")
+        if not isinstance(valeurs, dict):
+            raise ScenarioInvalide(f"{chemin} : [{section}] doit être une table.")
+        for cle in valeurs:
+            if cle not in donnees[section] and (section, cle) not in CLES_OPTIONNELLES:
+                raise ScenarioInvalide(f"{chemin} : clé inconnue {section}.{cle}.")
+        donnees[section].update(valeurs)
+    return donnees
+
+
+def _date(section, cle):
+    valeur = section[cle]
+    if isinstance(valeur, str):
+        try:
+            valeur = datetime.fromisoformat(valeur)
+        except ValueError:
+            raise ScenarioInvalide(f"periode.{cle} : date ISO 8601 attendue, pas {valeur!r}.")
+    if isinstance(valeur, date) and not isinstance(valeur, datetime):
+        valeur = datetime.combine(valeur, datetime.min.time())
+    if not isinstance(valeur, datetime):
+        raise ScenarioInvalide(f"periode.{cle} : date attendue.")
+    return timezone.make_aware(valeur) if timezone.is_naive(valeur) else valeur
+
+
+def _entier(section, nom, cle, minimum):
+    valeur = section[cle]
+    if not isinstance(valeur, int) or isinstance(valeur, bool) or valeur < minimum:
+        raise ScenarioInvalide(f"{nom}.{cle} : entier >= {minimum} attendu, pas {valeur!r}.")
+    return valeur
+
+
+def _intervalle(section, cle, entier=False):
+    valeur = section[cle]
+    types = (int,) if entier else (int, float)
+    if not (isinstance(valeur, (list, tuple)) and len(valeur) == 2
+            and all(isinstance(v, types) and not isinstance(v, bool) for v in valeur)
+            and 0 < valeur[0] <= valeur[1]):
+        raise ScenarioInvalide(f"locations.{cle} : [minimum, maximum] positifs attendus, pas {valeur!r}.")
+    return tuple(valeur)
+
+
+def _demande(valeur):
+    if valeur is None:
+        return None
+    if not (isinstance(valeur, (list, tuple)) and len(valeur) == 24
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0 for v in valeur)
+            and max(valeur) > 0):
+        raise ScenarioInvalide("locations.demande_horaire : 24 valeurs positives ou nulles attendues, non toutes nulles.")
+    return tuple(v / max(valeur) for v in valeur)
+
+
+class Scenario:
+    """Paramètres vérifiés d'un scénario ; les dates sont des datetimes avec fuseau."""
+
+    def __init__(self, donnees, chemin=SCENARIO_DEFAUT):
+        self.chemin = chemin
+        periode, flotte, utilisateurs = donnees['periode'], donnees['flotte'], donnees['utilisateurs']
+        locations, telemetrie = donnees['locations'], donnees['telemetrie']
+
+        self.debut_historique = _date(periode, 'debut_historique')
+        self.debut_telemetrie = _date(periode, 'debut_telemetrie')
+        self.fin = _date(periode, 'fin') if 'fin' in periode else None
+        if self.fin is not None and self.fin <= max(self.debut_historique, self.debut_telemetrie):
+            raise ScenarioInvalide("periode.fin doit suivre debut_historique et debut_telemetrie.")
+
+        self.velos_par_station = _entier(flotte, 'flotte', 'velos_par_station', 0)
+        self.velos = _entier(flotte, 'flotte', 'velos', 0)
+        self.utilisateurs_historique = _entier(utilisateurs, 'utilisateurs', 'historique', 1)
+        self.utilisateurs_seed_data = _entier(utilisateurs, 'utilisateurs', 'seed_data', 1)
+
+        self.repos_heures = _intervalle(locations, 'repos_heures')
+        self.duree_minutes = _intervalle(locations, 'duree_minutes', entier=True)
+        if timedelta(minutes=self.duree_minutes[1]) > DUREE_MAX_LOCATION:
+            raise ScenarioInvalide(f"locations.duree_minutes : au plus {DUREE_MAX_LOCATION // timedelta(minutes=1)} "
+                                   f"minutes (durée maximale prise en compte par les agrégats).")
+        self.demande_horaire = _demande(locations.get('demande_horaire'))
+
+        self.pas = timedelta(seconds=_entier(telemetrie, 'telemetrie', 'pas_secondes', 1))
+        if telemetrie['format'] not in FORMATS:
+            raise ScenarioInvalide(f"telemetrie.format : {', '.join(FORMATS)} attendu, pas {telemetrie['format']!r}.")
+        self.format = telemetrie['format']
+
+    def parametres_locations(self):
+        """Arguments de CycleLocations décrivant le rythme des locations."""
+        return {'repos_heures': self.repos_heures, 'duree_minutes': self.duree_minutes,
+                'demande_horaire': self.demande_horaire}
+
+
+def charger_scenario(chemin=None):
+    """Scénario du fichier chemin (ou de settings.SIMULATION['SCENARIO']) fusionné avec le scénario par défaut."""
+    chemin = chemin or getattr(settings, 'SIMULATION', {}).get('SCENARIO')
+    donnees = _lire(SCENARIO_DEFAUT)
+    if chemin:
+        donnees = _fusionner(donnees, _lire(chemin), chemin)
+    return Scenario(donnees, chemin or SCENARIO_DEFAUT)
+
+
+def ajouter_option_scenario(parser):
+    parser.add_argument('--scenario', metavar='FICHIER',
+                        help="Scénario de simulation (TOML, JSON ou YAML) ; voir gestion/scenarios/defaut.toml.")
+
+
+def scenario_des_options(options):
+    try:
+        return charger_scenario(options.get('scenario'))
+    except ScenarioInvalide as erreur:
+        raise CommandError(f"Scénario invalide : {erreur}")
@@ -0,0 +1,91 @@
+# CODE pour gestion/signals.py
+#
+# Invalidation des caches : toute modification d'un vélo, d'une station, d'une location ou d'un ticket
+# incrémente la version de sa table (voir gestion.versions). Les écritures en masse (COPY, bulk_update, TRUNCATE) ne
+# déclenchent pas ces signaux : les commandes qui les utilisent appellent incrementer_apres_commit() elles-mêmes.
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import canal
+from .diffusion import diffuser, diffuseur
+from .disponibilite import deplacer
+from .models import Location, Station, TicketSupport, Velo
+from .versions import incrementer_apres_commit
+
+# Champs d'un vélo affichés dans les listes : une sauvegarde limitée à d'autres champs n'invalide rien.
+CHAMPS_VELO_AFFICHES = {'statut', 'station_actuelle', 'station_origine', 'batterie'}
+
+# Champs qui déterminent la ligne de DisponibiliteStation où un vélo est compté.
+CHAMPS_DISPONIBILITE = {'statut', 'station_actuelle'}
+
+
+def _etat(station_id, statut):
+    return None if station_id is None else (station_id, statut)
+
+
+@receiver(pre_save, sender=Velo)
+def velo_avant_enregistrement(sender, instance, update_fields=None, **kwargs):
+    # L'état enregistré en base est relu seulement si la sauvegarde peut le changer. Avec
+    # update_fields, seuls les champs listés sont écrits : les autres gardent leur valeur en base.
+    instance._transition = None
+    champs = CHAMPS_DISPONIBILITE if update_fields is None else CHAMPS_DISPONIBILITE & set(update_fields)
+    if not champs:
+        return
+    precedent = None
+    if instance.pk is not None:
+        precedent = Velo.objects.filter(pk=instance.pk).values_list('station_actuelle_id', 'statut').first()
+    station, statut = precedent or (None, None)
+    if 'station_actuelle' in champs:
+        station = instance.station_actuelle_id
+    if 'statut' in champs:
+        statut = instance.statut
+    instance._transition = (_etat(*precedent) if precedent else None, _etat(station, statut))
+
+
+@receiver(post_save, sender=Velo)
+def velo_enregistre(sender, instance, update_fields=None, **kwargs):
+    if instance._transition is not None:
+        deplacer(*instance._transition)
+    if update_fields is None or CHAMPS_VELO_AFFICHES & set(update_fields):
+        incrementer_apres_commit('velo')
+        # Avec le canal, des abonnés peuvent attendre dans un autre processus.
+        if canal.disponible() or diffuseur.actif:
+            transaction.on_commit(lambda: _diffuser(instance.pk))
+
+
+def _diffuser(velo_id):
+    # Relu après le commit : l'événement décrit l'état enregistré, ville comprise.
+    etat = Velo.objects.filter(pk=velo_id).values(
+        'statut', 'batterie', 'station_actuelle_id', 'station_actuelle__ville__nom').first()
+    if etat is not None:
+        diffuser([{'type': 'velo', 'velo_id': velo_id, 'ville': etat.pop('station_actuelle__ville__nom'), **etat}])
+
+
+@receiver(pre_delete, sender=Velo)
+def velo_avant_suppression(sender, instance, **kwargs):
+    # État relu en base : l'instance peut ne pas refléter ce qui est enregistré (sauvegarde avec update_fields).
+    precedent = Velo.objects.filter(pk=instance.pk).values_list('station_actuelle_id', 'statut').first()
+    instance._etat_supprime = _etat(*precedent) if precedent else None
+
+
+@receiver(post_delete, sender=Velo)
+def velo_supprime(sender, instance, **kwargs):
+    deplacer(getattr(instance, '_etat_supprime', None), None)
+    incrementer_apres_commit('velo')
+
+
+@receiver([post_save, post_delete], sender=Station)
+def station_modifiee(sender, instance, **kwargs):
+    incrementer_apres_commit('station')
+
+
+@receiver([post_save, post_delete], sender=Location)
+def location_modifiee(sender, instance, **kwargs):
+    incrementer_apres_commit('location')
+
+
+@receiver([post_save, post_delete], sender=TicketSupport)
+def ticket_modifie(sender, instance, **kwargs):
+    incrementer_apres_commit('ticket')
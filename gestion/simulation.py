@@ -0,0 +1,244 @@
+# CODE pour gestion/simulation.py
+#
+# Noyau de simulation à événements discrets commun à generate_history et generate_files.
+# Les événements datés (début et fin de location, contrôle de batterie, maintenance) sont rangés
+# dans un tas : le temps saute directement d'un événement au suivant, le coût est proportionnel
+# au nombre d'événements et non au nombre de pas de 30 s. La télémétrie par pas est dérivée
+# ensuite, à la demande, des trajets et des niveaux de batterie (voir gestion/trajectory.py).
+#
+# Chaque vélo tire ses valeurs aléatoires dans son propre générateur : l'entrelacement des
+# événements de vélos différents ne change pas le résultat, qui reste celui des anciennes boucles.
+# Un vélo peut aussi reprendre à une date donnée (modes incrémentaux, voir EtatSimulation) : son
+# générateur dépend alors aussi de cette date, pour ne pas rejouer les tirages du run précédent.
+
+import heapq
+import itertools
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from gestion.aleatoire import FLUX_HISTORIQUE, FLUX_TELEMETRIE, generateur
+from gestion.trajectory import PAS_PAR_DEFAUT, SEUIL_BATTERIE_FAIBLE, assembler_chronologie, indices_trajets
+
+DEBUT_LOCATION = 'debut_location'
+FIN_LOCATION = 'fin_location'
+BATTERIE = 'batterie'
+MAINTENANCE = 'maintenance'
+
+Evenement = namedtuple('Evenement', 'date type velo_id donnees')
+
+
+def _generateur(seed, flux, velo_id, reprise):
+    return generateur(seed, flux, velo_id) if reprise is None else \
+        generateur(seed, flux, velo_id, int(reprise.timestamp()))
+
+
+class Simulation:
+    """File de priorité d'événements datés entre debut et fin (exclue)."""
+
+    def __init__(self, debut, fin):
+        self.debut, self.fin = debut, fin
+        self.maintenant = debut
+        self.nb_evenements = 0
+        self._tas = []
+        self._sequence = itertools.count()  # à date égale, ordre de planification
+        self._gestionnaires = {}
+
+    def sur(self, type_evenement, gestionnaire):
+        self._gestionnaires[type_evenement] = gestionnaire
+
+    def planifier(self, date, type_evenement, velo_id, **donnees):
+        """Ajoute un événement ; renvoie False (et n'ajoute rien) s'il tombe après la fin de la simulation."""
+        if date >= self.fin:
+            return False
+        heapq.heappush(self._tas, (date, next(self._sequence), Evenement(date, type_evenement, velo_id, donnees)))
+        return True
+
+    def executer(self, temps_reel=False, acceleration=1.0):
+        """
+        Traite les événements dans l'ordre chronologique jusqu'à épuisement de la file.
+        En temps réel, chaque événement attend son heure : debut correspond au lancement,
+        et la simulation avance acceleration fois plus vite que l'horloge.
+        """
+        lancement = time.monotonic()
+        while self._tas:
+            date, _, evenement = heapq.heappop(self._tas)
+            if temps_reel:
+                attente = lancement + (date - self.debut).total_seconds() / acceleration - time.monotonic()
+                if attente > 0:
+                    time.sleep(attente)
+            self.maintenant = date
+            self._gestionnaires[evenement.type](evenement)
+            self.nb_evenements += 1
+        return self.nb_evenements
+
+
+class CycleLocations:
+    """
+    Cycle repos → location → arrivée des vélos, pour l'historique des locations.
+    villes : {ville_id: (nom, [ids des stations])} ; observateur(type, velo_id, location) est appelé
+    au début et à la fin de chaque location (mode temps réel). Après executer(), prochains_departs
+    donne pour chaque vélo le départ déjà tiré mais tombé après la fin (ou None).
+    repos_heures, duree_minutes et demande_horaire viennent du scénario (voir gestion/scenario.py).
+    """
+
+    def __init__(self, simulation, villes, utilisateurs, weather_service, seed, observateur=None,
+                 repos_heures=(1, 48), duree_minutes=(10, 120), demande_horaire=None):
+        self.simulation = simulation
+        self.villes = villes
+        self.utilisateurs = utilisateurs
+        self.weather_service = weather_service
+        self.seed = seed
+        self.observateur = observateur
+        self.repos_heures, self.duree_minutes = repos_heures, duree_minutes
+        self.demande_horaire = demande_horaire
+        self.rngs, self.stations, self.villes_velos = {}, {}, {}
+        self.locations, self.prochains_departs = {}, {}
+        simulation.sur(DEBUT_LOCATION, self._debut_location)
+        simulation.sur(FIN_LOCATION, self._fin_location)
+
+    def ajouter_velo(self, velo_id, station_id, ville_id, reprise=None, prochain_depart=None):
+        """
+        Sans reprise, le vélo part du début de la simulation. Avec reprise (date de fin du run
+        précédent), il en part, ou du prochain départ déjà tiré par ce run s'il est connu.
+        """
+        self.rngs[velo_id] = _generateur(self.seed, FLUX_HISTORIQUE, velo_id, reprise)
+        self.stations[velo_id] = station_id
+        self.villes_velos[velo_id] = ville_id
+        self.locations[velo_id] = []
+        if prochain_depart is not None:
+            self._planifier(velo_id, max(prochain_depart, reprise or self.simulation.debut))
+        else:
+            self._planifier_depart(velo_id, reprise or self.simulation.debut)
+
+    def _planifier_depart(self, velo_id, apres):
+        temps_repos_heures = self.rngs[velo_id].uniform(*self.repos_heures)
+        self._planifier(velo_id, apres + timedelta(hours=temps_repos_heures))
+
+    def _planifier(self, velo_id, depart):
+        planifie = self.simulation.planifier(depart, DEBUT_LOCATION, velo_id)
+        self.prochains_departs[velo_id] = None if planifie else depart
+
+    def _debut_location(self, evenement):
+        velo_id, heure_depart = evenement.velo_id, evenement.date
+        rng = self.rngs[velo_id]
+        velo_ville, stations_de_la_ville = self.villes[self.villes_velos[velo_id]]
+
+        if self.weather_service.get_weather(velo_ville, heure_depart)['condition'] == 'pluie':
+            self._planifier_depart(velo_id, heure_depart + timedelta(hours=1))
+            return
+        # Demande horaire : le départ n'a lieu qu'avec la probabilité de l'heure, sinon il est repoussé.
+        if self.demande_horaire and rng.random() >= self.demande_horaire[timezone.localtime(heure_depart).hour]:
+            self._planifier_depart(velo_id, heure_depart + timedelta(hours=1))
+            return
+
+        station_depart = self.stations[velo_id]
+        stations_possibles = [s for s in stations_de_la_ville if s != station_depart]
+        if not stations_possibles:
+            self._planifier_depart(velo_id, heure_depart + timedelta(days=1))
+            return
+
+        station_arrivee = stations_possibles[rng.integers(len(stations_possibles))]
+        duree_min, duree_max = self.duree_minutes
+        heure_fin = heure_depart + timedelta(minutes=int(rng.integers(duree_min, duree_max + 1)))
+        if heure_fin >= self.simulation.fin:
+            return
+        location = (self.utilisateurs[rng.integers(len(self.utilisateurs))], station_depart, station_arrivee,
+                    heure_depart, heure_fin)
+        self.simulation.planifier(heure_fin, FIN_LOCATION, velo_id, location=location)
+        if self.observateur:
+            self.observateur(DEBUT_LOCATION, velo_id, location)
+
+    def _fin_location(self, evenement):
+        velo_id, location = evenement.velo_id, evenement.donnees['location']
+        self.locations[velo_id].append(location)
+        self.stations[velo_id] = location[2]
+        if self.observateur:
+            self.observateur(FIN_LOCATION, velo_id, location)
+        self._planifier_depart(velo_id, evenement.date)
+
+
+class CycleBatterie:
+    """
+    Batterie des vélos le long de trajets connus, pour la télémétrie : décharge pendant chaque
+    location, contrôle à l'arrivée (ticket si batterie faible) puis recharge en maintenance.
+    Les événements tombent sur la grille des pas de la télémétrie, comme dans la boucle d'origine.
+    """
+
+    def __init__(self, simulation, seed, fin, pas=PAS_PAR_DEFAUT, itineraires=None):
+        # fin est le dernier pas possible de la télémétrie : la simulation doit aller au-delà de fin.
+        self.simulation = simulation
+        self.seed = seed
+        self.fin = fin
+        self.pas = pas
+        self.itineraires = itineraires
+        self.velos = {}
+        simulation.sur(DEBUT_LOCATION, self._debut_location)
+        simulation.sur(FIN_LOCATION, self._fin_location)
+        simulation.sur(BATTERIE, self._controle_batterie)
+        simulation.sur(MAINTENANCE, self._maintenance)
+
+    def _date_du_pas(self, i):
+        return self.simulation.debut + self.pas * int(i)
+
+    def ajouter_velo(self, velo_id, trajets, position_initiale, batterie=100.0, reprise=None, capacite=1.0):
+        """
+        trajets : les locations qui finissent après le début de la simulation, y compris celle en cours.
+        Avec reprise (mode incrémental), batterie est le niveau laissé par le run précédent. capacite
+        est la part de la capacité nominale qui reste à la batterie (voir gestion/flotte.py).
+        """
+        indices = indices_trajets(trajets, self.simulation.debut, self.fin, self.pas)
+        niveaux_repos = np.full(len(trajets) + 1, 100.0)
+        niveaux_repos[0] = batterie
+        self.velos[velo_id] = {
+            'trajets': trajets, 'position_initiale': position_initiale, 'indices': indices,
+            'rng': _generateur(self.seed, FLUX_TELEMETRIE, velo_id, reprise),
+            'batterie': batterie, 'capacite': capacite, 'niveaux_repos': niveaux_repos, 'decharges': [],
+            'tickets': [],
+        }
+        for j in range(len(trajets)):
+            i0, i1, arrivee = indices.en_trajet_debut[j], indices.en_trajet_fin[j], indices.arrivee[j]
+            if i0 >= indices.n:
+                break
+            if i1 > i0:
+                self.simulation.planifier(self._date_du_pas(i0), DEBUT_LOCATION, velo_id, trajet=j)
+            if arrivee >= indices.n:
+                break
+            self.simulation.planifier(self._date_du_pas(arrivee), FIN_LOCATION, velo_id, trajet=j)
+
+    def _debut_location(self, evenement):
+        # Un pas en trajet implique date_debut <= pas < date_fin, donc une durée > 0.
+        velo, j = self.velos[evenement.velo_id], evenement.donnees['trajet']
+        i0, i1 = velo['indices'].en_trajet_debut[j], velo['indices'].en_trajet_fin[j]
+        trajet = velo['trajets'][j]
+        duree_s = (trajet.date_fin - trajet.date_debut).total_seconds()
+        # Une batterie usée perd plus de points de charge pour le même trajet.
+        drains = velo['rng'].uniform(10, 25, i1 - i0) / (duree_s / self.pas.total_seconds()) / velo['capacite']
+        cumul = np.maximum(np.subtract.accumulate(np.concatenate(([velo['batterie']], drains)))[1:], 0.0)
+        velo['decharges'].append((i0, i1, cumul))
+        velo['batterie'] = float(cumul[-1])
+
+    def _fin_location(self, evenement):
+        self.simulation.planifier(evenement.date, BATTERIE, evenement.velo_id, **evenement.donnees)
+
+    def _controle_batterie(self, evenement):
+        velo, j = self.velos[evenement.velo_id], evenement.donnees['trajet']
+        if velo['batterie'] < SEUIL_BATTERIE_FAIBLE and velo['rng'].random() < 0.8:
+            velo['tickets'].append((j, velo['batterie']))
+            self.simulation.planifier(evenement.date, MAINTENANCE, evenement.velo_id, trajet=j)
+        else:
+            velo['niveaux_repos'][j + 1] = velo['batterie']
+
+    def _maintenance(self, evenement):
+        velo, j = self.velos[evenement.velo_id], evenement.donnees['trajet']
+        velo['batterie'] = 100.0
+        velo['niveaux_repos'][j + 1] = 100.0
+
+    def chronologie(self, velo_id):
+        """Télémétrie pas à pas d'un vélo, dérivée après la simulation ; le vélo est ensuite oublié."""
+        velo = self.velos.pop(velo_id)
+        return assembler_chronologie(velo['indices'], velo['trajets'], velo['position_initiale'],
+                                     velo['niveaux_repos'], velo['decharges'], velo['tickets'], self.itineraires)
@@ -0,0 +1,171 @@
+# CODE pour gestion/spatial.py
+#
+# Index spatial des stations, pour « la station la plus proche avec un vélo disponible » ou « les
+# vélos à moins de 500 m » sans parcourir toute la table ni calculer une distance par ligne en
+# Python. Les stations sont rangées dans une grille de cellules de TAILLE_CELLULE degrés (NumPy) :
+# une requête ne lit que les cellules voisines du point, anneau par anneau, et calcule les
+# distances (haversine) de leurs seules stations d'un coup.
+#
+# IndexStations ne dépend pas de la base : le simulateur peut en construire un à partir de ses
+# propres tableaux. index_stations() renvoie celui des stations de la base, reconstruit dès que la
+# version de la table des stations change (voir gestion/versions.py et gestion/signals.py).
+
+import math
+
+import numpy as np
+
+from .models import DisponibiliteStation, Station, Velo
+from .versions import version
+
+RAYON_TERRE_KM = 6371.0
+METRES_PAR_DEGRE = RAYON_TERRE_KM * 1000 * math.pi / 180
+TAILLE_CELLULE = 0.01  # degrés, environ 1 km en latitude
+
+
+def _deltas(lat, rayon_m):
+    """Demi-côtés en degrés (latitude, longitude) du rectangle qui englobe le cercle de rayon_m mètres."""
+    delta_lat = rayon_m / METRES_PAR_DEGRE
+    return delta_lat, delta_lat / max(math.cos(math.radians(min(abs(lat) + delta_lat, 89.9))), 1e-6)
+
+
+def matrice_distances(lat1, lon1, lat2, lon2):
+    """Distances haversine en km entre les points (lat1, lon1) (lignes) et (lat2, lon2) (colonnes)."""
+    lat1, lon1 = np.radians(lat1)[:, None], np.radians(lon1)[:, None]
+    lat2, lon2 = np.radians(lat2)[None, :], np.radians(lon2)[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class IndexStations:
+    """Grille des stations ; les résultats sont des listes de (station_id, distance en mètres), du plus proche au plus loin."""
+
+    def __init__(self, ids, latitudes, longitudes, taille_cellule=TAILLE_CELLULE):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.taille = taille_cellule
+        self._lat_rad, self._lon_rad = np.radians(self.latitudes), np.radians(self.longitudes)
+        self._cos_lat = np.cos(self._lat_rad)
+
+        lignes = np.floor(self.latitudes / taille_cellule).astype(np.int64)
+        colonnes = np.floor(self.longitudes / taille_cellule).astype(np.int64)
+        ordre = np.lexsort((colonnes, lignes))
+        cles = np.stack((lignes[ordre], colonnes[ordre]), axis=1)
+        debuts = np.flatnonzero(np.r_[True, np.any(cles[1:] != cles[:-1], axis=1)]) if len(ordre) else []
+        self.cellules = {(int(cles[d, 0]), int(cles[d, 1])): ordre[d:f]
+                         for d, f in zip(debuts, list(debuts[1:]) + [len(ordre)])}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def masque(self, station_ids):
+        """Masque des stations retenues, à passer à proches() ou dans_rayon()."""
+        return np.isin(self.ids, np.fromiter(station_ids, dtype=np.int64))
+
+    def _cellule(self, lat, lon):
+        return math.floor(lat / self.taille), math.floor(lon / self.taille)
+
+    def _distances_m(self, lat, lon, indices):
+        lat_rad, lon_rad = math.radians(lat), math.radians(lon)
+        a = np.sin((self._lat_rad[indices] - lat_rad) / 2) ** 2 \
+            + math.cos(lat_rad) * self._cos_lat[indices] * np.sin((self._lon_rad[indices] - lon_rad) / 2) ** 2
+        return 2 * RAYON_TERRE_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _resultat(self, lat, lon, indices, masque=None, k=None, rayon_m=None, distances=None):
+        if masque is not None:
+            indices = indices[masque[indices]]
+        if distances is None:
+            distances = self._distances_m(lat, lon, indices)
+        if rayon_m is not None:
+            garder = distances <= rayon_m
+            indices, distances = indices[garder], distances[garder]
+        if k is not None and k < len(indices):
+            plus_proches = np.argpartition(distances, k - 1)[:k]
+            indices, distances = indices[plus_proches], distances[plus_proches]
+        ordre = np.argsort(distances, kind='stable')
+        return list(zip(self.ids[indices[ordre]].tolist(), distances[ordre].tolist()))
+
+    def _anneau(self, ligne, colonne, r):
+        if r == 0:
+            cellule = self.cellules.get((ligne, colonne))
+            return [] if cellule is None else [cellule]
+        cles = [(ligne + dl, colonne + dc) for dl in (-r, r) for dc in range(-r, r + 1)] \
+            + [(ligne + dl, colonne + dc) for dl in range(-r + 1, r) for dc in (-r, r)]
+        return [self.cellules[cle] for cle in cles if cle in self.cellules]
+
+    def proches(self, lat, lon, k=1, masque=None):
+        """Les k stations les plus proches de (lat, lon) parmi celles du masque."""
+        ligne, colonne = self._cellule(lat, lon)
+        candidats, r = self._anneau(ligne, colonne, 0), 1
+        # Au-delà d'un anneau de plus de cellules qu'il n'en existe, autant tout parcourir.
+        while 8 * r <= len(self.cellules):
+            candidats.extend(self._anneau(ligne, colonne, r))
+            if candidats:
+                indices = np.concatenate(candidats)
+                if masque is not None:
+                    indices = indices[masque[indices]]
+                if len(indices) >= k:
+                    # Une station hors des anneaux déjà lus est à plus de r cellules du point.
+                    lat_max = min(abs(lat) + (r + 1) * self.taille, 90.0)
+                    borne = r * self.taille * METRES_PAR_DEGRE * math.cos(math.radians(lat_max))
+                    distances = self._distances_m(lat, lon, indices)
+                    if np.partition(distances, k - 1)[k - 1] <= borne:
+                        return self._resultat(lat, lon, indices, k=k, distances=distances)
+            r += 1
+        return self._resultat(lat, lon, np.arange(len(self.ids)), masque, k=k)
+
+    def dans_rayon(self, lat, lon, rayon_m, masque=None):
+        """Les stations à moins de rayon_m mètres de (lat, lon) parmi celles du masque."""
+        delta_lat, delta_lon = _deltas(lat, rayon_m)
+        l0, c0 = self._cellule(lat - delta_lat, lon - delta_lon)
+        l1, c1 = self._cellule(lat + delta_lat, lon + delta_lon)
+        if (l1 - l0 + 1) * (c1 - c0 + 1) > len(self.cellules):
+            indices = np.arange(len(self.ids))
+        else:
+            cellules = [self.cellules[(l, c)] for l in range(l0, l1 + 1) for c in range(c0, c1 + 1)
+                        if (l, c) in self.cellules]
+            indices = np.concatenate(cellules) if cellules else np.empty(0, dtype=np.int64)
+        return self._resultat(lat, lon, indices, masque, rayon_m=rayon_m)
+
+
+_index = (None, None)  # (version de la table des stations, index)
+
+
+def index_stations():
+    """Index des stations de la base, reconstruit quand une station est ajoutée, modifiée ou supprimée."""
+    global _index
+    version_stations = version('station')
+    if _index[0] != version_stations:
+        lignes = list(Station.objects.order_by('id').values_list('id', 'latitude', 'longitude'))
+        _index = (version_stations, IndexStations([l[0] for l in lignes], [l[1] for l in lignes],
+                                                  [l[2] for l in lignes]))
+    return _index[1]
+
+
+def stations_disponibles():
+    """Ids des stations où au moins un vélo est disponible (lu dans DisponibiliteStation)."""
+    return DisponibiliteStation.objects.filter(statut=Velo.StatutVelo.DISPONIBLE, nombre__gt=0) \
+        .values_list('station_id', flat=True)
+
+
+def stations_proches(lat, lon, k=1, disponibles=False):
+    """Les k stations les plus proches, éventuellement limitées à celles qui ont un vélo disponible."""
+    index = index_stations()
+    return index.proches(lat, lon, k, index.masque(stations_disponibles()) if disponibles else None)
+
+
+def velos_dans_rayon(lat, lon, rayon_m, statut=Velo.StatutVelo.DISPONIBLE):
+    """
+    Vélos garés à moins de rayon_m mètres, du plus proche au plus loin : dictionnaires (id, statut,
+    batterie, station_actuelle_id, distance_m). Un vélo est à la position de sa station actuelle.
+    """
+    stations = dict(index_stations().dans_rayon(lat, lon, rayon_m))
+    if not stations:
+        return []
+    velos = Velo.objects.filter(station_actuelle_id__in=stations)
+    if statut is not None:
+        velos = velos.filter(statut=statut)
+    lignes = list(velos.order_by('id').values('id', 'statut', 'batterie', 'station_actuelle_id'))
+    for ligne in lignes:
+        ligne['distance_m'] = round(stations[ligne['station_actuelle_id']], 1)
+    return sorted(lignes, key=lambda ligne: ligne['distance_m'])
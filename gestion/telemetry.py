@@ -0,0 +1,356 @@
+# CODE pour gestion/telemetry.py
+#
+# Écriture et lecture des données IoT produites par generate_files.
+# Trois formats de sortie sont disponibles :
+#   - legacy   : un fichier JSON indenté par vélo et par pas de 30 s (format historique v3) ;
+#   - ndjson   : un fichier JSON compact (une ligne par point) par jour, avec un index par vélo ;
+#   - columnar : un fichier binaire par jour, découpé en blocs (un bloc par vélo) de colonnes
+#                à largeur fixe, avec un index en pied de fichier.
+
+import bisect
+import json
+import os
+import re
+import shutil
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+FORMATS = ('legacy', 'ndjson', 'columnar')
+
+STATUTS = ('disponible', 'en_location')
+CODES_STATUT = {statut: code for code, statut in enumerate(STATUTS)}
+
+# Colonnes du format binaire : (nom, type NumPy petit-boutiste à largeur fixe)
+COLONNES = (
+    ('timestamp', np.dtype('<i8')),
+    ('velo_id', np.dtype('<u4')),
+    ('statut', np.dtype('u1')),
+    ('batterie', np.dtype('<f4')),
+    ('latitude', np.dtype('<f8')),
+    ('longitude', np.dtype('<f8')),
+)
+
+FICHIER_NDJSON = 'telemetrie.ndjson'
+FICHIER_INDEX_NDJSON = 'telemetrie.ndjson.idx'
+FICHIER_COLONNES = 'telemetrie.col'
+
+MAGIE = b'VTELCOL1'
+ENTREE_INDEX = struct.Struct('<IQI')  # velo_id, offset du bloc, nombre de points
+PIED = struct.Struct('<QI8s')  # offset de l'index, nombre d'entrées, MAGIE
+
+FORMAT_JOUR = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def _jour_local(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.get_current_timezone())
+
+
+def _decouper_par_jour(timestamps):
+    """Découpe une suite de timestamps triés en tranches (jour, début, fin) selon le fuseau courant."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    n = len(timestamps)
+    i = 0
+    while i < n:
+        debut_jour = _jour_local(int(timestamps[i]))
+        lendemain = timezone.make_aware(datetime.combine(debut_jour.date() + timedelta(days=1), datetime.min.time()))
+        j = int(np.searchsorted(timestamps, int(lendemain.timestamp())))
+        yield debut_jour.strftime('%Y-%m-%d'), i, j
+        i = j
+
+
+def _en_listes(*colonnes):
+    """Les writers texte formatent des floats Python : on convertit une fois les colonnes NumPy."""
+    return [c.tolist() if isinstance(c, np.ndarray) else list(c) for c in colonnes]
+
+
+def _point_json(ts, velo_id, statut, batterie, lat, lon):
+    return {
+        'timestamp': _jour_local(ts).isoformat(), 'velo_id': velo_id,
+        'statut': STATUTS[statut], 'batterie': round(batterie, 2),
+        'position': {'latitude': lat, 'longitude': lon}
+    }
+
+
+class TelemetryWriter:
+    """
+    Interface commune : write() reçoit toute la chronologie d'un vélo (listes ou tableaux NumPy,
+    timestamps en secondes epoch triés), close() finalise les partitions.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def _dossier_jour(self, jour):
+        dossier = os.path.join(self.output_dir, jour)
+        os.makedirs(dossier, exist_ok=True)
+        return dossier
+
+    def write(self, velo_id, timestamps, statuts, batteries, lats, lons):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @classmethod
+    def fusionner(cls, dossiers, output_dir):
+        """
+        Réunit dans output_dir les partitions écrites séparément par chaque shard.
+        Les dossiers sont donnés dans l'ordre des vélos : le résultat est identique à une écriture en série.
+        """
+        raise NotImplementedError
+
+
+class LegacyWriter(TelemetryWriter):
+    """Format historique : output_data_v3/<jour>/velo_<id>/<HH-MM-SS>.json."""
+
+    def write(self, velo_id, timestamps, statuts, batteries, lats, lons):
+        timestamps, statuts, batteries, lats, lons = _en_listes(timestamps, statuts, batteries, lats, lons)
+        for jour, i0, i1 in _decouper_par_jour(timestamps):
+            velo_folder = os.path.join(self._dossier_jour(jour), f"velo_{velo_id}")
+            os.makedirs(velo_folder, exist_ok=True)
+            for i in range(i0, i1):
+                data_point = _point_json(timestamps[i], velo_id, statuts[i], batteries[i], lats[i], lons[i])
+                filename = f"{_jour_local(timestamps[i]).strftime('%H-%M-%S')}.json"
+                with open(os.path.join(velo_folder, filename), 'w', encoding='utf-8') as f:
+                    json.dump(data_point, f, indent=2)
+
+    @classmethod
+    def fusionner(cls, dossiers, output_dir):
+        # Un fichier par point : les shards peuvent écrire directement dans output_dir, rien à réunir.
+        pass
+
+
+class NdjsonWriter(TelemetryWriter):
+    """Un fichier <jour>/telemetrie.ndjson par jour ; l'index donne (offset, longueur, nb_points) par vélo."""
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self.index = {}
+
+    def write(self, velo_id, timestamps, statuts, batteries, lats, lons):
+        timestamps, statuts, batteries, lats, lons = _en_listes(timestamps, statuts, batteries, lats, lons)
+        for jour, i0, i1 in _decouper_par_jour(timestamps):
+            chemin = os.path.join(self._dossier_jour(jour), FICHIER_NDJSON)
+            index_jour = self.index.get(jour)
+            if index_jour is None:
+                # Première écriture de ce run dans cette partition : on écrase l'éventuel fichier précédent.
+                index_jour = self.index[jour] = {}
+                open(chemin, 'wb').close()
+            lignes = ''.join(
+                json.dumps(_point_json(timestamps[i], velo_id, statuts[i], batteries[i], lats[i], lons[i]),
+                           separators=(',', ':')) + '\n'
+                for i in range(i0, i1)
+            ).encode('utf-8')
+            with open(chemin, 'ab') as f:
+                offset = f.tell()
+                f.write(lignes)
+            index_jour[str(velo_id)] = [offset, len(lignes), i1 - i0]
+
+    def close(self):
+        for jour, index_jour in self.index.items():
+            with open(os.path.join(self.output_dir, jour, FICHIER_INDEX_NDJSON), 'w', encoding='utf-8') as f:
+                json.dump(index_jour, f, separators=(',', ':'))
+        self.index = {}
+
+    @classmethod
+    def fusionner(cls, dossiers, output_dir):
+        for jour in sorted({jour for dossier in dossiers for jour in lister_jours(dossier)}):
+            os.makedirs(os.path.join(output_dir, jour), exist_ok=True)
+            index_jour = {}
+            with open(os.path.join(output_dir, jour, FICHIER_NDJSON), 'wb') as sortie:
+                for dossier in dossiers:
+                    partie = os.path.join(dossier, jour, FICHIER_NDJSON)
+                    if not os.path.exists(partie):
+                        continue
+                    decalage = sortie.tell()
+                    with open(partie, 'rb') as f:
+                        shutil.copyfileobj(f, sortie)
+                    with open(os.path.join(dossier, jour, FICHIER_INDEX_NDJSON), encoding='utf-8') as f:
+                        for velo_id, (offset, longueur, n) in json.load(f).items():
+                            index_jour[velo_id] = [offset + decalage, longueur, n]
+            with open(os.path.join(output_dir, jour, FICHIER_INDEX_NDJSON), 'w', encoding='utf-8') as f:
+                json.dump(index_jour, f, separators=(',', ':'))
+
+
+class ColumnarWriter(TelemetryWriter):
+    """Un fichier binaire <jour>/telemetrie.col par jour : un bloc de colonnes par vélo, index en pied."""
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self.index = {}
+
+    def write(self, velo_id, timestamps, statuts, batteries, lats, lons):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        batteries = np.round(np.asarray(batteries, dtype=np.float64), 2)
+        for jour, i0, i1 in _decouper_par_jour(timestamps):
+            n = i1 - i0
+            chemin = os.path.join(self._dossier_jour(jour), FICHIER_COLONNES)
+            index_jour = self.index.get(jour)
+            if index_jour is None:
+                index_jour = self.index[jour] = []
+                with open(chemin, 'wb') as f:
+                    f.write(MAGIE)
+            colonnes = (
+                timestamps[i0:i1], np.full(n, velo_id), statuts[i0:i1],
+                batteries[i0:i1], lats[i0:i1], lons[i0:i1],
+            )
+            with open(chemin, 'ab') as f:
+                offset = f.tell()
+                for (_, dtype), valeurs in zip(COLONNES, colonnes):
+                    f.write(np.ascontiguousarray(valeurs, dtype=dtype).tobytes())
+            index_jour.append((velo_id, offset, n))
+
+    def close(self):
+        for jour, index_jour in self.index.items():
+            index_jour.sort()
+            with open(os.path.join(self.output_dir, jour, FICHIER_COLONNES), 'ab') as f:
+                offset_index = f.tell()
+                for entree in index_jour:
+                    f.write(ENTREE_INDEX.pack(*entree))
+                f.write(PIED.pack(offset_index, len(index_jour), MAGIE))
+        self.index = {}
+
+    @classmethod
+    def fusionner(cls, dossiers, output_dir):
+        for jour in sorted({jour for dossier in dossiers for jour in lister_jours(dossier)}):
+            os.makedirs(os.path.join(output_dir, jour), exist_ok=True)
+            index_jour = []
+            with open(os.path.join(output_dir, jour, FICHIER_COLONNES), 'wb') as sortie:
+                sortie.write(MAGIE)
+                for dossier in dossiers:
+                    partie = os.path.join(dossier, jour, FICHIER_COLONNES)
+                    if not os.path.exists(partie):
+                        continue
+                    with open(partie, 'rb') as f:
+                        index, offset_index = _lire_index_colonnes(f, partie)
+                        # Les blocs sont recopiés tels quels, seul leur offset change.
+                        decalage = sortie.tell() - len(MAGIE)
+                        f.seek(len(MAGIE))
+                        sortie.write(f.read(offset_index - len(MAGIE)))
+                    index_jour.extend((velo_id, offset + decalage, n) for velo_id, offset, n in index)
+                index_jour.sort()
+                offset_index = sortie.tell()
+                for entree in index_jour:
+                    sortie.write(ENTREE_INDEX.pack(*entree))
+                sortie.write(PIED.pack(offset_index, len(index_jour), MAGIE))
+
+
+WRITERS = {'legacy': LegacyWriter, 'ndjson': NdjsonWriter, 'columnar': ColumnarWriter}
+
+
+def get_writer(format_sortie, output_dir):
+    return WRITERS[format_sortie](output_dir)
+
+
+def fusionner_partitions(format_sortie, dossiers, output_dir):
+    WRITERS[format_sortie].fusionner(dossiers, output_dir)
+
+
+# --- Lecture ---
+
+def lister_jours(output_dir):
+    """Renvoie les jours (AAAA-MM-JJ) présents dans le dossier de sortie, triés."""
+    if not os.path.isdir(output_dir):
+        return []
+    return sorted(nom for nom in os.listdir(output_dir)
+                  if FORMAT_JOUR.match(nom) and os.path.isdir(os.path.join(output_dir, nom)))
+
+
+def detecter_format(output_dir, jour):
+    dossier = os.path.join(output_dir, jour)
+    if os.path.exists(os.path.join(dossier, FICHIER_COLONNES)):
+        return 'columnar'
+    if os.path.exists(os.path.join(dossier, FICHIER_NDJSON)):
+        return 'ndjson'
+    return 'legacy'
+
+
+def _dans_plage(velo_id, velo_min, velo_max):
+    return (velo_min is None or velo_id >= velo_min) and (velo_max is None or velo_id <= velo_max)
+
+
+def _colonnes_vides():
+    return {nom: [] for nom, _ in COLONNES}
+
+
+def _en_tableaux(colonnes):
+    return {nom: np.concatenate(colonnes[nom]) if colonnes[nom] and isinstance(colonnes[nom][0], np.ndarray)
+            else np.array(colonnes[nom], dtype=dtype) for nom, dtype in COLONNES}
+
+
+def _ajouter_point(colonnes, point):
+    colonnes['timestamp'].append(int(datetime.fromisoformat(point['timestamp']).timestamp()))
+    colonnes['velo_id'].append(point['velo_id'])
+    colonnes['statut'].append(CODES_STATUT[point['statut']])
+    colonnes['batterie'].append(point['batterie'])
+    colonnes['latitude'].append(point['position']['latitude'])
+    colonnes['longitude'].append(point['position']['longitude'])
+
+
+def _lire_index_colonnes(f, chemin):
+    """Lit le pied et l'index d'une partition binaire ; renvoie ([(velo_id, offset, n)], offset de l'index)."""
+    f.seek(-PIED.size, os.SEEK_END)
+    offset_index, nb_entrees, magie = PIED.unpack(f.read(PIED.size))
+    if magie != MAGIE:
+        raise ValueError(f"Partition incomplète ou corrompue : {chemin}")
+    f.seek(offset_index)
+    return list(ENTREE_INDEX.iter_unpack(f.read(nb_entrees * ENTREE_INDEX.size))), offset_index
+
+
+def _lire_columnar(dossier, velo_min, velo_max):
+    colonnes = _colonnes_vides()
+    chemin = os.path.join(dossier, FICHIER_COLONNES)
+    with open(chemin, 'rb') as f:
+        index, _ = _lire_index_colonnes(f, chemin)
+        # L'index est trié par velo_id : on ne lit que les blocs de la plage demandée.
+        ids = [entree[0] for entree in index]
+        debut = bisect.bisect_left(ids, velo_min) if velo_min is not None else 0
+        fin = bisect.bisect_right(ids, velo_max) if velo_max is not None else len(ids)
+        for _, offset, n in index[debut:fin]:
+            f.seek(offset)
+            for nom, dtype in COLONNES:
+                colonnes[nom].append(np.frombuffer(f.read(n * dtype.itemsize), dtype=dtype))
+    return _en_tableaux(colonnes)
+
+
+def _lire_ndjson(dossier, velo_min, velo_max):
+    colonnes = _colonnes_vides()
+    with open(os.path.join(dossier, FICHIER_INDEX_NDJSON), encoding='utf-8') as f:
+        index = json.load(f)
+    selection = sorted((int(velo_id), offset, longueur) for velo_id, (offset, longueur, _) in index.items()
+                       if _dans_plage(int(velo_id), velo_min, velo_max))
+    with open(os.path.join(dossier, FICHIER_NDJSON), 'rb') as f:
+        for _, offset, longueur in selection:
+            f.seek(offset)
+            for ligne in f.read(longueur).splitlines():
+                _ajouter_point(colonnes, json.loads(ligne))
+    return _en_tableaux(colonnes)
+
+
+def _lire_legacy(dossier, velo_min, velo_max):
+    colonnes = _colonnes_vides()
+    velos = sorted(int(nom.split('_', 1)[1]) for nom in os.listdir(dossier) if nom.startswith('velo_'))
+    for velo_id in velos:
+        if not _dans_plage(velo_id, velo_min, velo_max):
+            continue
+        velo_folder = os.path.join(dossier, f"velo_{velo_id}")
+        for filename in sorted(os.listdir(velo_folder)):
+            with open(os.path.join(velo_folder, filename), encoding='utf-8') as f:
+                _ajouter_point(colonnes, json.load(f))
+    return _en_tableaux(colonnes)
+
+
+LECTEURS = {'legacy': _lire_legacy, 'ndjson': _lire_ndjson, 'columnar': _lire_columnar}
+
+
+def lire_jour(output_dir, jour, velo_min=None, velo_max=None):
+    """
+    Charge la partition d'un jour, éventuellement restreinte aux vélos velo_min..velo_max (bornes incluses).
+    Renvoie un dictionnaire {colonne: tableau NumPy} quel que soit le format sur disque ;
+    les points sont triés par vélo puis par timestamp.
+    """
+    dossier = os.path.join(output_dir, jour)
+    return LECTEURS[detecter_format(output_dir, jour)](dossier, velo_min, velo_max)
@@ -1,3 +1,1155 @@
-from django.test import TestCase
+# CODE pour gestion/tests.py
 
-# Create your tests here.
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+from collections import Counter, defaultdict
+import json
+import math
+import os
+import queue
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import canal
+from .aleatoire import FLUX_TELEMETRIE, fin_periode, generateur, graine
+from .analytique import matrice_od
+from .diffusion import Diffuseur
+from .export import exporter_tickets
+from .itineraires import Itineraires, Reseau, calculer_traces
+from .loader import charger
+from .models import (DisponibiliteStation, EtatSimulation, FluxHoraireStation, Location, Station, TicketSupport,
+                     TrajetJournalier, Utilisateur, Velo, Ville)
+from .reequilibrage import planifier, repartir, resoudre
+from .scenario import SCENARIO_DEFAUT, ScenarioInvalide, charger_scenario, scenario_des_options
+from .simulation import CycleBatterie, Simulation
+from .spatial import stations_proches, velos_dans_rayon
+from .telemetry import FORMATS, STATUTS, fusionner_partitions, get_writer, lire_jour, lister_jours
+from .trajectory import PAS_PAR_DEFAUT, Trajet, simuler_velo, simuler_velo_scalaire
+from .utilisateurs import CHAMPS as CHAMPS_UTILISATEUR, MOT_DE_PASSE, generer_utilisateurs
+from .versions import incrementer, version
+from .weather_service import MockWeatherService, get_weather_service
+
+DEBUT = datetime(2025, 8, 1, tzinfo=dt_timezone.utc)
+
+
+def _trajets(graine, nombre, debut=DEBUT):
+    """Trajets tirés au hasard entre deux stations, avec des trajets enchaînés et un trajet de durée nulle."""
+    rng = np.random.default_rng(graine)
+    trajets, date = [], debut + timedelta(seconds=int(rng.integers(0, 600)))
+    position = (45.75, 4.85)
+    for j in range(nombre):
+        duree = timedelta(0) if j == 2 else timedelta(seconds=int(rng.integers(60, 5400)))
+        arrivee = (position[0] + rng.uniform(-0.05, 0.05), position[1] + rng.uniform(-0.05, 0.05))
+        trajets.append(Trajet(date, date + duree, *position, *arrivee))
+        # Trajets 4 et 5 enchaînés sans repos ; ailleurs, repos de quelques minutes à quelques heures.
+        repos = timedelta(0) if j == 4 else timedelta(seconds=int(rng.integers(30, 4 * 3600)))
+        date, position = date + duree + repos, arrivee
+    return trajets
+
+
+class MoteursTrajectoireTests(SimpleTestCase):
+    """Même graine, même chronologie : boucle scalaire de référence, moteur vectoriel et moteur à événements."""
+
+    graine = 1234
+
+    def _chronologies(self, trajets, fin, velo_id=7):
+        position = (trajets[0].lat_depart, trajets[0].lon_depart)
+        scalaire = simuler_velo_scalaire(trajets, position, DEBUT, fin,
+                                         generateur(self.graine, FLUX_TELEMETRIE, velo_id))
+        vectoriel = simuler_velo(trajets, position, DEBUT, fin, generateur(self.graine, FLUX_TELEMETRIE, velo_id))
+        simulation = Simulation(DEBUT, fin + PAS_PAR_DEFAUT)
+        cycle = CycleBatterie(simulation, self.graine, fin)
+        cycle.ajouter_velo(velo_id, trajets, position, capacite=1.0)
+        simulation.executer()
+        return scalaire, vectoriel, cycle.chronologie(velo_id)
+
+    def _comparer(self, reference, chronologie):
+        for champ in ('timestamps', 'statuts', 'batteries', 'lats', 'lons'):
+            with self.subTest(champ=champ):
+                self.assertEqual(list(getattr(reference, champ)), list(getattr(chronologie, champ)))
+        self.assertEqual([(j, float(b)) for j, b in reference.tickets],
+                         [(j, float(b)) for j, b in chronologie.tickets])
+
+    def test_moteurs_identiques(self):
+        for graine_trajets in range(5):
+            trajets = _trajets(graine_trajets, 12)
+            # La fin tombe au milieu du dernier trajet : il déborde de la période.
+            fin = trajets[-1].date_debut + (trajets[-1].date_fin - trajets[-1].date_debut) / 2
+            with self.subTest(graine_trajets=graine_trajets):
+                scalaire, vectoriel, evenements = self._chronologies(trajets, fin)
+                self.assertTrue(len(scalaire.timestamps))
+                self._comparer(scalaire, vectoriel)
+                self._comparer(scalaire, evenements)
+
+    def test_tickets_batterie_faible(self):
+        # Assez de trajets pour vider la batterie plusieurs fois : les tickets sont comparés eux aussi.
+        trajets = _trajets(99, 40)
+        scalaire, vectoriel, evenements = self._chronologies(trajets, trajets[-1].date_fin + timedelta(hours=1))
+        self.assertTrue(scalaire.tickets)
+        self._comparer(scalaire, vectoriel)
+        self._comparer(scalaire, evenements)
+
+
+def _chronologies_telemetrie(velo_ids, graine=0):
+    """{velo_id: (timestamps, statuts, batteries, lats, lons)} : un point toutes les 20 min sur 30 h."""
+    rng = np.random.default_rng(graine)
+    debut, n = int(DEBUT.timestamp()) + 3600, 90
+    return {velo_id: (debut + 1200 * np.arange(n), rng.integers(0, len(STATUTS), n).astype(np.uint8),
+                      rng.uniform(0, 100, n), 45.75 + rng.uniform(-0.05, 0.05, n), 4.85 + rng.uniform(-0.05, 0.05, n))
+            for velo_id in velo_ids}
+
+
+def _creer_flotte(graine=0, nb_velos=6, nb_locations=8):
+    """Petite flotte : une ville, trois stations, des vélos et leurs locations du 1er août 2025."""
+    rng = np.random.default_rng(graine)
+    ville = Ville.objects.create(nom='Lyon')
+    stations = [Station.objects.create(nom=f'Station {k}', ville=ville, latitude=45.75 + 0.01 * k,
+                                       longitude=4.85 - 0.01 * k) for k in range(3)]
+    utilisateur = Utilisateur.objects.create(username='cycliste')
+    for _ in range(nb_velos):
+        velo = Velo.objects.create(station_origine=stations[0], station_actuelle=stations[0])
+        date, station = DEBUT + timedelta(minutes=int(rng.integers(5, 60))), 0
+        for _ in range(nb_locations):
+            arrivee = (station + 1 + int(rng.integers(2))) % 3
+            fin = date + timedelta(minutes=int(rng.integers(10, 120)))
+            Location.objects.create(velo=velo, utilisateur=utilisateur, station_depart=stations[station],
+                                    station_arrivee=stations[arrivee], date_debut=date, date_fin=fin)
+            date, station = fin + timedelta(minutes=int(rng.integers(0, 90))), arrivee
+    return stations
+
+
+def _lire_arbre(dossier):
+    """{chemin relatif: contenu} des partitions de télémétrie (un dossier par jour)."""
+    contenu = {}
+    for racine, _, fichiers in os.walk(dossier):
+        for nom in fichiers:
+            chemin = os.path.join(racine, nom)
+            if os.path.relpath(racine, dossier) != '.':
+                with open(chemin, 'rb') as f:
+                    contenu[os.path.relpath(chemin, dossier)] = f.read()
+    return contenu
+
+
+# Les workers sont des processus distincts : la base de test doit être sur disque et les données
+# validées (TransactionTestCase) pour qu'ils la voient.
+class WorkersTests(TransactionTestCase):
+    """Même graine, même télémétrie, quel que soit le nombre de workers."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Base de test SQLite en mémoire : invisible des workers.")
+        _creer_flotte()
+
+    def _generer(self, workers, *options):
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir):
+            call_command('generate_files', '--seed', '42', '--fin', '2025-08-02T06:00', '--workers', str(workers),
+                         *options, stdout=StringIO())
+            tickets = sorted(TicketSupport.objects.values_list('velo_id', 'type_probleme', 'description'))
+            return _lire_arbre(os.path.join(base_dir, 'output_data_v3')), tickets
+
+    def test_meme_sortie_avec_un_ou_deux_workers(self):
+        for options in (('--format', 'ndjson'), ('--format', 'columnar'), ('--format', 'ndjson', '--moteur', 'vectoriel')):
+            with self.subTest(options=options):
+                arbre_1, tickets_1 = self._generer(1, *options)
+                arbre_2, tickets_2 = self._generer(2, *options)
+                self.assertTrue(arbre_1)
+                self.assertEqual(sorted(arbre_1), sorted(arbre_2))
+                for chemin in arbre_1:
+                    self.assertEqual(arbre_1[chemin], arbre_2[chemin], chemin)
+                self.assertEqual(tickets_1, tickets_2)
+
+
+class ScenarioTests(SimpleTestCase):
+    """Chargement des scénarios TOML, JSON et YAML, fusionnés avec le scénario par défaut, et leurs erreurs."""
+
+    def _charger(self, extension, texte):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'scenario' + extension)
+            with open(chemin, 'w', encoding='utf-8') as f:
+                f.write(texte)
+            return charger_scenario(chemin)
+
+    def test_scenarios_livres(self):
+        defaut = charger_scenario(SCENARIO_DEFAUT)
+        self.assertEqual(defaut.debut_historique, timezone.make_aware(datetime(2025, 8, 28)))
+        self.assertEqual((defaut.velos_par_station, defaut.utilisateurs_historique), (20, 500))
+        self.assertEqual((defaut.duree_minutes, defaut.pas, defaut.format), ((10, 120), timedelta(seconds=30), 'legacy'))
+        self.assertIsNone(defaut.fin)
+        self.assertIsNone(defaut.demande_horaire)
+
+        x10 = charger_scenario(os.path.join(os.path.dirname(SCENARIO_DEFAUT), 'echelle_x10.toml'))
+        self.assertEqual(x10.fin, timezone.make_aware(datetime(2025, 9, 8)))
+        self.assertEqual((x10.velos_par_station, x10.utilisateurs_historique, x10.format), (200, 5000, 'columnar'))
+        self.assertEqual(len(x10.demande_horaire), 24)
+        self.assertEqual(max(x10.demande_horaire), 1.0)
+        # Valeurs absentes du fichier : celles du scénario par défaut.
+        self.assertEqual((x10.repos_heures, x10.pas), (defaut.repos_heures, defaut.pas))
+
+    def test_formats(self):
+        textes = {
+            '.toml': '[flotte]\nvelos_par_station = 3\n[telemetrie]\nformat = "ndjson"\n'
+                     '[periode]\nfin = 2025-09-01T06:00:00\n',
+            '.json': json.dumps({'flotte': {'velos_par_station': 3}, 'telemetrie': {'format': 'ndjson'},
+                                 'periode': {'fin': '2025-09-01T06:00:00'}}),
+            '.yaml': 'flotte:\n  velos_par_station: 3\ntelemetrie:\n  format: ndjson\n'
+                     'periode:\n  fin: 2025-09-01T06:00:00\n',
+        }
+        if importlib.util.find_spec('yaml') is None:
+            del textes['.yaml']
+        for extension, texte in textes.items():
+            with self.subTest(extension=extension):
+                scenario = self._charger(extension, texte)
+                self.assertEqual((scenario.velos_par_station, scenario.format), (3, 'ndjson'))
+                self.assertEqual(scenario.fin, timezone.make_aware(datetime(2025, 9, 1, 6)))
+                self.assertEqual(scenario.utilisateurs_historique, 500)
+
+    def test_scenarios_invalides(self):
+        invalides = {
+            'section inconnue': '[meteo]\npluie = 1\n',
+            'clé inconnue': '[flotte]\nvelos_par_ville = 3\n',
+            'type': '[flotte]\nvelos_par_station = "3"\n',
+            'booléen': '[utilisateurs]\nhistorique = true\n',
+            'nombre négatif': '[flotte]\nvelos = -1\n',
+            'zéro utilisateur': '[utilisateurs]\nhistorique = 0\n',
+            'intervalle': '[locations]\nrepos_heures = [5, 1]\n',
+            'durée trop longue': '[locations]\nduree_minutes = [10, 2000]\n',
+            'demande': '[locations]\ndemande_horaire = [1, 2]\n',
+            'date': '[periode]\ndebut_historique = "fin août"\n',
+            'fin avant le début': '[periode]\nfin = 2025-08-02\n',
+            'format': '[telemetrie]\nformat = "csv"\n',
+            'syntaxe': '[flotte\n',
+        }
+        for cas, texte in invalides.items():
+            with self.subTest(cas=cas), self.assertRaises(ScenarioInvalide):
+                self._charger('.toml', texte)
+        with self.assertRaises(ScenarioInvalide):
+            self._charger('.json', '[1, 2]')
+        with self.assertRaises(ScenarioInvalide):
+            self._charger('.ini', '[flotte]\n')
+        with self.assertRaises(ScenarioInvalide):
+            charger_scenario('/inexistant/scenario.toml')
+        # Dans une commande, l'erreur devient une CommandError.
+        with self.assertRaisesMessage(CommandError, "Scénario invalide"):
+            scenario_des_options({'scenario': '/inexistant/scenario.toml'})
+
+
+SCENARIO_REDUIT = """
+[periode]
+debut_telemetrie = 2025-08-28
+
+[flotte]
+velos_par_station = 2
+
+[utilisateurs]
+historique = 12
+
+[telemetrie]
+pas_secondes = 600
+format = "ndjson"
+"""
+
+
+def _historique():
+    """Locations, utilisateurs et points d'arrêt en base, comparables d'un run à l'autre (IDs réinitialisés)."""
+    return (list(Location.objects.order_by('id').values_list('velo_id', 'utilisateur_id', 'station_depart_id',
+                                                             'station_arrivee_id', 'date_debut', 'date_fin')),
+            list(Utilisateur.objects.order_by('id').values_list('username', 'email')),
+            list(EtatSimulation.objects.order_by('velo_id').values_list('velo_id', 'historique_jusqua',
+                                                                         'prochain_depart')))
+
+
+class GraineTests(SimpleTestCase):
+    def test_graine_negative_refusee(self):
+        with self.assertRaises(CommandError):
+            graine({'seed': -1})
+        self.assertEqual(graine({'seed': 0}), 0)
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir):
+            for commande in ('generate_files', 'generate_history'):
+                with self.subTest(commande=commande), self.assertRaises(CommandError):
+                    call_command(commande, '--seed', '-1', stdout=StringIO())
+
+    def test_fin_avec_ou_sans_fuseau(self):
+        fin = fin_periode({'fin': '2024-01-01T00:00+01:00'})
+        self.assertEqual(fin, datetime(2023, 12, 31, 23, tzinfo=dt_timezone.utc))
+        fin = fin_periode({'fin': '2024-01-01T00:00'})
+        self.assertTrue(timezone.is_aware(fin))
+        self.assertEqual(timezone.localtime(fin).replace(tzinfo=None), datetime(2024, 1, 1))
+
+
+# generate_history vide les tables par TRUNCATE : PostgreSQL seulement.
+class HistoriquePostgresTestCase(TransactionTestCase):
+    """Trois stations, sans vélos, et un scénario réduit (SCENARIO_REDUIT) dans self.scenario."""
+
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("generate_history demande PostgreSQL.")
+        _creer_flotte(nb_velos=0)
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.scenario = os.path.join(dossier.name, 'reduit.toml')
+        with open(self.scenario, 'w') as f:
+            f.write(SCENARIO_REDUIT)
+
+
+class HistoriqueReproductibleTests(HistoriquePostgresTestCase):
+    """Même graine et même --fin, même historique, quel que soit le nombre de workers."""
+
+    def _generer(self, workers, seed=42):
+        call_command('generate_history', '--scenario', self.scenario, '--seed', str(seed), '--fin', '2025-08-31',
+                     '--workers', str(workers), stdout=StringIO())
+        return _historique()
+
+    def test_meme_historique_avec_un_ou_deux_workers(self):
+        historique = self._generer(1)
+        self.assertTrue(historique[0])
+        self.assertEqual(self._generer(1), historique)
+        self.assertEqual(self._generer(2), historique)
+        self.assertNotEqual(self._generer(1, seed=43)[0], historique[0])
+
+
+class IncrementalTests(HistoriquePostgresTestCase):
+    """
+    N jours puis M jours en mode --incremental, comparés à un seul run de N + M jours. Les tirages d'un
+    vélo sont réensemencés à sa reprise (gestion/simulation.py) : seul ce qui précède la coupure est
+    identique ; ensuite, chaque vélo doit repartir de là où il s'est arrêté, sans doublon.
+    """
+
+    coupure = datetime(2025, 8, 30, 12, tzinfo=dt_timezone.utc)
+
+    def _generer(self, *options):
+        for commande in ('generate_history', 'generate_files'):
+            call_command(commande, '--scenario', self.scenario, '--seed', '42', *options, stdout=StringIO())
+
+    def _etat(self, base_dir):
+        sortie = os.path.join(base_dir, 'output_data_v3')
+        locations = sorted(Location.objects.values_list('velo_id', 'date_debut', 'date_fin', 'station_depart_id',
+                                                        'station_arrivee_id', 'utilisateur_id'))
+        etats = list(EtatSimulation.objects.order_by('velo_id').values_list(
+            'velo_id', 'historique_jusqua', 'telemetrie_jusqua'))
+        jours = lister_jours(sortie)
+        points = {jour: list(zip(*(lire_jour(sortie, jour)[colonne].tolist() for colonne in ('velo_id', 'timestamp'))))
+                  for jour in jours}
+        return locations, etats, jours, points, _lire_arbre(sortie)
+
+    def test_prolongation_comme_un_seul_run(self):
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir):
+            self._generer('--fin', '2025-09-02')
+            locations, etats, jours, points, arbre = self._etat(base_dir)
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir):
+            self._generer('--fin', self.coupure.isoformat())
+            self.assertEqual(EtatSimulation.objects.exclude(historique_jusqua=self.coupure).count(), 0)
+            self._generer('--incremental', '--fin', '2025-09-02')
+            locations_2, etats_2, jours_2, points_2, arbre_2 = self._etat(base_dir)
+
+        # Historique : identique jusqu'à la coupure, puis chaque vélo enchaîne ses locations sans doublon.
+        avant = [location for location in locations if location[2] <= self.coupure]
+        self.assertTrue(avant)
+        self.assertLess(len(avant), len(locations))
+        self.assertEqual([location for location in locations_2 if location[1] < self.coupure], avant)
+        self.assertEqual(len(set(locations_2)), len(locations_2))
+        for precedente, location in zip(locations_2, locations_2[1:]):
+            if precedente[0] == location[0]:
+                self.assertLessEqual(precedente[2], location[1])
+                self.assertEqual(precedente[4], location[3])
+
+        # Points d'arrêt : même fin d'historique et même dernier pas de télémétrie pour chaque vélo.
+        self.assertEqual(etats_2, etats)
+        # Télémétrie : mêmes jours, une seule partition par jour, un point par vélo et par pas.
+        self.assertEqual(jours_2, jours)
+        self.assertEqual(len(set(jours_2)), len(jours_2))
+        for jour in jours:
+            self.assertEqual(points_2[jour], points[jour], jour)
+            self.assertEqual(len(set(points_2[jour])), len(points_2[jour]), jour)
+        # Jours entièrement antérieurs à la coupure : fichiers inchangés.
+        anciens = [chemin for chemin in arbre if chemin < self.coupure.strftime('%Y-%m-%d')]
+        self.assertTrue(anciens)
+        for chemin in anciens:
+            self.assertEqual(arbre_2[chemin], arbre[chemin], chemin)
+
+
+class TelemetrieTests(SimpleTestCase):
+    """Écriture, fusion des shards et relecture par lire_jour, pour chaque format."""
+
+    velo_ids = [3, 5, 8, 13]
+
+    def _ecrire(self, format_sortie, dossier, chronologies):
+        writer = get_writer(format_sortie, dossier)
+        for velo_id, chronologie in chronologies.items():
+            writer.write(velo_id, *chronologie)
+        writer.close()
+
+    def _attendus(self, chronologies, jour, velo_min=None, velo_max=None):
+        """Points du jour (UTC) des vélos de la plage, triés par vélo puis par timestamp."""
+        attendus = {nom: [] for nom in ('timestamp', 'velo_id', 'statut', 'batterie', 'latitude', 'longitude')}
+        for velo_id in sorted(chronologies):
+            if not (velo_min or 0) <= velo_id <= (velo_max or velo_id):
+                continue
+            timestamps, statuts, batteries, lats, lons = chronologies[velo_id]
+            du_jour = np.array([datetime.fromtimestamp(ts, dt_timezone.utc).strftime('%Y-%m-%d') == jour
+                                for ts in timestamps.tolist()])
+            for nom, valeurs in zip(attendus, (timestamps, np.full(len(timestamps), velo_id), statuts,
+                                               batteries, lats, lons)):
+                attendus[nom].extend(valeurs[du_jour].tolist())
+        return attendus
+
+    def _comparer(self, colonnes, attendus):
+        for nom, valeurs in attendus.items():
+            with self.subTest(colonne=nom):
+                if nom == 'batterie':
+                    # Arrondie à 2 décimales, stockée en float32 dans le format binaire.
+                    np.testing.assert_allclose(colonnes[nom], np.round(valeurs, 2), atol=1e-4)
+                else:
+                    self.assertEqual(colonnes[nom].tolist(), valeurs)
+
+    def test_aller_retour_fusion_et_plage_de_velos(self):
+        chronologies = _chronologies_telemetrie(self.velo_ids)
+        for format_sortie in FORMATS:
+            with self.subTest(format=format_sortie), tempfile.TemporaryDirectory() as racine:
+                serie = os.path.join(racine, 'serie')
+                self._ecrire(format_sortie, serie, chronologies)
+
+                # Deux shards écrits séparément puis réunis (legacy : directement dans le dossier final).
+                fusion = os.path.join(racine, 'fusion')
+                shards = [fusion] * 2 if format_sortie == 'legacy' else \
+                    [os.path.join(racine, 'shard_1'), os.path.join(racine, 'shard_2')]
+                for dossier, ids in zip(shards, (self.velo_ids[:2], self.velo_ids[2:])):
+                    self._ecrire(format_sortie, dossier, {velo_id: chronologies[velo_id] for velo_id in ids})
+                fusionner_partitions(format_sortie, shards, fusion)
+
+                jours = lister_jours(serie)
+                self.assertEqual(jours, ['2025-08-01', '2025-08-02'])
+                self.assertEqual(lister_jours(fusion), jours)
+                for jour in jours:
+                    self._comparer(lire_jour(serie, jour), self._attendus(chronologies, jour))
+                    self._comparer(lire_jour(fusion, jour), self._attendus(chronologies, jour))
+                    self._comparer(lire_jour(fusion, jour, 5, 12), self._attendus(chronologies, jour, 5, 12))
+                    self._comparer(lire_jour(fusion, jour, 14), self._attendus(chronologies, jour, 14))
+
+
+def _meteo_d_origine(city_name, dt):
+    """MockWeatherService.get_weather d'origine, sans cache : un Random réensemencé à chaque appel."""
+    seed = int(hashlib.md5(f"{city_name}-{dt.year}-{dt.month}-{dt.day}".encode()).hexdigest(), 16)
+    rng = random.Random(seed)
+    if not rng.random() < 0.20:
+        return {'condition': 'clair', 'description': 'Ciel dégagé'}
+    start_rain_hour = rng.randint(6, 18)
+    if start_rain_hour <= dt.hour < start_rain_hour + 4:
+        return {'condition': 'pluie', 'description': 'Pluie modérée'}
+    return {'condition': 'clair', 'description': 'Nuageux'}
+
+
+class MeteoTests(SimpleTestCase):
+    def test_meteo_en_cache_identique_a_l_originale(self):
+        # Un petit cache de ville-jours force des évictions ; get_weather_service ajoute le cache par heure.
+        services = (MockWeatherService(taille_cache=16), get_weather_service())
+        heures = [DEBUT + timedelta(minutes=37 * i) for i in range(90 * 24 * 60 // 37)]
+        pluie = 0
+        for ville in ('Lyon', 'Paris', 'Bordeaux'):
+            for dt in heures:
+                attendu = _meteo_d_origine(ville, dt)
+                pluie += attendu['condition'] == 'pluie'
+                for service in services:
+                    self.assertEqual(service.get_weather(ville, dt), attendu, (type(service).__name__, ville, dt))
+        self.assertTrue(pluie)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.stations = _creer_flotte(nb_velos=2, nb_locations=2)
+
+    def test_velo_introuvable_en_json(self):
+        reponse = self.client.get('/velos/api/velos/999999/')
+        self.assertEqual(reponse.status_code, 404)
+        self.assertEqual(reponse['Content-Type'], 'application/json')
+        self.assertIn('erreur', reponse.json())
+
+    def test_etag_et_304(self):
+        reponse = self.client.get('/velos/api/velos/')
+        self.assertEqual(reponse.status_code, 200)
+        etag = reponse['ETag']
+        b''.join(reponse.streaming_content)
+        self.assertEqual(self.client.get('/velos/api/velos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Une écriture sur une autre table ne change pas l'ETag des vélos.
+        with self.captureOnCommitCallbacks(execute=True):
+            Station.objects.filter(pk=self.stations[0].pk).first().save()
+        self.assertEqual(self.client.get('/velos/api/velos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        avant = version('velo')
+        velo = Velo.objects.order_by('id').first()
+        velo.batterie = 42.0
+        with self.captureOnCommitCallbacks(execute=True):
+            velo.save()
+        self.assertGreater(version('velo'), avant)
+        reponse = self.client.get('/velos/api/velos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], etag)
+        self.assertEqual(self.client.get('/velos/api/velos/', HTTP_IF_NONE_MATCH=reponse['ETag']).status_code, 304)
+
+    def test_k_et_rayon_nuls_ou_negatifs_refuses(self):
+        position = {'lat': 45.75, 'lon': 4.85}
+        for url, parametres in (('/velos/api/stations/proches/', {'k': 0}), ('/velos/api/stations/proches/', {'k': -3}),
+                                ('/velos/api/velos/rayon/', {'rayon': 0}), ('/velos/api/velos/rayon/', {'rayon': -1})):
+            with self.subTest(url=url, **parametres):
+                reponse = self.client.get(url, {**position, **parametres})
+                self.assertEqual(reponse.status_code, 400)
+                self.assertIn('erreur', reponse.json())
+        # Sans le paramètre : valeur par défaut.
+        self.assertEqual(len(self.client.get('/velos/api/stations/proches/', position).json()), 1)
+        self.assertEqual(self.client.get('/velos/api/velos/rayon/', position).status_code, 200)
+
+    def test_etag_des_risques_suit_le_jour_de_reference(self):
+        # Sans ?date=, le classement est calculé à maintenant : l'ETag change chaque jour, même sans écriture.
+        reponse = self.client.get('/velos/api/flotte/risques/')
+        self.assertIn(f"-{timezone.localdate():%Y%m%d}-", reponse['ETag'])
+        reponse = self.client.get('/velos/api/flotte/risques/', {'date': '2025-08-01T12:00'})
+        self.assertIn("-20250801-", reponse['ETag'])
+        self.assertEqual(self.client.get('/velos/api/flotte/risques/', {'date': 'hier'}).status_code, 400)
+
+
+class GenerateFilesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _creer_flotte(nb_locations=12)
+
+    def test_tickets_dates_de_l_arrivee_simulee(self):
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir):
+            call_command('generate_files', '--seed', '42', '--fin', '2025-08-02T18:00', stdout=StringIO())
+        tickets = list(TicketSupport.objects.values_list('velo_id', 'date_creation'))
+        self.assertTrue(tickets)
+        for velo_id, date_creation in tickets:
+            self.assertTrue(Location.objects.filter(velo_id=velo_id, date_fin=date_creation).exists())
+
+
+class ExportTests(TestCase):
+    """Un export interrompu puis repris donne le même fichier qu'un export d'un seul tenant."""
+
+    @classmethod
+    def setUpTestData(cls):
+        _creer_flotte(nb_locations=0)
+        rng = random.Random(3)
+        velos, types = list(Velo.objects.all()), TicketSupport.TypeProbleme.values
+        TicketSupport.objects.bulk_create(
+            [TicketSupport(velo=rng.choice(velos), utilisateur=Utilisateur.objects.first() if k % 4 else None,
+                           type_probleme=rng.choice(types), description=f'Ticket {k}, "signalé", à vérifier',
+                           date_creation=DEBUT + timedelta(hours=7 * k)) for k in range(40)])
+
+    def _lire(self, chemin, compresser):
+        with open(chemin, 'rb') as f:
+            contenu = f.read()
+        return gzip.decompress(contenu) if compresser else contenu
+
+    def test_reprise_apres_interruption(self):
+        filtres = ({}, {'debut': DEBUT + timedelta(days=2), 'fin': DEBUT + timedelta(days=9)},
+                   {'types': ['FREIN', 'AUTRE']})
+        with tempfile.TemporaryDirectory() as dossier:
+            for compresser in (False, True):
+                for options in filtres:
+                    with self.subTest(gzip=compresser, filtres=options):
+                        complet = os.path.join(dossier, 'complet.csv')
+                        list(exporter_tickets(complet, compresser, taille_lot=3, **options))
+                        attendu = self._lire(complet, compresser)
+                        self.assertGreater(attendu.count(b'\n'), 4)
+
+                        repris = os.path.join(dossier, 'repris.csv')
+                        export = exporter_tickets(repris, compresser, taille_lot=3, **options)
+                        next(export), next(export)
+                        export.close()
+                        # Lot interrompu en cours d'écriture : ignoré à la reprise.
+                        with open(repris, 'ab') as f:
+                            f.write(b'lot incomplet')
+                        list(exporter_tickets(repris, compresser, reprendre=True, taille_lot=3, **options))
+                        self.assertEqual(self._lire(repris, compresser), attendu)
+                        os.remove(repris + '.reprise')
+
+    def test_reprise_avec_d_autres_filtres(self):
+        with tempfile.TemporaryDirectory() as base_dir, override_settings(BASE_DIR=base_dir):
+            call_command('export_tickets', '--type', 'FREIN', stdout=StringIO())
+            with self.assertRaisesMessage(CommandError, "d'autres filtres"):
+                call_command('export_tickets', '--reprendre', stdout=StringIO())
+            with self.assertRaisesMessage(CommandError, "d'autres filtres"):
+                call_command('generate_files', '--incremental', '--seed', '1', '--fin', '2025-08-01T06:00',
+                             stdout=StringIO())
+
+
+OSM_RESEAU = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="10" lat="45.0" lon="4.0"/>
+  <node id="11" lat="45.0" lon="4.01"/>
+  <node id="12" lat="45.0" lon="4.02"/>
+  <node id="13" lat="45.008" lon="4.005"/>
+  <node id="14" lat="45.0" lon="4.03"/>
+  <node id="15" lat="46.0" lon="4.0"/>
+  <way id="100"><nd ref="10"/><nd ref="11"/><nd ref="12"/><tag k="highway" v="residential"/></way>
+  <way id="101"><nd ref="10"/><nd ref="13"/><nd ref="12"/><tag k="highway" v="tertiary"/></way>
+  <way id="102"><nd ref="12"/><nd ref="14"/><tag k="highway" v="cycleway"/><tag k="oneway" v="yes"/></way>
+  <way id="103"><nd ref="11"/><nd ref="13"/><tag k="highway" v="motorway"/></way>
+  <way id="104"><nd ref="14"/><nd ref="15"/><tag k="highway" v="residential"/></way>
+</osm>
+"""
+
+
+class ItinerairesTests(SimpleTestCase):
+    """
+    Petit réseau aux plus courts chemins connus : noeuds 10 - 11 - 12 en ligne, détour plus long par 13,
+    12 -> 14 en sens unique, autoroute 11 - 13 ignorée, noeud 15 hors du rectangle lu.
+    Noeuds numérotés dans l'ordre des identifiants OSM utilisés : 10 -> 0, 11 -> 1, ..., 14 -> 4.
+    """
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = dossier.name
+        chemin = os.path.join(self.dossier, 'extrait.osm.gz')
+        with gzip.open(chemin, 'wt', encoding='utf-8') as f:
+            f.write(OSM_RESEAU)
+        self.reseau = Reseau.depuis_osm(chemin, 44.9, 45.1, 3.9, 4.1)
+
+    def test_plus_courts_chemins(self):
+        self.assertEqual(len(self.reseau), 5)
+        self.assertEqual(self.reseau.chemins(0, [2, 4]), {2: [0, 1, 2], 4: [0, 1, 2, 4]})
+        self.assertEqual(self.reseau.chemins(1, [3]), {3: [1, 0, 3]})
+        self.assertEqual(self.reseau.chemins(3, [1]), {1: [3, 0, 1]})
+        self.assertEqual(self.reseau.chemins(2, [2]), {2: [2]})
+        # Sens unique : 14 n'a aucun arc sortant.
+        self.assertEqual(self.reseau.chemins(4, [0]), {})
+        self.assertEqual(self.reseau.plus_proches([45.0001, 45.0079], [4.0299, 4.0051]), [4, 3])
+
+    def test_traces_enregistres_et_relus(self):
+        stations = {1: (45.0001, 4.0), 2: (45.0001, 4.0301), 3: (45.0079, 4.0052)}
+        traces, sans_chemin = calculer_traces(self.reseau, stations, [(1, 2), (2, 1), (1, 3)])
+        self.assertEqual(sans_chemin, [(2, 1)])
+        self.assertEqual(sorted(traces), [(1, 2), (1, 3)])
+        lats, lons = traces[(1, 3)]
+        self.assertEqual(lats.tolist(), [45.0001, 45.0, 45.008, 45.0079])
+        self.assertEqual(lons.tolist(), [4.0, 4.0, 4.005, 4.0052])
+        self.assertEqual(len(traces[(1, 2)][0]), 6)
+
+        itineraires = Itineraires.vide().completer(traces)
+        chemin = os.path.join(self.dossier, 'itineraires.npz')
+        itineraires.enregistrer(chemin)
+        relus = Itineraires.charger(chemin)
+        self.assertEqual(len(relus), 2)
+        for paire in traces:
+            for attendu, obtenu in zip(itineraires.trace(*paire), relus.trace(*paire)):
+                np.testing.assert_array_equal(obtenu, attendu)
+        lats, lons, cumul = relus.trace(1, 3)
+        self.assertEqual(cumul[0], 0.0)
+        self.assertAlmostEqual(cumul[-1], sum(_haversine_m(lats[k], lons[k], lats[k + 1], lons[k + 1])
+                                              for k in range(len(lats) - 1)), delta=0.01)
+
+        # Positions : les deux extrémités du tracé, puis le milieu, sur le segment qui le contient.
+        indices = relus.indices([(1, 3), (1, 3), (1, 3), (3, 1)])
+        self.assertEqual(indices[-1], -1)
+        positions = relus.positions(indices[:3], np.array([0.0, 1.0, 0.5]))
+        np.testing.assert_allclose(positions[0][:2], [lats[0], lats[-1]])
+        np.testing.assert_allclose(positions[1][:2], [lons[0], lons[-1]])
+        milieu = cumul[-1] / 2
+        k = int(np.searchsorted(cumul, milieu)) - 1
+        t = (milieu - cumul[k]) / (cumul[k + 1] - cumul[k])
+        self.assertAlmostEqual(positions[0][2], lats[k] + (lats[k + 1] - lats[k]) * t, places=9)
+        self.assertAlmostEqual(positions[1][2], lons[k] + (lons[k + 1] - lons[k]) * t, places=9)
+
+        # Un tracé recalculé remplace l'ancien, les autres restent.
+        complete = relus.completer({(1, 3): ([45.0001, 45.0079], [4.0, 4.0052])})
+        self.assertEqual(complete.trace(1, 3)[0].tolist(), [45.0001, 45.0079])
+        np.testing.assert_array_equal(complete.trace(1, 2)[0], relus.trace(1, 2)[0])
+
+
+class ChargementTests(TestCase):
+    """charger() donne les mêmes lignes que bulk_create, par COPY (PostgreSQL) comme par le repli bulk_create."""
+
+    CHAMPS = ('velo', 'utilisateur', 'type_probleme', 'description', 'date_creation')
+    LIBELLES = ('velo_id', 'utilisateur_id', 'type_probleme', 'description', 'date_creation')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stations = _creer_flotte(nb_velos=2, nb_locations=0)
+        cls.velo = Velo.objects.first().pk
+        cls.utilisateur = Utilisateur.objects.get().pk
+        paris = dt_timezone(timedelta(hours=2))
+        descriptions = ['Batterie à 12,5%', 'Frein "arrière", bruit', 'Tab\tet\nretour\r\nligne', 'C:\\vélo\\N',
+                        '\\N', '', 'Ünïcødé ✓ 🚲']
+        cls.lignes = [(cls.velo if k % 3 else None, cls.utilisateur if k % 2 else None,
+                       TicketSupport.TypeProbleme.values[k % 4], descriptions[k % len(descriptions)],
+                       datetime(2025, 8, 1 + k, 7, k, 30, 1000 * k, tzinfo=paris if k % 2 else dt_timezone.utc))
+                      for k in range(15)]
+
+    def _lignes_en_base(self, **filtres):
+        return list(TicketSupport.objects.filter(**filtres).order_by('id').values_list(*self.LIBELLES))
+
+    def _comparer_a_bulk_create(self, taille_lot):
+        self.assertEqual(charger(TicketSupport, self.CHAMPS, iter(self.lignes), taille_lot=taille_lot), len(self.lignes))
+        obtenues = self._lignes_en_base()
+        TicketSupport.objects.all().delete()
+        TicketSupport.objects.bulk_create([TicketSupport(**dict(zip(self.LIBELLES, ligne))) for ligne in self.lignes])
+        self.assertEqual(obtenues, self._lignes_en_base())
+        self.assertEqual(obtenues, self.lignes)
+        TicketSupport.objects.all().delete()
+
+        # Champs non fournis : valeurs par défaut du modèle, comme avec bulk_create.
+        nouveaux = charger(Velo, ('station_origine', 'station_actuelle'), [(self.stations[1].pk, None)] * 3,
+                           taille_lot=taille_lot)
+        self.assertEqual(nouveaux, 3)
+        self.assertEqual(set(Velo.objects.filter(station_origine=self.stations[1]).values_list(
+            'station_actuelle_id', 'statut', 'batterie', 'cycles_charge', 'sante_batterie')),
+            {(None, Velo.StatutVelo.DISPONIBLE, 100.0, 0.0, 100.0)})
+        Velo.objects.filter(station_origine=self.stations[1]).delete()
+
+    def test_copy_ou_bulk_create(self):
+        for taille_lot in (4, 1000):
+            with self.subTest(taille_lot=taille_lot):
+                self._comparer_a_bulk_create(taille_lot)
+
+    def test_repli_bulk_create(self):
+        # Hors PostgreSQL, c'est le chemin normal ; sur PostgreSQL, COPY est désactivé pour ce test.
+        with mock.patch('gestion.loader._copy_disponible', return_value=False):
+            self._comparer_a_bulk_create(4)
+
+
+class UtilisateursTests(TestCase):
+    """Utilisateurs générés : ne dépendent que de la graine, partagent un hash de mot de passe valide."""
+
+    def test_independants_de_la_taille_des_blocs(self):
+        attendus = list(generer_utilisateurs(45, 7, premier=3))
+        self.assertEqual(len(attendus), 45)
+        self.assertEqual(len({ligne[0] for ligne in attendus}), 45)
+        self.assertTrue(attendus[0][0].endswith('3'))
+        for taille in (1, 4, 10, 44, 45):
+            with self.subTest(taille=taille), mock.patch('gestion.utilisateurs.TAILLE_BLOC', taille):
+                self.assertEqual(list(generer_utilisateurs(45, 7, premier=3)), attendus)
+        # Début de la même suite, et une autre graine donne d'autres profils.
+        self.assertEqual([ligne[2:4] for ligne in generer_utilisateurs(20, 7)],
+                         [ligne[2:4] for ligne in attendus[:20]])
+        self.assertNotEqual(list(generer_utilisateurs(45, 8, premier=3)), attendus)
+
+    def test_mot_de_passe_commun(self):
+        self.assertEqual(charger(Utilisateur, CHAMPS_UTILISATEUR, generer_utilisateurs(12, 1)), 12)
+        utilisateurs = list(Utilisateur.objects.order_by('id'))
+        self.assertEqual(len({utilisateur.password for utilisateur in utilisateurs}), 1)
+        for utilisateur in (utilisateurs[0], utilisateurs[-1]):
+            self.assertTrue(utilisateur.check_password(MOT_DE_PASSE))
+            self.assertFalse(utilisateur.check_password('autre'))
+        self.assertTrue(self.client.login(username=utilisateurs[5].username, password=MOT_DE_PASSE))
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 \
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * 6371000.0 * math.asin(math.sqrt(a))
+
+
+class SpatialTests(TestCase):
+    """Index en grille comparé à un calcul exhaustif des distances."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(7)
+        ville = Ville.objects.create(nom='Lyon')
+        cls.stations = [Station.objects.create(nom=f'S{k}', ville=ville, latitude=45.70 + rng.uniform(0, 0.12),
+                                               longitude=4.78 + rng.uniform(0, 0.15)) for k in range(80)]
+        for station in cls.stations[::3]:
+            for statut in rng.choice([Velo.StatutVelo.DISPONIBLE, Velo.StatutVelo.MAINTENANCE], 2):
+                Velo.objects.create(station_origine=station, station_actuelle=station, statut=statut)
+        cls.points = [(45.76, 4.85), (45.70, 4.78), (45.83, 4.94), (45.60, 4.70)]
+
+    def setUp(self):
+        # Les versions sont incrémentées au commit, jamais atteint dans un TestCase : index reconstruit.
+        incrementer('station')
+
+    def _distances(self, lat, lon, stations=None):
+        return sorted((_haversine_m(lat, lon, s.latitude, s.longitude), s.id) for s in stations or self.stations)
+
+    def test_k_plus_proches(self):
+        disponibles = {velo.station_actuelle for velo in Velo.objects.filter(statut=Velo.StatutVelo.DISPONIBLE)
+                       .select_related('station_actuelle')}
+        for lat, lon in self.points:
+            for k in (1, 5, 30, 200):
+                with self.subTest(lat=lat, lon=lon, k=k):
+                    attendu = self._distances(lat, lon)[:k]
+                    resultat = stations_proches(lat, lon, k)
+                    self.assertEqual([i for i, _ in resultat], [i for _, i in attendu])
+                    np.testing.assert_allclose([d for _, d in resultat], [d for d, _ in attendu], rtol=1e-9)
+                    attendu = self._distances(lat, lon, disponibles)[:k]
+                    self.assertEqual([i for i, _ in stations_proches(lat, lon, k, disponibles=True)],
+                                     [i for _, i in attendu])
+
+    def test_velos_dans_rayon(self):
+        velos = list(Velo.objects.filter(statut=Velo.StatutVelo.DISPONIBLE).select_related('station_actuelle'))
+        for lat, lon in self.points:
+            for rayon in (300, 1500, 5000):
+                with self.subTest(lat=lat, lon=lon, rayon=rayon):
+                    distances = {v.id: _haversine_m(lat, lon, v.station_actuelle.latitude,
+                                                    v.station_actuelle.longitude) for v in velos}
+                    attendu = {velo_id for velo_id, d in distances.items() if d <= rayon}
+                    resultat = velos_dans_rayon(lat, lon, rayon)
+                    self.assertEqual({ligne['id'] for ligne in resultat}, attendu)
+                    for ligne in resultat:
+                        self.assertAlmostEqual(ligne['distance_m'], distances[ligne['id']], delta=0.05)
+                    self.assertEqual([ligne['distance_m'] for ligne in resultat],
+                                     sorted(ligne['distance_m'] for ligne in resultat))
+
+
+class AnalytiqueTests(TestCase):
+    """Agrégats de rafraichir_analytique comparés à des comptes faits directement sur Location."""
+
+    @classmethod
+    def setUpTestData(cls):
+        stations = _creer_flotte(nb_velos=5, nb_locations=10)
+        # Trajet à cheval sur minuit : son arrivée compte le lendemain, même si seul ce jour est recalculé.
+        Location.objects.create(velo=Velo.objects.first(), utilisateur=Utilisateur.objects.get(),
+                                station_depart=stations[0], station_arrivee=stations[2],
+                                date_debut=datetime(2025, 8, 2, 23, 30, tzinfo=dt_timezone.utc),
+                                date_fin=datetime(2025, 8, 3, 0, 40, tzinfo=dt_timezone.utc))
+
+    def _attendus(self, depuis=None):
+        """Comptes attendus : flux horaires par (station, heure), trajets par (jour, départ, arrivée)."""
+        flux, trajets = defaultdict(lambda: [0, 0, timedelta()]), defaultdict(lambda: [0, timedelta()])
+        def heure(date):
+            return date.replace(minute=0, second=0, microsecond=0)
+
+        for location in Location.objects.all():
+            duree = location.date_fin - location.date_debut
+            if depuis is None or location.date_debut >= depuis:
+                flux[location.station_depart_id, heure(location.date_debut)][0] += 1
+                flux[location.station_depart_id, heure(location.date_debut)][2] += duree
+                trajet = trajets[location.date_debut.date(), location.station_depart_id, location.station_arrivee_id]
+                trajet[0] += 1
+                trajet[1] += duree
+            if depuis is None or location.date_fin >= depuis:
+                flux[location.station_arrivee_id, heure(location.date_fin)][1] += 1
+        return ({cle: tuple(valeurs) for cle, valeurs in flux.items()},
+                {cle: tuple(valeurs) for cle, valeurs in trajets.items()})
+
+    def _agregats(self):
+        return ({(f.station_id, f.heure): (f.departs, f.arrivees, f.duree_totale)
+                 for f in FluxHoraireStation.objects.all()},
+                {(t.jour, t.station_depart_id, t.station_arrivee_id): (t.nombre, t.duree_totale)
+                 for t in TrajetJournalier.objects.all()})
+
+    def test_agregats_egaux_aux_comptes_des_locations(self):
+        call_command('rafraichir_analytique', '--jours-par-lot', '1', stdout=StringIO())
+        flux, trajets = self._attendus()
+        self.assertEqual(self._agregats(), (flux, trajets))
+        self.assertEqual(sum(departs for departs, _, _ in flux.values()), Location.objects.count())
+
+        # Relance limitée au dernier jour : mêmes lignes, arrivée du trajet parti la veille comprise.
+        call_command('rafraichir_analytique', '--depuis', '2025-08-03', stdout=StringIO())
+        self.assertEqual(self._agregats(), (flux, trajets))
+
+        od = Counter()
+        for (_, depart, arrivee), (nombre, _) in trajets.items():
+            od[depart, arrivee] += nombre
+        self.assertEqual({(ligne['station_depart_id'], ligne['station_arrivee_id']): ligne['nombre']
+                          for ligne in matrice_od()}, od)
+
+    def test_rafraichissement_d_un_seul_jour(self):
+        depuis = datetime(2025, 8, 3, tzinfo=dt_timezone.utc)
+        call_command('rafraichir_analytique', '--depuis', '2025-08-03', '--jusqua', '2025-08-03', stdout=StringIO())
+        flux, trajets = self._attendus(depuis)
+        self.assertEqual(self._agregats(), ({cle: v for cle, v in flux.items() if cle[1] >= depuis},
+                                            {cle: v for cle, v in trajets.items() if cle[0] >= depuis.date()}))
+        self.assertIn((Location.objects.latest('date_fin').station_arrivee_id, depuis), self._agregats()[0])
+
+
+class DisponibiliteTests(TestCase):
+    """Les compteurs de DisponibiliteStation suivent les vélos sauvegardés un par un (gestion/signals.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        ville = Ville.objects.create(nom='Lyon')
+        cls.a, cls.b = (Station.objects.create(nom=nom, ville=ville, latitude=45.75, longitude=4.85) for nom in 'AB')
+
+    def assertCompteurs(self, attendus):
+        compteurs = {(ligne.station_id, ligne.statut): ligne.nombre
+                     for ligne in DisponibiliteStation.objects.filter(nombre__gt=0)}
+        self.assertEqual(compteurs, attendus)
+        # Mêmes comptes qu'une agrégation des vélos.
+        self.assertEqual(compteurs, {(c['station_actuelle_id'], c['statut']): c['nombre'] for c in
+                                     Velo.objects.exclude(station_actuelle=None).order_by()
+                                     .values('station_actuelle_id', 'statut').annotate(nombre=Count('id'))})
+
+    def test_deplacements_statuts_et_suppression(self):
+        dispo, maint = Velo.StatutVelo.DISPONIBLE, Velo.StatutVelo.MAINTENANCE
+        velo = Velo.objects.create(station_origine=self.a, station_actuelle=self.a)
+        autre = Velo.objects.create(station_origine=self.a, station_actuelle=self.a)
+        self.assertCompteurs({(self.a.pk, dispo): 2})
+
+        velo.station_actuelle = self.b
+        velo.save()
+        self.assertCompteurs({(self.a.pk, dispo): 1, (self.b.pk, dispo): 1})
+
+        velo.statut = maint
+        velo.save()
+        self.assertCompteurs({(self.a.pk, dispo): 1, (self.b.pk, maint): 1})
+
+        # Avec update_fields, seuls les champs listés comptent : la station modifiée en mémoire n'est pas écrite.
+        velo.batterie, velo.station_actuelle = 50.0, self.a
+        velo.save(update_fields=['batterie'])
+        self.assertCompteurs({(self.a.pk, dispo): 1, (self.b.pk, maint): 1})
+        velo.statut = dispo
+        velo.save(update_fields=['statut'])
+        self.assertCompteurs({(self.a.pk, dispo): 1, (self.b.pk, dispo): 1})
+
+        autre.station_actuelle = None
+        autre.save()
+        self.assertCompteurs({(self.b.pk, dispo): 1})
+
+        velo.delete()
+        self.assertCompteurs({})
+
+    def test_compteur_jamais_negatif(self):
+        dispo = Velo.StatutVelo.DISPONIBLE
+        velo = Velo.objects.create(station_origine=self.a, station_actuelle=self.a)
+        # Vélo déplacé en masse, sans signal : le compteur de A reste à 1 alors que la station est vide.
+        Velo.objects.filter(pk=velo.pk).update(station_actuelle=self.b)
+        autre = Velo.objects.create(station_origine=self.a, station_actuelle=self.b)
+        velo.refresh_from_db()
+        for vide in (velo, autre):
+            vide.station_actuelle = self.a
+            vide.save()
+            vide.station_actuelle = None
+            vide.save()
+        self.assertEqual(DisponibiliteStation.objects.get(station=self.b, statut=dispo).nombre, 0)
+        self.assertEqual(DisponibiliteStation.objects.get(station=self.a, statut=dispo).nombre, 1)
+
+
+class ReequilibrageTests(TestCase):
+    """Solveur glouton : aucun vélo créé ni perdu, aucune station vidée ou remplie au-delà de son écart."""
+
+    @classmethod
+    def setUpTestData(cls):
+        ville = Ville.objects.create(nom='Lyon')
+        cls.ville = ville
+        stations = [Station.objects.create(nom=f'Station {k}', ville=ville, latitude=45.70 + 0.013 * (k % 4),
+                                           longitude=4.80 + 0.021 * (k // 4)) for k in range(8)]
+        # Vélos partis de chaque station (origine) et regroupés là où les locations les ont laissés.
+        rng = random.Random(5)
+        for k, station in enumerate(stations):
+            for _ in range(2 + k % 3):
+                Velo.objects.create(station_origine=station, station_actuelle=rng.choice(stations[:3] + stations[6:]))
+        Velo.objects.create(station_origine=stations[7], station_actuelle=stations[0],
+                            statut=Velo.StatutVelo.MAINTENANCE)
+
+    def _verifier(self, transferts, excedents, besoins):
+        donnes, recus = Counter(), Counter()
+        for i, j, nombre, _ in transferts:
+            self.assertGreater(nombre, 0)
+            donnes[i] += nombre
+            recus[j] += nombre
+        for i, nombre in donnes.items():
+            self.assertLessEqual(nombre, excedents[i])
+        for j, nombre in recus.items():
+            self.assertLessEqual(nombre, besoins[j])
+        self.assertEqual(sum(donnes.values()), min(sum(excedents), sum(besoins)))
+
+    def test_resoudre(self):
+        rng = np.random.default_rng(9)
+        for essai in range(20):
+            excedents = rng.integers(0, 6, int(rng.integers(1, 12)))
+            besoins = rng.integers(0, 6, int(rng.integers(1, 12)))
+            distances = rng.uniform(0, 10, (len(excedents), len(besoins))).round(1)
+            for voisins in (1, 3, 20):
+                with self.subTest(essai=essai, voisins=voisins):
+                    transferts = resoudre(excedents, besoins, distances, voisins)
+                    self._verifier(transferts, excedents, besoins)
+            # Avec tous les voisins, un seul tri de tous les couples : le glouton de référence.
+            reste_e, reste_b, attendus = list(excedents), list(besoins), []
+            couples = sorted(((i, j) for i in range(len(excedents)) for j in range(len(besoins))),
+                             key=lambda couple: distances[couple])
+            for i, j in couples:
+                nombre = min(reste_e[i], reste_b[j])
+                if nombre:
+                    reste_e[i] -= nombre
+                    reste_b[j] -= nombre
+                    attendus.append((i, j, nombre, float(distances[i, j])))
+            self.assertEqual(resoudre(excedents, besoins, distances, voisins=len(besoins)), attendus)
+
+    def test_repartir(self):
+        self.assertEqual(repartir([1, 1, 1], 10).tolist(), [4, 3, 3])
+        self.assertEqual(repartir([0, 2, 6], 5).tolist(), [0, 1, 4])
+        self.assertEqual(repartir([0, 0], 5).tolist(), [0, 0])
+
+    def test_plan_ramene_chaque_station_a_sa_cible(self):
+        dispo = Velo.StatutVelo.DISPONIBLE
+        disponibles = Counter(dict(DisponibiliteStation.objects.filter(statut=dispo)
+                                   .values_list('station_id', 'nombre')))
+        stations = list(Station.objects.order_by('id').values_list('id', flat=True))
+        origines = Counter(Velo.objects.values_list('station_origine_id', flat=True))
+        total = sum(disponibles.values())
+        cibles = dict(zip(stations, repartir([origines[station] for station in stations], total).tolist()))
+
+        transferts, nombre_velos, ecart = planifier(self.ville.id, 'origine')
+        self.assertEqual(nombre_velos, total)
+        self.assertEqual(sum(transfert.nombre for transfert in transferts), ecart)
+        self.assertGreater(ecart, 0)
+        apres = Counter(disponibles)
+        for transfert in transferts:
+            self.assertNotEqual(transfert.station_source, transfert.station_cible)
+            apres[transfert.station_source] -= transfert.nombre
+            apres[transfert.station_cible] += transfert.nombre
+            # Une station ne donne que ses vélos en trop et ne reçoit que ce qui lui manque.
+            self.assertGreaterEqual(apres[transfert.station_source], cibles[transfert.station_source])
+            self.assertLessEqual(apres[transfert.station_cible], cibles[transfert.station_cible])
+        self.assertEqual({station: apres[station] for station in stations}, cibles)
+        self.assertEqual(sum(apres.values()), total)
+
+
+class FixVeloOriginsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ville = Ville.objects.create(nom='Lyon')
+        cls.a, cls.b = (Station.objects.create(nom=nom, ville=ville, latitude=45.75, longitude=4.85) for nom in 'AB')
+        cls.avec_station = [Velo.objects.create(station_origine=None, station_actuelle=cls.b) for _ in range(3)]
+        cls.sans_station = Velo.objects.create(station_origine=None, station_actuelle=None)
+        cls.correct = Velo.objects.create(station_origine=cls.b, station_actuelle=cls.a)
+
+    def _origines(self):
+        return dict(Velo.objects.values_list('id', 'station_origine_id'))
+
+    def test_simulation_n_ecrit_rien(self):
+        avant = self._origines()
+        call_command('fix_velo_origins', '--simulation', stdout=StringIO())
+        self.assertEqual(self._origines(), avant)
+
+    def test_correction_par_lots_puis_relance(self):
+        call_command('fix_velo_origins', '--taille-lot', '2', stdout=StringIO())
+        origines = self._origines()
+        for velo in self.avec_station:
+            self.assertEqual(origines[velo.pk], self.b.pk)
+        self.assertEqual(origines[self.sans_station.pk], self.a.pk)  # station par défaut : la première
+        self.assertEqual(origines[self.correct.pk], self.b.pk)
+
+        sortie = StringIO()
+        call_command('fix_velo_origins', stdout=sortie)
+        self.assertIn("Rien à corriger", sortie.getvalue())
+        self.assertEqual(self._origines(), origines)
+
+
+class CanalTests(SimpleTestCase):
+    def test_paquets_sous_la_limite_de_notify(self):
+        evenements = [{'type': 'velo', 'velo_id': i, 'ville': 'Lyon', 'statut': 'DISPO', 'batterie': 55.5}
+                      for i in range(500)]
+        charges = list(canal.paquets(evenements))
+        self.assertGreater(len(charges), 1)
+        self.assertTrue(all(len(charge.encode()) < canal.TAILLE_MAX for charge in charges))
+        self.assertEqual([evenement for charge in charges for evenement in json.loads(charge)], evenements)
+
+
+# NOTIFY n'est livré qu'au commit : les données doivent être validées (TransactionTestCase).
+class CanalPostgresTests(TransactionTestCase):
+    """Un vélo enregistré est diffusé, au commit, à un écouteur qui a sa propre connexion."""
+
+    def setUp(self):
+        if not canal.disponible():
+            self.skipTest("Canal LISTEN/NOTIFY : PostgreSQL uniquement.")
+        _creer_flotte(nb_velos=1, nb_locations=0)
+        self.recus, arret = queue.Queue(), threading.Event()
+        ecoute = threading.Thread(target=canal.ecouter, args=(self.recus.put, arret), kwargs={'delai': 0.1})
+        ecoute.start()
+        self.addCleanup(ecoute.join)
+        self.addCleanup(arret.set)
+        # L'écoute démarre dans le thread : une sonde est renvoyée jusqu'à ce qu'elle arrive.
+        for _ in range(50):
+            canal.envoyer([{'type': 'sonde', 'velo_id': 0}])
+            try:
+                self.recus.get(timeout=0.2)
+                break
+            except queue.Empty:
+                pass
+        else:
+            self.fail("Écoute du canal jamais prête.")
+
+    def _recus(self, delai):
+        """Événements reçus pendant delai secondes, sans les sondes."""
+        evenements = []
+        try:
+            while True:
+                evenements += [e for e in self.recus.get(timeout=delai) if e['type'] != 'sonde']
+        except queue.Empty:
+            return evenements
+
+    def test_velo_diffuse_au_commit(self):
+        velo = Velo.objects.get()
+        with transaction.atomic():
+            velo.statut = Velo.StatutVelo.EN_LOCATION
+            velo.save(update_fields=['statut'])
+        self.assertEqual(self._recus(1.0), [{'type': 'velo', 'velo_id': velo.pk, 'ville': 'Lyon', 'statut': 'LOC',
+                                             'batterie': 100.0, 'station_actuelle_id': velo.station_actuelle_id}])
+
+    def test_rien_si_la_transaction_est_annulee(self):
+        try:
+            with transaction.atomic():
+                canal.envoyer([{'type': 'velo', 'velo_id': 1}])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self._recus(0.5), [])
+
+    def test_simulation_temps_reel_alimente_le_canal(self):
+        call_command('generate_history', '--temps-reel', '--duree', '48', '--acceleration', '1000000', '--seed', '1',
+                     stdout=StringIO())
+        positions = [e for e in self._recus(1.0) if e['type'] == 'position']
+        self.assertTrue(Location.objects.exists())
+        self.assertGreater(len(positions), Location.objects.count())  # un départ et une arrivée par location
+        stations = {(s.latitude, s.longitude) for s in Station.objects.all()}
+        for position in positions:
+            self.assertEqual(position['ville'], 'Lyon')
+            self.assertIn((position['latitude'], position['longitude']), stations)
+
+
+# Le rejeu lit la ville des vélos en base depuis un autre thread : données validées (TransactionTestCase).
+class DiffuseurTests(TransactionTestCase):
+    """Les sources tournent du premier abonné au départ du dernier."""
+
+    def test_sources_lancees_au_premier_abonne_et_arretees_au_dernier(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            writer = get_writer('ndjson', dossier)
+            n = 20
+            writer.write(1, int(DEBUT.timestamp()) + 30 * np.arange(n), np.zeros(n, dtype=np.uint8),
+                         np.linspace(100, 90, n), np.full(n, 45.75), np.full(n, 4.85))
+            writer.close()
+            config = {'REJEU_TELEMETRIE': True, 'DOSSIER_TELEMETRIE': dossier, 'ACCELERATION': 30.0, 'CANAL': False}
+            with override_settings(DIFFUSION=config):
+                asyncio.run(self._abonnements())
+
+    async def _abonnements(self):
+        diffuseur = Diffuseur()
+        try:
+            self.assertFalse(diffuseur.actif)
+            tous, lyon = diffuseur.abonner(), diffuseur.abonner(['Lyon'])
+            self.assertEqual(len(diffuseur.sources), 1)
+            rejeu = diffuseur.sources[0]
+            messages = await tous.attendre(5)
+            self.assertTrue(messages[0].startswith('event: position'))
+
+            diffuseur.desabonner(tous)
+            self.assertTrue(diffuseur.actif)
+            self.assertFalse(rejeu.done())
+            diffuseur.desabonner(lyon)
+            self.assertFalse(diffuseur.actif)
+            self.assertEqual(diffuseur.sources, [])
+            await asyncio.sleep(0)
+            self.assertTrue(rejeu.cancelled())
+
+            # Un nouvel abonné relance un rejeu.
+            diffuseur.desabonner(diffuseur.abonner())
+            self.assertEqual(diffuseur.sources, [])
+        finally:
+            await sync_to_async(connections.close_all)()
@@ -0,0 +1,182 @@
+# CODE pour gestion/trajectory.py
+#
+# Moteur de trajectoire de generate_files : à partir des locations triées d'un vélo, calcule toute
+# sa chronologie (un point tous les 30 s) en une passe NumPy au lieu d'avancer pas à pas en Python.
+# indices_trajets et assembler_chronologie servent aussi au moteur à événements (gestion/simulation.py),
+# qui ne dérive la grille des pas qu'une fois la batterie simulée.
+#
+# Les deux moteurs reçoivent un numpy.random.Generator : tirer n valeurs d'un coup ou une par une
+# donne la même suite, donc avec la même graine le moteur vectoriel reproduit exactement la boucle
+# scalaire d'origine (conservée dans simuler_velo_scalaire comme référence).
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from gestion.telemetry import CODES_STATUT
+
+PAS_PAR_DEFAUT = timedelta(seconds=30)
+SEUIL_BATTERIE_FAIBLE = 10.0
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+DISPONIBLE = CODES_STATUT['disponible']
+EN_LOCATION = CODES_STATUT['en_location']
+
+# Un trajet : (date_debut, date_fin, lat_depart, lon_depart, lat_arrivee, lon_arrivee, station_depart,
+# station_arrivee) ; les ids des stations servent à retrouver l'itinéraire routier (gestion/itineraires.py).
+Trajet = namedtuple('Trajet', 'date_debut date_fin lat_depart lon_depart lat_arrivee lon_arrivee '
+                              'station_depart station_arrivee', defaults=(None, None))
+
+# timestamps en secondes epoch ; tickets : liste de (indice du trajet, batterie à l'arrivée)
+Chronologie = namedtuple('Chronologie', 'timestamps statuts batteries lats lons tickets')
+
+
+# Indices des trajets sur la grille des pas (en microsecondes depuis EPOCH), sans construire la grille :
+# en_trajet_debut / en_trajet_fin bornent les pas passés en location, arrivee est le pas d'arrivée.
+IndicesTrajets = namedtuple('IndicesTrajets', 'n debut_us pas_us t_debut t_fin arrivee en_trajet_debut en_trajet_fin')
+
+
+def _microsecondes(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def indices_trajets(trajets, debut, fin, pas=PAS_PAR_DEFAUT):
+    """Place les trajets triés d'un vélo sur la grille des pas de debut à fin (inclus), en O(nombre de trajets)."""
+    debut_us, pas_us = _microsecondes(debut), pas // timedelta(microseconds=1)
+    n = (_microsecondes(fin) - debut_us) // pas_us + 1 if fin >= debut else 0
+    k = len(trajets)
+    t_debut = np.array([_microsecondes(t.date_debut) for t in trajets], dtype=np.int64)
+    t_fin = np.array([_microsecondes(t.date_fin) for t in trajets], dtype=np.int64)
+
+    # Premier pas >= date_debut et premier pas >= date_fin de chaque trajet (arrondi supérieur, borné à n).
+    premier_pas = np.clip(-((debut_us - t_debut) // pas_us), 0, n)
+    pas_fin = np.clip(-((debut_us - t_fin) // pas_us), 0, n)
+    # La boucle scalaire ne traite qu'une arrivée par pas : arrivee[j] = max(pas_fin[j], arrivee[j-1] + 1).
+    rang = np.arange(k)
+    arrivee = rang + np.maximum.accumulate(pas_fin - rang) if k else np.empty(0, dtype=np.int64)
+    arrivee_prec = np.concatenate(([-1], arrivee))[:k]
+    en_trajet_debut = np.maximum(arrivee_prec + 1, premier_pas)
+    en_trajet_fin = np.minimum(arrivee, n)
+    return IndicesTrajets(n, debut_us, pas_us, t_debut, t_fin, arrivee, en_trajet_debut, en_trajet_fin)
+
+
+def assembler_chronologie(indices, trajets, position_initiale, niveaux_repos, decharges, tickets, itineraires=None):
+    """
+    Construit la télémétrie pas à pas d'un vélo à partir de ses trajets et de sa batterie :
+    niveaux_repos[j] est le niveau sur le segment de repos j, decharges la liste des (i0, i1, niveaux)
+    des pas en trajet. Avec itineraires, les trajets dont l'itinéraire est connu suivent les rues.
+    """
+    n, k = indices.n, len(trajets)
+    ticks = indices.debut_us + indices.pas_us * np.arange(n, dtype=np.int64)
+    coords = np.array([t[2:6] for t in trajets], dtype=np.float64) if k else np.empty((0, 4), dtype=np.float64)
+    t_debut, t_fin = indices.t_debut, indices.t_fin
+
+    # Segments de repos : [arrivee[j-1], arrivee[j]) se passe à la station d'arrivée du trajet j-1
+    # (ou à la position initiale pour le premier segment), sauf les pas en trajet réécrits plus bas.
+    bornes = np.concatenate(([0], np.minimum(indices.arrivee, n), [n]))
+    longueurs_segments = np.diff(bornes)
+    lats = np.repeat(np.concatenate(([position_initiale[0]], coords[:, 2])), longueurs_segments)
+    lons = np.repeat(np.concatenate(([position_initiale[1]], coords[:, 3])), longueurs_segments)
+
+    # Pas en cours de trajet : interpolation linéaire entre les deux stations.
+    statuts = np.full(n, DISPONIBLE, dtype=np.uint8)
+    en_trajet_debut, en_trajet_fin = indices.en_trajet_debut, indices.en_trajet_fin
+    actifs = np.flatnonzero(en_trajet_debut < en_trajet_fin)
+    if actifs.size:
+        longueurs = en_trajet_fin[actifs] - en_trajet_debut[actifs]
+        decalages = np.cumsum(longueurs) - longueurs
+        pas_actifs = np.repeat(en_trajet_debut[actifs] - decalages, longueurs) + np.arange(longueurs.sum())
+        trajet_du_pas = np.repeat(actifs, longueurs)
+        duree = (t_fin - t_debut) / 1e6
+        ecoule = (ticks[pas_actifs] - t_debut[trajet_du_pas]) / 1e6
+        d = duree[trajet_du_pas]
+        ratio = np.divide(ecoule, d, out=np.zeros_like(ecoule), where=d > 0)
+        depart = coords[trajet_du_pas]
+        statuts[pas_actifs] = EN_LOCATION
+        lats[pas_actifs] = depart[:, 0] + (depart[:, 2] - depart[:, 0]) * ratio
+        lons[pas_actifs] = depart[:, 1] + (depart[:, 3] - depart[:, 1]) * ratio
+        if itineraires is not None and len(itineraires):
+            traces = itineraires.indices([(t.station_depart, t.station_arrivee) for t in trajets])[trajet_du_pas]
+            connus = traces >= 0
+            if connus.any():
+                lats[pas_actifs[connus]], lons[pas_actifs[connus]] = itineraires.positions(traces[connus], ratio[connus])
+
+    niveaux = np.repeat(niveaux_repos, longueurs_segments)
+    for i0, i1, cumul in decharges:
+        niveaux[i0:i1] = cumul
+
+    return Chronologie(ticks // 10 ** 6, statuts, niveaux, lats, lons, tickets)
+
+
+def simuler_velo(trajets, position_initiale, debut, fin, rng, pas=PAS_PAR_DEFAUT, itineraires=None):
+    """
+    Calcule la chronologie d'un vélo entre debut et fin (inclus) à partir de ses trajets triés.
+    position_initiale est le couple (lat, lon) de la station où se trouve le vélo avant son premier trajet.
+    """
+    indices = indices_trajets(trajets, debut, fin, pas)
+    n, k = indices.n, len(trajets)
+
+    # Batterie : décharge cumulée trajet par trajet, rechargée à 100 % quand un ticket est émis.
+    # niveaux_repos[j] est le niveau sur le segment de repos j, les pas en trajet sont remplis ensuite.
+    niveaux_repos = np.full(k + 1, 100.0)
+    decharges = []
+    batterie, tickets = 100.0, []
+    for j in range(k):
+        i0, i1 = indices.en_trajet_debut[j], indices.en_trajet_fin[j]
+        if i0 >= n:
+            break
+        if i1 > i0:
+            # Un pas en trajet implique date_debut <= pas < date_fin, donc une durée > 0.
+            duree_s = (indices.t_fin[j] - indices.t_debut[j]) / 1e6
+            drains = rng.uniform(10, 25, i1 - i0) / (duree_s / pas.total_seconds())
+            cumul = np.maximum(np.subtract.accumulate(np.concatenate(([batterie], drains)))[1:], 0.0)
+            decharges.append((i0, i1, cumul))
+            batterie = float(cumul[-1])
+        if indices.arrivee[j] >= n:
+            break
+        if batterie < SEUIL_BATTERIE_FAIBLE and rng.random() < 0.8:
+            tickets.append((j, batterie))
+            batterie = 100.0
+        niveaux_repos[j + 1] = batterie
+
+    return assembler_chronologie(indices, trajets, position_initiale, niveaux_repos, decharges, tickets, itineraires)
+
+
+def simuler_velo_scalaire(trajets, position_initiale, debut, fin, rng, pas=PAS_PAR_DEFAUT):
+    """Boucle pas à pas d'origine de generate_files, gardée comme référence pour simuler_velo."""
+    timestamps, statuts, batteries, lats, lons, tickets = [], [], [], [], [], []
+    current_time, batterie, loc_idx = debut, 100.0, 0
+    lat_station, lon_station = position_initiale
+
+    while current_time <= fin:
+        status, lat, lon = DISPONIBLE, lat_station, lon_station
+
+        if loc_idx < len(trajets):
+            loc = trajets[loc_idx]
+            if loc.date_debut <= current_time < loc.date_fin:
+                status = EN_LOCATION
+                trip_duration = (loc.date_fin - loc.date_debut).total_seconds()
+                time_into_trip = (current_time - loc.date_debut).total_seconds()
+                ratio = time_into_trip / trip_duration if trip_duration > 0 else 0
+                lat = loc.lat_depart + (loc.lat_arrivee - loc.lat_depart) * ratio
+                lon = loc.lon_depart + (loc.lon_arrivee - loc.lon_depart) * ratio
+
+                drain_per_step = (rng.uniform(10, 25) / (trip_duration / pas.total_seconds())) if trip_duration > 0 else 0
+                batterie = max(0.0, batterie - drain_per_step)
+            elif current_time >= loc.date_fin:
+                if batterie < SEUIL_BATTERIE_FAIBLE and rng.random() < 0.8:
+                    tickets.append((loc_idx, batterie))
+                    batterie = 100.0
+                lat_station, lon_station = loc.lat_arrivee, loc.lon_arrivee
+                loc_idx += 1
+                lat, lon = lat_station, lon_station
+
+        timestamps.append(int(current_time.timestamp()))
+        statuts.append(status)
+        batteries.append(batterie)
+        lats.append(lat)
+        lons.append(lon)
+        current_time += pas
+
+    return Chronologie(timestamps, statuts, batteries, lats, lons, tickets)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views  # Importe le fichier views.py du même dossier
+from . import api, flux, views  # Importe les fichiers views.py, api.py et flux.py du même dossier
 
 # Le 'namespacing' d'URL est une bonne pratique.
 # Il permet d'éviter les conflits de noms d'URL entre différentes applications.
@@ -18,4 +18,20 @@ urlpatterns = [
     # - 'pk' est le nom de la variable qui sera passée en argument à la vue.
     # Django appellera donc views.detail_velo(request, pk=5)
     path('<int:pk>/', views.detail_velo, name='detail_velo'),
-]
\ No newline at end of file
+
+    # API JSON en lecture seule (voir api.py) : /velos/api/...
+    path('api/velos/', api.velos, name='api_velos'),
+    path('api/velos/<int:pk>/', api.velo, name='api_velo'),
+    path('api/stations/', api.stations, name='api_stations'),
+    path('api/stations/disponibilite/', api.disponibilite, name='api_disponibilite'),
+    path('api/stations/proches/', api.stations_proches, name='api_stations_proches'),
+    path('api/velos/rayon/', api.velos_dans_rayon, name='api_velos_dans_rayon'),
+    path('api/locations/', api.locations, name='api_locations'),
+    path('api/tickets.csv', api.tickets, name='api_tickets'),
+    path('api/analytique/flux/', api.flux_horaires, name='api_flux_horaires'),
+    path('api/analytique/od/', api.matrice_od, name='api_matrice_od'),
+    path('api/flotte/risques/', api.risques_maintenance, name='api_risques_maintenance'),
+
+    # Flux temps réel (Server-Sent Events, à servir en ASGI) : /velos/flux/?ville=...
+    path('flux/', flux.flux_velos, name='flux_velos'),
+]
@@ -0,0 +1,81 @@
+# CODE pour gestion/utilisateurs.py
+#
+# Fabrique d'utilisateurs de test pour seed_data et generate_history. Tous partagent le même mot
+# de passe : il est chiffré une seule fois et le hash est réutilisé (le hasheur par défaut, PBKDF2,
+# coûte plusieurs centaines de millisecondes par appel). Les profils sont tirés de la liste des
+# prénoms et noms français de Faker avec NumPy, par blocs de TAILLE_BLOC utilisateurs ; le numéro
+# de l'utilisateur est ajouté au nom, qui est donc unique sans boucle de nouvel essai.
+#
+# Tous les blocs lisent un même flux de tirages, dérivé de la graine : l'utilisateur i prend les
+# TIRAGES_PAR_UTILISATEUR flottants qui suivent ceux des i - 1 premiers, et un bloc commence par
+# avancer le générateur jusqu'à son premier utilisateur (PCG64.advance, sans calculer les tirages
+# sautés). Le résultat ne dépend que de la graine : ni de la taille des blocs, ni de leur
+# répartition entre ce processus et des workers.
+
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from faker.providers.internet.fr_FR import Provider as FournisseurInternet
+from faker.providers.person.fr_FR import Provider as FournisseurPersonne
+
+from .aleatoire import FLUX_UTILISATEURS, generateur
+from .parallel import decouper_en_shards, executer_shards
+
+MOT_DE_PASSE = 'password123'
+TAILLE_BLOC = 10000
+TIRAGES_PAR_UTILISATEUR = 3  # prénom, nom, domaine : un flottant (un tirage 64 bits) chacun
+
+CHAMPS = ('username', 'email', 'first_name', 'last_name', 'password')
+
+PRENOMS = FournisseurPersonne.first_names
+NOMS = FournisseurPersonne.last_names
+DOMAINES = FournisseurInternet.free_email_domains
+
+
+@lru_cache
+def mot_de_passe_chiffre(mot_de_passe=MOT_DE_PASSE):
+    """
+    Hash du mot de passe commun, calculé une fois par processus. settings.SIMULATION['HASHEUR']
+    permet de choisir un hasheur rapide (présent dans PASSWORD_HASHERS) pour une base de simulation.
+    """
+    return make_password(mot_de_passe, hasher=getattr(settings, 'SIMULATION', {}).get('HASHEUR', 'default'))
+
+
+def _identifiant(texte):
+    sans_accents = unicodedata.normalize('NFKD', texte).encode('ascii', 'ignore').decode()
+    return ''.join(c for c in sans_accents.lower() if c.isalnum())
+
+
+def _bloc(bloc, nombre, seed, premier, mot_de_passe):
+    """Utilisateurs numérotés de bloc * TAILLE_BLOC à la fin du bloc (au plus nombre au total)."""
+    debut, fin = bloc * TAILLE_BLOC, min((bloc + 1) * TAILLE_BLOC, nombre)
+    rng = generateur(seed, FLUX_UTILISATEURS)
+    rng.bit_generator.advance(debut * TIRAGES_PAR_UTILISATEUR)
+    tirages = rng.random((fin - debut, TIRAGES_PAR_UTILISATEUR))
+    prenoms, noms, domaines = (
+        (tirages[:, k] * len(liste)).astype(np.int64).tolist() for k, liste in enumerate((PRENOMS, NOMS, DOMAINES)))
+    lignes = []
+    for numero, p, n, d in zip(range(premier + debut, premier + fin), prenoms, noms, domaines):
+        username = f"{_identifiant(PRENOMS[p])}.{_identifiant(NOMS[n])}{numero}"
+        lignes.append((username, f"{username}@{DOMAINES[d]}", PRENOMS[p], NOMS[n], mot_de_passe))
+    return lignes
+
+
+def _blocs(blocs, nombre, seed, premier, mot_de_passe):
+    return [ligne for bloc in blocs for ligne in _bloc(bloc, nombre, seed, premier, mot_de_passe)]
+
+
+def generer_utilisateurs(nombre, seed, workers=1, premier=1):
+    """
+    Génère les lignes (CHAMPS) de nombre utilisateurs, numérotés à partir de premier, bloc par bloc :
+    le résultat est un itérateur, à passer directement à charger().
+    """
+    blocs = list(range(-(-nombre // TAILLE_BLOC)))
+    workers = min(workers, len(blocs))
+    # Plusieurs blocs par tâche quand il y a des workers, pour amortir l'envoi des résultats.
+    shards = decouper_en_shards(blocs, workers * 4) if workers > 1 else [[bloc] for bloc in blocs]
+    for lignes in executer_shards(_blocs, shards, workers, nombre, seed, premier, mot_de_passe_chiffre()):
+        yield from lignes
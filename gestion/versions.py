@@ -0,0 +1,35 @@
+# CODE pour gestion/versions.py
+#
+# Compteurs de version par table, stockés dans le cache. Les réponses mises en cache incluent la
+# version des tables qu'elles lisent dans leur clé : incrémenter un compteur invalide d'un coup
+# toutes les pages concernées, sans avoir à les énumérer.
+
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _cle(table):
+    return f"version:{table}"
+
+
+def version(table):
+    # Un compteur absent (cache vidé, entrée évincée) repart d'une valeur jamais utilisée,
+    # pour ne pas retomber sur d'anciennes pages encore en cache.
+    return cache.get_or_set(_cle(table), time.time_ns, timeout=None)
+
+
+def incrementer(table):
+    """Invalide toutes les réponses en cache construites à partir de cette table."""
+    try:
+        return cache.incr(_cle(table))
+    except ValueError:
+        return version(table)
+
+
+def incrementer_apres_commit(table):
+    # Incrémenter avant le commit laisserait une requête concurrente remettre en cache, sous la
+    # nouvelle version, des données qui ne contiennent pas encore la modification.
+    transaction.on_commit(partial(incrementer, table))
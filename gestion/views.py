@@ -1,34 +1,51 @@
-from django.shortcuts import render
-
-# Create your views here.
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.template.loader import render_to_string
+
 from .models import Velo
+from .versions import version
 
 # --- Vue 1 : Liste des vélos disponibles ---
-# Cette vue récupère tous les vélos qui ont le statut 'Disponible'
+# Cette vue récupère les vélos qui ont le statut 'Disponible', page par page,
 # et les envoie à un template pour affichage.
 
+TAILLE_PAGE = 50
+DUREE_CACHE = 300  # secondes ; l'invalidation passe par les compteurs de version
+
+
 def liste_velos(request):
     """
-    Affiche la liste de tous les vélos disponibles.
+    Affiche une page de vélos disponibles. La pagination se fait par curseur sur l'id
+    (?apres=<dernier id affiché>) : chaque page est une lecture d'index, quelle que soit sa position.
     """
-    # 1. Logique métier : Interroger la base de données
-    # On utilise le Manager de modèle (.objects) pour filtrer les vélos.
-    # On ne prend que ceux dont le statut est 'DISPO'.
-    velos_disponibles = Velo.objects.filter(statut='DISPO').order_by('marque')
+    try:
+        apres = max(0, int(request.GET.get('apres', 0)))
+    except ValueError:
+        apres = 0
 
-    # 2. Préparer le contexte
-    # Le "contexte" est un dictionnaire qui transmet les données au template.
-    # La clé ('velos') sera le nom de la variable dans le template.
-    context = {
-        'velos': velos_disponibles
-    }
+    # 1. Cache par page : la clé contient la version des tables lues, incrémentée dès qu'un vélo
+    # ou une station change (voir gestion/signals.py). Une page périmée n'est donc jamais servie.
+    cle = f"liste_velos:{version('velo')}:{version('station')}:{apres}"
+    contenu = cache.get(cle)
+    if contenu is None:
+        # 2. Une seule requête : les stations sont jointes (select_related) et seules les colonnes
+        # affichées sont lues (only). On lit une ligne de plus pour savoir s'il existe une page suivante.
+        velos = list(
+            Velo.objects.filter(statut='DISPO', id__gt=apres)
+            .select_related('station_actuelle__ville', 'station_origine')
+            .only('id', 'batterie', 'station_actuelle__nom', 'station_actuelle__ville__nom', 'station_origine__nom')
+            .order_by('id')[:TAILLE_PAGE + 1]
+        )
+        context = {
+            'velos': velos[:TAILLE_PAGE],
+            'page_suivante': velos[TAILLE_PAGE - 1].id if len(velos) > TAILLE_PAGE else None,
+        }
+        contenu = render_to_string('gestion/liste_velos.html', context, request)
+        cache.set(cle, contenu, DUREE_CACHE)
 
     # 3. Renvoyer la réponse
-    # La fonction render() prend la requête, le chemin du template
-    # et le contexte, puis génère la réponse HTTP.
-    # Nous devrons créer le fichier 'gestion/liste_velos.html' juste après.
-    return render(request, 'gestion/liste_velos.html', context)
+    return HttpResponse(contenu)
 
 
 # --- Vue 2 : Détails d'un vélo spécifique ---
@@ -1,19 +1,130 @@
 # CODE pour gestion/weather_service.py
 
+import csv
 import random
 import hashlib
 from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Codes des conditions de la météo simulée, dans l'ordre de METEOS.
+CIEL_DEGAGE, NUAGEUX, PLUIE = 0, 1, 2
+METEOS = (
+    {'condition': 'clair', 'description': 'Ciel dégagé'},
+    {'condition': 'clair', 'description': 'Nuageux'},
+    {'condition': 'pluie', 'description': 'Pluie modérée'},
+)
+
+
+class WeatherProvider:
+    """Interface commune des fournisseurs météo utilisés par la simulation."""
 
-class MockWeatherService:
     def get_weather(self, city_name: str, dt: datetime) -> dict:
-        seed_str = f"{city_name}-{dt.year}-{dt.month}-{dt.day}"
+        raise NotImplementedError
+
+
+class MockWeatherService(WeatherProvider):
+    # La météo ne dépend que de (ville, jour, heure) : la fenêtre de pluie de chaque ville-jour
+    # est calculée une fois puis gardée dans un cache LRU borné.
+    def __init__(self, taille_cache=8192):
+        self._debut_pluie = lru_cache(maxsize=taille_cache)(self._calculer_debut_pluie)
+
+    @staticmethod
+    def _calculer_debut_pluie(city_name: str, year: int, month: int, day: int):
+        """Heure de début des 4 h de pluie de la journée, ou None pour une journée sans pluie."""
+        seed_str = f"{city_name}-{year}-{month}-{day}"
         seed = int(hashlib.md5(seed_str.encode()).hexdigest(), 16)
         rng = random.Random(seed)
         is_rainy_day = rng.random() < 0.20
         if not is_rainy_day:
-            return {'condition': 'clair', 'description': 'Ciel dégagé'}
-        start_rain_hour = rng.randint(6, 18)
+            return None
+        return rng.randint(6, 18)
+
+    def _code(self, city_name: str, dt: datetime) -> int:
+        start_rain_hour = self._debut_pluie(city_name, dt.year, dt.month, dt.day)
+        if start_rain_hour is None:
+            return CIEL_DEGAGE
         if start_rain_hour <= dt.hour < start_rain_hour + 4:
-            return {'condition': 'pluie', 'description': 'Pluie modérée'}
-        else:
-            return {'condition': 'clair', 'description': 'Nuageux'}
\ No newline at end of file
+            return PLUIE
+        return NUAGEUX
+
+    def get_weather(self, city_name: str, dt: datetime) -> dict:
+        return dict(METEOS[self._code(city_name, dt)])
+
+
+def _heure_epoch(dt: datetime) -> int:
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return int(dt.timestamp()) // 3600
+
+
+class RecordedWeatherService(WeatherProvider):
+    """
+    Météo historique lue dans un fichier CSV horaire (colonnes ville, horodatage, condition, description).
+    Le fichier est indexé au chargement : pour chaque ville, un tableau de codes indexé par l'heure,
+    ce qui rend chaque consultation O(1). Les heures absentes du fichier sont demandées au fournisseur
+    de repli (la météo simulée par défaut).
+    """
+    ABSENT = np.iinfo(np.uint16).max
+
+    def __init__(self, chemin, repli=None):
+        self.repli = repli or MockWeatherService()
+        self.meteos = []  # (condition, description) distinctes, indexées par code
+        self.villes = {}  # ville -> (première heure epoch, tableau de codes)
+        self._charger(chemin)
+
+    def _charger(self, chemin):
+        codes_meteo, releves = {}, {}
+        with open(chemin, newline='', encoding='utf-8') as f:
+            for ligne in csv.DictReader(f):
+                meteo = (ligne['condition'], ligne['description'])
+                code = codes_meteo.setdefault(meteo, len(codes_meteo))
+                heure = _heure_epoch(datetime.fromisoformat(ligne['horodatage']))
+                releves.setdefault(ligne['ville'], []).append((heure, code))
+        self.meteos = [{'condition': c, 'description': d} for c, d in codes_meteo]
+
+        for ville, points in releves.items():
+            heures = np.array([h for h, _ in points], dtype=np.int64)
+            premiere = int(heures.min())
+            codes = np.full(int(heures.max()) - premiere + 1, self.ABSENT, dtype=np.uint16)
+            codes[heures - premiere] = [c for _, c in points]
+            self.villes[ville] = (premiere, codes)
+
+    def get_weather(self, city_name: str, dt: datetime) -> dict:
+        releve = self.villes.get(city_name)
+        if releve is not None:
+            premiere, codes = releve
+            i = _heure_epoch(dt) - premiere
+            if 0 <= i < len(codes) and codes[i] != self.ABSENT:
+                return dict(self.meteos[codes[i]])
+        return self.repli.get_weather(city_name, dt)
+
+
+class CachedWeatherService(WeatherProvider):
+    """Cache LRU par (ville, heure) placé devant n'importe quel fournisseur."""
+
+    def __init__(self, fournisseur, taille_cache=65536):
+        self.fournisseur = fournisseur
+        self._meteo_horaire = lru_cache(maxsize=taille_cache)(self._consulter)
+
+    def _consulter(self, city_name, heure):
+        meteo = self.fournisseur.get_weather(city_name, datetime.fromtimestamp(heure * 3600, tz=timezone.get_current_timezone()))
+        return meteo['condition'], meteo['description']
+
+    def get_weather(self, city_name: str, dt: datetime) -> dict:
+        condition, description = self._meteo_horaire(city_name, _heure_epoch(dt))
+        return {'condition': condition, 'description': description}
+
+
+def get_weather_service():
+    """
+    Construit le fournisseur décrit par settings.WEATHER_PROVIDER :
+    {'BACKEND': chemin de la classe, 'OPTIONS': arguments du constructeur, 'CACHE_SIZE': taille du cache}.
+    """
+    config = getattr(settings, 'WEATHER_PROVIDER', {})
+    backend = import_string(config.get('BACKEND', 'gestion.weather_service.MockWeatherService'))
+    return CachedWeatherService(backend(**config.get('OPTIONS', {})), config.get('CACHE_SIZE', 65536))
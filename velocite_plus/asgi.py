@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Le flux temps réel /velos/flux/ (Server-Sent Events) est une vue asynchrone : il doit être servi
+par ce point d'entrée (ex. uvicorn velocite_plus.asgi:application), où chaque client connecté
+n'occupe qu'une coroutine.
 """
 
 import os
@@ -88,6 +88,39 @@ DATABASES = {
 }
 
 
+# Cache des pages (liste des vélos) et des compteurs de version (voir gestion/versions.py).
+# Le cache mémoire est propre à chaque processus : avec plusieurs workers, utiliser un cache
+# partagé, par ex. 'django.core.cache.backends.redis.RedisCache' avec 'LOCATION': 'redis://localhost:6379'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'velocite-plus',
+    }
+}
+
+
+# Flux temps réel /velos/flux/ (voir gestion/diffusion.py). Au premier abonné, le dernier jour de
+# télémétrie écrit par generate_files est rejoué en boucle, ACCELERATION fois plus vite que le temps réel.
+# CANAL : les vélos modifiés par d'autres processus (generate_history --temps-reel, admin) arrivent par
+# LISTEN/NOTIFY de PostgreSQL (gestion/canal.py) ; ignoré avec une autre base.
+DIFFUSION = {
+    'REJEU_TELEMETRIE': True,
+    'ACCELERATION': 60.0,
+    'CANAL': True,
+}
+
+# Commandes de simulation (voir gestion/utilisateurs.py). Le mot de passe commun des utilisateurs de test
+# est chiffré une seule fois ; HASHEUR peut désigner un hasheur plus rapide, à ajouter à PASSWORD_HASHERS.
+# SCENARIO : fichier de scénario utilisé sans --scenario (voir gestion/scenario.py).
+# ITINERAIRES : fichier des itinéraires routiers (calculer_itineraires, generate_files --itineraires) ;
+# BASE_DIR/itineraires.npz si None (voir gestion/itineraires.py).
+SIMULATION = {
+    'HASHEUR': 'default',
+    'SCENARIO': None,
+    'ITINERAIRES': None,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -132,3 +165,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # velocite_plus/settings.py
 
 AUTH_USER_MODEL = 'gestion.Utilisateur'
+
+# Météo utilisée par la simulation (voir gestion.weather_service.get_weather_service).
+# Pour rejouer une météo réelle :
+#   'BACKEND': 'gestion.weather_service.RecordedWeatherService',
+#   'OPTIONS': {'chemin': BASE_DIR / 'meteo' / 'historique_horaire.csv'},
+WEATHER_PROVIDER = {
+    'BACKEND': 'gestion.weather_service.MockWeatherService',
+    'OPTIONS': {},
+    'CACHE_SIZE': 65536,
+}